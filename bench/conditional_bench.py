@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Bytes and JSON parse time saved by conditional GETs of /press/<PRESS_ID>,
+# per controller per day, at the wo_monitor and PressWatcher poll rates.
+#
+#   python3 -m bench.conditional_bench
+
+import sys
+
+from loader_controller import iqapi
+from bench.mockapi import MockIQAPI
+
+
+POLLS = 200
+DAY = 24 * 3600
+
+
+def main():
+    with MockIQAPI() as api:
+        client = iqapi.IQClient(api.url)
+        for i in range(POLLS):
+            client.get_json('/press/136', conditional=True)
+        client.close()
+    stats = client.revalidation_stats()
+    polls = stats['not_modified']
+    per_poll_bytes = stats['bytes_saved'] / float(polls)
+    per_poll_parse = stats['parse_saved'] / float(polls)
+    print("%d of %d polls answered 304" % (polls, POLLS))
+    print("saved per poll: %d body bytes, %.1f us JSON parse\n" %
+          (per_poll_bytes, per_poll_parse * 1e6))
+    for name, interval in [('wo_monitor', 300),
+                           ('PressWatcher', iqapi.press_poll)]:
+        n = DAY // interval
+        print("%-12s %5d polls/day   %8.1f KB/day   %8.1f ms parse/day" %
+              (name, n, n * per_poll_bytes / 1024.0,
+               n * per_poll_parse * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
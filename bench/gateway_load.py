@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Load test for gateway.py.
+# Simulates a plant-wide reboot: CONTROLLERS controllers spread over PRESSES
+# presses all poll /press/<id> at the same moment, ROUNDS times, once
+# directly against the (mock) IQ API and once through the gateway.
+#
+#   python3 -m bench.gateway_load [controllers]
+
+import sys
+import threading
+from time import perf_counter
+
+from loader_controller.iqapi import IQClient
+from loader_controller.gateway import Gateway
+from bench.mockapi import MockIQAPI
+
+
+CONTROLLERS = 300
+PRESSES = 60
+ROUNDS = 3
+UPSTREAM_LATENCY = 0.100  # Seconds per request at the Oracle-backed service.
+
+
+def storm(url, controllers):
+    # Fire one poll from every controller at once and return the latencies.
+    clients = [IQClient(url, pool_size=1) for i in range(controllers)]
+    times = []
+    for r in range(ROUNDS):
+        barrier = threading.Barrier(controllers)
+
+        def poll(i):
+            barrier.wait()
+            t0 = perf_counter()
+            clients[i].get_json('/press/%d' % (100 + i % PRESSES))
+            times.append(perf_counter() - t0)
+
+        threads = [threading.Thread(target=poll, args=(i,))
+                   for i in range(controllers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    for client in clients:
+        client.close()
+    return sorted(times)
+
+
+def report(name, times, upstream):
+    print("%-8s upstream requests %5d   p50 %7.1f ms   p99 %7.1f ms" %
+          (name, upstream, times[len(times) // 2] * 1000,
+           times[int(len(times) * 0.99)] * 1000))
+
+
+def main():
+    controllers = int(sys.argv[1]) if len(sys.argv) > 1 else CONTROLLERS
+    presses = dict(('%d' % (100 + i), {'press_id': '%d' % (100 + i),
+                                       'wo_id': '99%05d' % i})
+                   for i in range(PRESSES))
+    print("%d controllers, %d presses, %d rounds\n" %
+          (controllers, PRESSES, ROUNDS))
+
+    with MockIQAPI(presses=presses, latency=UPSTREAM_LATENCY) as api:
+        times = storm(api.url, controllers)
+        report('direct', times, api.requests)
+
+    with MockIQAPI(presses=presses, latency=UPSTREAM_LATENCY) as api:
+        gateway = Gateway(api.url, host='127.0.0.1', port=0).start()
+        times = storm(gateway.url, controllers)
+        report('gateway', times, api.requests)
+        print("\ngateway stats: " + str(gateway.stats()))
+        gateway.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
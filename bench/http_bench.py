@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Compare a bare requests.get() per call against the pooled IQClient.
+# The mock server sleeps for CONNECT_LATENCY on every new connection to stand
+# in for the TCP handshake over shop Wi-Fi.
+#
+#   python3 -m bench.http_bench
+
+import sys
+from time import perf_counter
+
+import requests
+
+from loader_controller.iqapi import IQClient
+from bench.mockapi import MockIQAPI
+
+
+CONNECT_LATENCY = 0.030  # Seconds per new TCP connection.
+REQUESTS = 20
+
+
+def ms(seconds):
+    return '%7.2f ms' % (seconds * 1000)
+
+
+def run(name, get):
+    times = []
+    for i in range(REQUESTS):
+        t0 = perf_counter()
+        get('/wo/9934386')
+        times.append(perf_counter() - t0)
+    later = sorted(times[1:])
+    print("%-14s first %s   later median %s   later max %s" %
+          (name, ms(times[0]), ms(later[len(later) // 2]), ms(later[-1])))
+
+
+def main():
+    with MockIQAPI(connect_latency=CONNECT_LATENCY) as api:
+        run('requests.get', lambda path: requests.get(api.url + path,
+                                                       timeout=10))
+        bare = api.connections
+
+        client = IQClient(api.url)
+        run('IQClient', client.get_json)
+        client.close()
+        print("\nConnections opened: requests.get=%d  IQClient=%d" %
+              (bare, api.connections - bare))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
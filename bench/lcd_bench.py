@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# I2C transactions and driver time to draw the controller's screens, for
+# the old lcd_ctrl() (clear + set_color + message every time) against
+# display.FrameBufferLCD, on a simulated bus.
+#
+#   python3 -m bench.lcd_bench
+
+import sys
+
+from loader_controller import display
+from bench.simlcd import SimSMBus, AdafruitRGBLCDModel
+
+
+# One scan cycle, as main() draws it.
+SCAN_CYCLE = [
+    ("SCAN\n\nWORKORDER NUMBER", 'white'),
+    ("GETTING\nWORKORDER\nINFORMATION...", 'blue'),
+    ("SCAN\nRAW MATERIAL\nSERIAL NUMBER", 'white'),
+    ("GETTING\nRAW MATERIAL\nSERIAL NUMBER\nINFORMATION...", 'blue'),
+    ("PRESS: 136\nWORKORDER: 9934386\n\nLOADER RUNNING", 'green'),
+    ("NO PALLET DETECTED\n\nRESTARTING", 'red'),
+]
+
+# An operator fumbling the workorder scan.
+RESCANS = [
+    ("SCAN\n\nWORKORDER NUMBER", 'white'),
+    ("GETTING\nWORKORDER\nINFORMATION...", 'blue'),
+    ("INCORRECT\nWORKORDER!", 'red'),
+]
+
+# The running screen after a workorder change.
+RUNNING = [
+    ("PRESS: 136\nWORKORDER: 9934386\n\nLOADER RUNNING", 'green'),
+    ("PRESS: 136\nWORKORDER: 9934390\n\nLOADER RUNNING", 'green'),
+]
+
+SCENARIOS = [('scan cycle', SCAN_CYCLE), ('rescans', RESCANS),
+             ('running', RUNNING)]
+CYCLES = 10
+
+
+def old_lcd_ctrl(lcd, msg, color):
+    lcd.clear()
+    lcd.set_color(*display.colors[color])
+    lcd.message(msg)
+
+
+def run(name, draw, screens):
+    bus = SimSMBus()
+    lcd = AdafruitRGBLCDModel(bus)
+    draw = draw(lcd)
+    for i in range(CYCLES):
+        for msg, color in screens:
+            draw(msg, color)
+    screens = CYCLES * len(screens)
+    print("  %-12s %6.0f transactions/screen   %6.1f ms/screen "
+          "(bus %5.1f + driver delays %5.1f)" %
+          (name, bus.transactions / float(screens),
+           (bus.seconds() + lcd.delay) * 1000 / screens,
+           bus.seconds() * 1000 / screens, lcd.delay * 1000 / screens))
+
+
+def main():
+    for name, screens in SCENARIOS:
+        print(name)
+        run('lcd_ctrl', lambda lcd: lambda msg, color:
+            old_lcd_ctrl(lcd, msg, color), screens)
+        run('framebuffer', lambda lcd: display.FrameBufferLCD(lcd).show,
+            screens)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Characters per second through the Adafruit driver (bit-by-bit MCP23017
+# writes) and lcdmcp.MCPCharLCD (block writes), on a simulated smbus at
+# 100 kHz.  Bus time and driver delays are modelled; the Python time to
+# build the transactions is measured.
+#
+#   python3 -m bench.mcp_lcd_bench
+
+import sys
+from time import perf_counter
+
+from loader_controller import lcdmcp
+from bench.simlcd import SimSMBus, AdafruitRGBLCDModel
+
+
+CHARS = 2000
+TEXT = 'WORKORDER: 9934386  '
+
+
+def run(name, bus, lcd, delay=lambda: 0.0):
+    tx, nbytes, delay0 = bus.transactions, bus.bytes, delay()
+    bus.transactions = bus.bytes = 0
+    t0 = perf_counter()
+    for i in range(CHARS // len(TEXT)):
+        lcd.set_cursor(0, 1)
+        lcd.message(TEXT)
+    cpu = perf_counter() - t0
+    modelled = bus.seconds() + delay() - delay0
+    print("%-10s %5.2f transactions/char   %6.0f chars/s on the bus   "
+          "(%4.1f us/char Python)" %
+          (name, bus.transactions / float(CHARS), CHARS / modelled,
+           cpu * 1e6 / CHARS))
+
+
+def main():
+    bus = SimSMBus()
+    lcd = AdafruitRGBLCDModel(bus)
+    run('adafruit', bus, lcd, lambda: lcd.delay)
+    bus = SimSMBus()
+    run('lcdmcp', bus, lcdmcp.MCPCharLCD(bus=bus))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
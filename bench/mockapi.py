@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Local stand-in for the IQ API web service.
+# Serves the same /press, /wo and /serial JSON as the real service so the
+# controller can be tested and benchmarked off the shop network.
+
+import hashlib
+import json
+import threading
+from email.utils import formatdate
+from time import sleep
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PRESSES = {
+    '136': {'press_id': '136', 'press': '136', 'wo_id': '9934386',
+            'itemno': '5001-100', 'descrip': 'BEZEL, FRONT',
+            'itemno_mat': 'RM-PP-2001', 'descrip_mat': 'POLYPROPYLENE BLK'},
+}
+
+WORKORDERS = {
+    '9934386': {'press': '136', 'rmat': 'RM-PP-2001'},
+    '10284800': {'press': '141', 'rmat': 'RM-ABS-3300'},
+}
+
+SCHEDULES = {
+    '136': [{'wo_id': '9934390', 'rmat': 'RM-PP-2001'},
+            {'wo_id': '9934411', 'rmat': 'RM-PC-4100'}],
+}
+
+SERIALS = {
+    '1000001': {'itemno': 'RM-PP-2001'},
+    '1000002': {'itemno': 'RM-ABS-3300'},
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Allow keep-alive connections.
+    wbufsize = -1  # Send headers and body in one segment.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        api = self.server.api
+        with api.lock:
+            api.connections += 1
+        if api.connect_latency:
+            sleep(api.connect_latency)  # Stand-in for the TCP handshake.
+
+    def do_GET(self):
+        api = self.server.api
+        with api.lock:
+            api.requests += 1
+            api.paths.append(self.path)
+        parts = self.path.strip('/').split('/')
+        if api.events and len(parts) == 3 and parts[0] == 'press' and \
+                parts[2] == 'events':
+            return self.send_events(parts[1])
+        if api.latency:
+            sleep(api.latency)
+        status, data = api.route(self.path)
+        body = json.dumps(data).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if status == 200 and api.etags and \
+                self.headers.get('If-None-Match') == etag:
+            with api.lock:
+                api.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 200 and api.etags:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', api.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data +
+                         b'\r\n')
+        self.wfile.flush()
+
+    def send_events(self, press_id):
+        # Server-sent events: the press status now and after every change,
+        # with a comment line as a keep-alive in between.
+        api = self.server.api
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.close_connection = True
+        version = -1
+        try:
+            while not api.stopping.is_set():
+                with api.changed:
+                    if version == api.version:
+                        api.changed.wait(api.heartbeat)
+                    changed = version != api.version
+                    version = api.version
+                    data = api.presses.get(press_id)
+                if changed and data is not None:
+                    self.send_chunk('data: ' + json.dumps(data) + '\n\n')
+                else:
+                    self.send_chunk(': keep-alive\n\n')
+        except (OSError, ValueError):
+            pass  # Subscriber went away.
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockIQAPI(object):
+
+    def __init__(self, presses=None, workorders=None, serials=None,
+                 schedules=None, latency=0.0, connect_latency=0.0,
+                 validate=True, etags=True, events=True, heartbeat=15,
+                 port=0):
+        self.presses = dict(PRESSES if presses is None else presses)
+        self.workorders = dict(WORKORDERS if workorders is None
+                               else workorders)
+        self.serials = dict(SERIALS if serials is None else serials)
+        self.schedules = dict(SCHEDULES if schedules is None else schedules)
+        self.latency = latency
+        self.validate = validate  # Serve /validate/<press>/<wo>/<serial>.
+        self.etags = etags  # Send ETags and answer If-None-Match with 304.
+        self.last_modified = formatdate(usegmt=True)
+        self.events = events  # Publish /press/<id>/events.
+        self.heartbeat = heartbeat
+        self.changed = threading.Condition()
+        self.version = 0
+        self.stopping = threading.Event()
+        self.not_modified = 0
+        self.connect_latency = connect_latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.paths = []
+        self.server = MockServer(('127.0.0.1', port), Handler)
+        self.server.api = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def route(self, path):
+        # Return (status, data) for a request path.
+        parts = path.strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'press' and parts[2] == 'schedule':
+            return 200, {'workorders': self.schedules.get(parts[1], [])}
+        if len(parts) == 4 and parts[0] == 'validate' and self.validate:
+            return 200, self.verdict(*parts[1:])
+        tables = {'press': self.presses, 'wo': self.workorders,
+                  'serial': self.serials}
+        if len(parts) != 2 or parts[0] not in tables:
+            return 404, {'message': 'Not Found'}
+        row = tables[parts[0]].get(parts[1])
+        if row is None:
+            return 200, {'error': parts[0] + ' not found'}
+        return 200, row
+
+    def set_press(self, press_id, **fields):
+        # Change a press's status and push it to the subscribers.
+        with self.changed:
+            self.presses[press_id] = dict(self.presses.get(press_id, {}),
+                                          **fields)
+            self.last_modified = formatdate(usegmt=True)
+            self.version += 1
+            self.changed.notify_all()
+
+    def verdict(self, press_id, wo_id, serial):
+        wo = self.workorders.get(wo_id)
+        if wo is None:
+            return {'valid': False, 'reason': 'wo'}
+        inv = self.serials.get(serial, {})
+        result = {'valid': False, 'reason': None, 'press': wo['press'],
+                  'rmat': wo['rmat'], 'itemno': inv.get('itemno')}
+        if wo['press'] != press_id:
+            result['reason'] = 'press'
+        elif not inv:
+            result['reason'] = 'serial'
+        elif inv['itemno'] != wo['rmat']:
+            result['reason'] = 'material'
+        else:
+            result['valid'] = True
+        return result
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        with self.changed:
+            self.changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    # Type "<press> <wo_id> [itemno_mat]" to change a press and push the
+    # change to anything subscribed to /press/<press>/events.
+    api = MockIQAPI(port=5000).start()
+    print("Mock IQ API listening on " + api.url)
+    try:
+        for line in iter(input, None):
+            fields = line.split()
+            if len(fields) >= 2:
+                changes = {'wo_id': fields[1]}
+                if len(fields) > 2:
+                    changes['itemno_mat'] = fields[2]
+                api.set_press(fields[0], **changes)
+                print("Published " + str(api.presses[fields[0]]))
+    except (EOFError, KeyboardInterrupt):
+        api.stop()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Simulate N controllers that all start polling at the same second (after a
+# plant-wide power event) and compare the API request rate for the old fixed
+# "c % 300" cadence against polling.PollSchedule.  Every 4th press has a
+# changeover scheduled during the run.
+#
+# The events stream is taken to be down, the worst case.  The PressWatcher
+# is then the only /press poller (it feeds the workorder monitor and the
+# snapshot refresher), and the refresher adds /press/<id>/schedule.  'total'
+# is everything a controller sends now; 'fixed' was everything before.
+# 'adaptive' is the wo_monitor poll a controller falls back to without a
+# PressWatcher, and is not part of the total.
+#
+#   python3 -m bench.poll_simulation [controllers] [hours]
+
+import sys
+from collections import Counter
+
+from loader_controller import controller, iqapi, snapshot
+from loader_controller.polling import PollSchedule
+
+
+def fixed(controllers, duration):
+    counts = Counter()
+    for press in range(controllers):
+        t = 300
+        while t < duration:
+            counts[int(t)] += 1
+            t += 300
+    return counts
+
+
+def adaptive(controllers, duration):
+    counts = Counter()
+    for press in range(controllers):
+        poll = PollSchedule(str(100 + press), controller.wo_monitor_interval,
+                            controller.wo_monitor_min,
+                            controller.wo_monitor_max)
+        changeover = duration / 2 + press * 7 if press % 4 == 0 else None
+        t = poll.first_delay()
+        while t < duration:
+            counts[int(t)] += 1
+            t += poll.next_delay(changeover=changeover, now=t)
+    return counts
+
+
+def watcher(controllers, duration):
+    counts = Counter()
+    for press in range(controllers):
+        poll = iqapi.PressWatcher(None, str(100 + press)).schedule
+        t = poll.first_delay()
+        while t < duration:
+            counts[int(t)] += 1
+            t += poll.jittered(iqapi.press_poll)
+    return counts
+
+
+def refresher(controllers, duration, interval=snapshot.refresh_interval):
+    # Same timing as snapshot.SnapshotRefresher; /schedule is its only
+    # request, the workorder comes from the PressWatcher.
+    counts = Counter()
+    for press in range(controllers):
+        poll = PollSchedule(str(100 + press))
+        t = poll.phase * interval
+        while t < duration:
+            counts[int(t)] += 1
+            t += poll.jittered(interval)
+    return counts
+
+
+def report(name, counts, duration):
+    total = sum(counts.values())
+    per_minute = Counter()
+    for second, n in counts.items():
+        per_minute[second // 60] += n
+    print("%-9s %6d requests   peak %4d req/s   peak %5d req/min   "
+          "mean %6.3f req/s" % (name, total, max(counts.values()),
+                                max(per_minute.values()),
+                                total / float(duration)))
+
+
+def main():
+    controllers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    duration = int(hours * 3600)
+    print("%d controllers, %g hours\n" % (controllers, hours))
+    report('fixed', fixed(controllers, duration), duration)
+    report('adaptive', adaptive(controllers, duration), duration)
+    parts = [('watcher', watcher(controllers, duration)),
+             ('refresher', refresher(controllers, duration))]
+    total = Counter()
+    for name, counts in parts:
+        report(name, counts, duration)
+        total.update(counts)
+    report('total', total, duration)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
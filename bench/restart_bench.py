@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Time from "restart" to the workorder scan prompt for both restart paths,
+# on both controller cores (asyncio, the default, and threads).
+#
+# hard: os.execv() a new interpreter that imports the controller and
+#       requests, reads PRESS_ID and starts the core on simulated hardware,
+#       up to the workorder prompt on the LCD.
+#       The Adafruit/RPi imports and IO.setup() are not available off the Pi,
+#       so on a Pi 3 the real number is higher than this.
+# soft: the core on simulated hardware against the mock API.  A serial
+#       number without its "S" qualifier restarts the cycle: timed from
+#       Restart (asyncio) or restart_program() (threads, through the
+#       SoftRestart unwind and main_loop()) to the next workorder prompt.
+#
+#   python3 -m bench.restart_bench [asyncio|threads]
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from time import perf_counter
+
+from loader_controller import controller, hardware, snapshot
+from loader_controller import station as station_core
+from loader_controller.iqapi import IQClient
+from bench.mockapi import MockIQAPI
+
+RUNS = 10
+PRESS_ID = '136'
+
+CHILD = """
+import os
+import requests
+from loader_controller import controller, hardware
+
+
+def show(msg, color):
+    if msg.startswith('SCAN'):
+        print(msg, flush=True)
+        os._exit(0)
+
+
+controller.DEBUG = False
+PRESS_ID = open(%r).read().strip()
+controller.use_hardware(hardware.SimHardware(scans=[]))
+controller.renderer.show = show
+if %r == 'asyncio':
+    controller.make_station(PRESS_ID).run()
+else:
+    controller.main(PRESS_ID, boot=True)
+"""
+
+
+class TimedHardware(hardware.SimHardware):
+    # Hands each barcode over once its prompt is on the LCD.  The prompt
+    # after the script has run out closes the scanner.
+
+    def __init__(self):
+        hardware.SimHardware.__init__(self, scans=['9934386', 'X1000001'],
+                                      scan_timeout=0)
+        self.prompts = []
+        self.prompted = threading.Semaphore(0)
+
+    def prompt(self):
+        self.prompts.append(perf_counter())
+        self.prompted.release()
+
+    def scan(self, prompt):
+        if not self.prompted.acquire(timeout=5):
+            raise EOFError(prompt)
+        return hardware.SimHardware.scan(self, prompt)
+
+
+def hard_restart(press_id_file, core):
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    t0 = perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c',
+                             CHILD % (press_id_file, core)],
+                            cwd=here, stdout=subprocess.PIPE)
+    proc.stdout.readline()
+    elapsed = perf_counter() - t0
+    proc.wait()
+    return elapsed
+
+
+def soft_restart(core):
+    hw = TimedHardware()
+    controller.use_hardware(hw)
+    restarted = []
+    show = controller.renderer.show
+    restart_program = controller.restart_program
+    restart_init = station_core.Restart.__init__
+
+    def timed_show(msg, color):
+        if msg.startswith('SCAN\n\nWORKORDER'):
+            hw.prompt()
+        elif msg.startswith('SCAN'):
+            hw.prompted.release()
+        show(msg, color)
+
+    def timed_restart():
+        restarted.append(perf_counter())
+        restart_program()
+
+    def timed_init(self, *args, **kwargs):
+        restarted.append(perf_counter())
+        restart_init(self, *args, **kwargs)
+
+    controller.renderer.show = timed_show
+    station = None
+    if core == 'asyncio':
+        station_core.Restart.__init__ = timed_init
+        station = controller.make_station(PRESS_ID)
+    else:
+        controller.restart_program = timed_restart
+
+    def run():
+        try:
+            if station:
+                station.run()  # Until the scanner closes.
+            else:
+                controller.main_loop(PRESS_ID)
+        except EOFError:
+            pass  # The scanner closed.
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    try:
+        thread.start()
+        thread.join(10)
+    finally:
+        controller.restart_program = restart_program
+        station_core.Restart.__init__ = restart_init
+    return hw.prompts[1] - restarted[0]
+
+
+def report(name, times):
+    times = sorted(times)
+    print("%-13s median %9.3f ms   max %9.3f ms" %
+          (name, times[len(times) // 2] * 1000, times[-1] * 1000))
+
+
+def main():
+    cores = sys.argv[1:] or ['asyncio', 'threads']
+    with tempfile.NamedTemporaryFile('w', suffix='PRESS_ID') as f:
+        f.write(PRESS_ID + '\n')
+        f.flush()
+        for core in cores:
+            report(core + ' hard',
+                   [hard_restart(f.name, core) for i in range(RUNS)])
+    controller.DEBUG = False
+    controller.offline = snapshot.Snapshot(':memory:')
+    with MockIQAPI() as api:
+        controller.api = client = IQClient(api.url)
+        for core in cores:
+            report(core + ' soft', [soft_restart(core) for i in range(RUNS)])
+        client.close()
+    controller.renderer.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
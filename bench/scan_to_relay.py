@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# How long the operator waits, from scanning the serial number label to the
+# loader relay energizing.  Drives either controller core with scripted
+# barcodes on simulated hardware against the mock API, at real speed (the
+# sleeps are part of the wait, if any are left), and times every stage from
+# the outside:
+#
+#   asyncio  the station (station.py) that controller.run() starts by default
+#   threads  controller.main(), core = 'threads'
+#
+# Each barcode is handed over when its scan prompt is put on the LCD, as an
+# operator would scan it.
+#
+#   wo_api        workorder scanned -> /wo answered
+#   serial_prompt /wo answered -> serial number prompt
+#   serial_req    serial scanned -> /serial (or /validate) request sent
+#   serial_api    /serial (or /validate) round trip
+#   relay_on      answer -> relay energized (checks + relay_settle)
+#   wait          serial scanned -> relay energized
+#   cycle         workorder scanned -> relay energized
+#   error_wait    serial scanned -> ready for the next workorder scan (bad
+#                 scan; the error stays on the LCD meanwhile)
+#
+# Scenarios: two-call (/wo then /serial), combined (/validate), and
+# wrong-material (the error pause).  Lookups are not cached between runs.
+#
+#   python3 -m bench.scan_to_relay [latency_secs] [runs] [asyncio|threads]
+
+import sys
+import threading
+from time import monotonic
+
+from loader_controller import controller, hardware, snapshot
+from loader_controller.iqapi import IQClient
+from bench.mockapi import MockIQAPI
+
+
+PRESS_ID = '136'
+GOOD = ['9934386', 'S1000001']
+WRONG = ['9934386', 'S1000002']
+
+
+class TimedClient(IQClient):
+    # Records (path, sent, answered) for every request.
+
+    def __init__(self, *args, **kwargs):
+        IQClient.__init__(self, *args, **kwargs)
+        self.calls = []
+
+    def get(self, path, **kwargs):
+        t0 = monotonic()
+        resp = IQClient.get(self, path, **kwargs)
+        self.calls.append((path, t0, monotonic()))
+        return resp
+
+
+class TimedHardware(hardware.SimHardware):
+    # Records when each barcode prompt was shown and each scan handed over.
+    # A scan waits for its prompt; once the script has run out, the next
+    # prompt closes the scanner.
+
+    def __init__(self, scans):
+        hardware.SimHardware.__init__(self, scans=scans, scan_timeout=0)
+        self.prompts = []
+        self.prompted = threading.Semaphore(0)
+        self.scanned = []
+        self.restarted = None  # When main() gave up and unwound.
+
+    def prompt(self):
+        self.prompts.append(monotonic())
+        self.prompted.release()
+
+    def scan(self, prompt):
+        if not self.prompted.acquire(timeout=5):
+            raise EOFError(prompt)
+        barcode = hardware.SimHardware.scan(self, prompt)
+        self.scanned.append(monotonic())
+        return barcode
+
+    def relay_on_at(self):
+        for t, pin, value in self.io.history:
+            if pin == hardware.ssr_pin and value:
+                return t
+
+
+def run_once(client, scans, combined, core):
+    hw = TimedHardware(scans)
+    controller.use_hardware(hw)
+    controller.combined_validation = combined
+    client.cache.clear()
+    client.calls = []
+    done = threading.Event()
+    show = controller.renderer.show
+
+    def timed_show(msg, color):
+        if msg.startswith('SCAN'):
+            hw.prompt()
+        show(msg, color)
+
+    controller.renderer.show = timed_show
+    station = controller.make_station(PRESS_ID) if core == 'asyncio' \
+        else None
+
+    def target():
+        try:
+            if station:
+                station.run(boot=False)  # Until the scanner closes.
+            else:
+                controller.main(PRESS_ID, boot=False)
+        except BaseException:
+            hw.restarted = monotonic()
+        done.set()
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    while not done.wait(0.001) and not hw.relay():
+        pass
+    if hw.relay():
+        if station:
+            station.stop()
+        else:
+            hw.speed = 1000.0  # Nothing left to measure, hurry the restart.
+            hw.remove_pallet()
+    done.wait(10)
+    return hw, client.calls
+
+
+def stages(hw, calls, combined):
+    wo_scan, serial_scan = hw.scanned[0], hw.scanned[-1]
+    relay = hw.relay_on_at()
+    result = {}
+    if relay is None:
+        # The station shows the next workorder prompt; main() unwinds and
+        # shows it on the next main().
+        ready = hw.prompts[2] if len(hw.prompts) > 2 else hw.restarted
+        result['error_wait'] = ready - serial_scan
+        return result
+    path, sent, answered = calls[-1]
+    if not combined:
+        result['wo_api'] = calls[0][2] - wo_scan
+        result['serial_prompt'] = hw.prompts[1] - calls[0][2]
+    result['serial_req'] = sent - serial_scan
+    result['serial_api'] = answered - sent
+    result['relay_on'] = relay - answered
+    result['wait'] = relay - serial_scan
+    result['cycle'] = relay - wo_scan
+    return result
+
+
+def report(name, runs):
+    print(name)
+    for stage in runs[0]:
+        times = sorted(run[stage] for run in runs)
+        print("  %-13s median %8.2f ms   p90 %8.2f ms   max %8.2f ms" %
+              (stage, times[len(times) // 2] * 1000,
+               times[int(len(times) * 0.9)] * 1000, times[-1] * 1000))
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.050
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    cores = sys.argv[3:] or ['asyncio', 'threads']
+    print("API latency %.0f ms per request, %d runs\n" %
+          (latency * 1000, runs))
+    controller.DEBUG = False
+    controller.offline = snapshot.Snapshot(':memory:')
+    with MockIQAPI(latency=latency) as api:
+        controller.api = client = TimedClient(api.url)
+        client.get_json('/press/' + PRESS_ID)  # Open the connection.
+        for core in cores:
+            for name, scans, combined in (('two-call', GOOD, False),
+                                          ('combined', GOOD, True),
+                                          ('wrong-material', WRONG, False)):
+                results = []
+                for i in range(runs):
+                    hw, calls = run_once(client, scans, combined, core)
+                    results.append(stages(hw, calls, combined))
+                report(core + ' ' + name, results)
+        client.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Simulated I2C bus, MCP23017 and HD44780 character LCD, for counting bus
+# transactions and checking what ends up on the screen.
+
+
+class HD44780(object):
+    # The display contents and address counter of a 20x4 HD44780.
+
+    ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+    def __init__(self, columns=20, rows=4):
+        self.columns = columns
+        self.rows = rows
+        self.ddram = {}
+        self.address = 0
+
+    def command(self, value):
+        if value == 0x01:  # Clear
+            self.ddram = {}
+            self.address = 0
+        elif value == 0x02:  # Home
+            self.address = 0
+        elif value & 0x80:  # Set DDRAM address
+            self.address = value & 0x7F
+
+    def data(self, value):
+        self.ddram[self.address] = chr(value)
+        # Two-line DDRAM: 0x00-0x27 then 0x40-0x67.
+        self.address = {0x28: 0x40, 0x68: 0x00}.get(self.address + 1,
+                                                    self.address + 1)
+
+    def screen(self):
+        return [''.join(self.ddram.get(offset + col, ' ')
+                        for col in range(self.columns))
+                for offset in self.ROW_OFFSETS[:self.rows]]
+
+
+class SimMCP23017LCD(object):
+    # An MCP23017 with an HD44780 wired to port A the way loader-controller
+    # wires it (RS=0, EN=1, D4-D7=2-5), fed by SimSMBus writes.
+    # Clocks a nibble in on every falling edge of EN.
+    # Register addresses follow IOCON.BANK, and the address pointer moves
+    # after each byte of a block write the way the chip moves it: on to the
+    # next register, or with IOCON.SEQOP (byte mode) toggling between the A
+    # and B register of a pair (BANK = 0) or staying put (BANK = 1).
+
+    # Register addresses -> names, by IOCON.BANK.
+    REGISTERS = ({0x00: 'IODIRA', 0x01: 'IODIRB', 0x05: 'GPINTENB',
+                  0x0A: 'IOCON', 0x0B: 'IOCON', 0x14: 'OLATA', 0x15: 'OLATB'},
+                 {0x00: 'IODIRA', 0x10: 'IODIRB', 0x05: 'IOCON',
+                  0x15: 'IOCON', 0x0A: 'OLATA', 0x1A: 'OLATB'})
+    BANK = 0x80
+    SEQOP = 0x20
+
+    def __init__(self, columns=20, rows=4):
+        self.lcd = HD44780(columns, rows)
+        self.iocon = 0  # Power on: BANK = 0, sequential.
+        self.port_a = 0
+        self.port_b = 0
+        self.port_b_writes = 0
+        self.nibble = None
+
+    def next_address(self, reg):
+        bank = self.iocon & self.BANK
+        if self.iocon & self.SEQOP:
+            return reg if bank else reg ^ 1
+        return (reg + 1) % (0x20 if bank else 0x16)
+
+    def write_block(self, reg, values):
+        for value in values:
+            self.write(reg, value)
+            reg = self.next_address(reg)
+
+    def write(self, reg, value):
+        name = self.REGISTERS[1 if self.iocon & self.BANK else 0].get(reg)
+        if name == 'IOCON':
+            self.iocon = value
+        elif name == 'OLATB':
+            self.port_b = value
+            self.port_b_writes += 1
+        elif name == 'OLATA':
+            self.write_port_a(value)
+
+    def write_port_a(self, value):
+        falling = self.port_a & 0x02 and not value & 0x02
+        self.port_a = value
+        if not falling:
+            return
+        nibble = (value >> 2) & 0x0F
+        if self.nibble is None:
+            self.nibble = nibble
+            return
+        byte = (self.nibble << 4) | nibble
+        self.nibble = None
+        if value & 0x01:
+            self.lcd.data(byte)
+        else:
+            self.lcd.command(byte)
+
+    def screen(self):
+        return self.lcd.screen()
+
+
+class SimSMBus(object):
+    # Counts transactions like smbus.SMBus would send them.
+    # Each call is one I2C transaction (start ... stop).  Register writes
+    # go to device, if one is attached.
+
+    def __init__(self, device=None):
+        self.device = device
+        self.transactions = 0
+        self.bytes = 0
+        self.registers = {}
+
+    def write_byte_data(self, addr, reg, value):
+        self.transactions += 1
+        self.bytes += 3  # Address, register, data.
+        self.registers[(addr, reg)] = value
+        if self.device:
+            self.device.write(reg, value)
+
+    def write_i2c_block_data(self, addr, reg, values):
+        # The device decides where each value goes.  registers keeps the
+        # last one, as if the register pointer stayed on reg.
+        self.transactions += 1
+        self.bytes += 2 + len(values)
+        self.registers[(addr, reg)] = values[-1]
+        if self.device:
+            self.device.write_block(reg, values)
+
+    def read_byte_data(self, addr, reg):
+        self.transactions += 1
+        self.bytes += 3
+        return self.registers.get((addr, reg), 0)
+
+    def seconds(self, hz=100000):
+        # Bus time: 9 clocks per byte, plus start/stop.
+        return (self.bytes * 9 + self.transactions * 2) / float(hz)
+
+
+class AdafruitRGBLCDModel(object):
+    # Same I2C traffic as Adafruit_CharLCD.Adafruit_RGBCharLCD on an
+    # Adafruit_GPIO.MCP230xx.MCP23017: every gpio.output() or output_pins()
+    # call rewrites both GPIO registers in one transaction, and write8()
+    # sets RS, then for each nibble sets D4-D7 and pulses EN low/high/low.
+    # Also tracks what would be on the screen.
+
+    ADDRESS = 0x20
+    GPIO = 0x12
+
+    def __init__(self, bus, columns=20, rows=4):
+        self.bus = bus
+        self.lcd = HD44780(columns, rows)
+        self.color = None
+        self.delay = 0.0  # Seconds the driver sleeps.
+
+    def _output(self):
+        self.bus.write_i2c_block_data(self.ADDRESS, self.GPIO, [0, 0])
+
+    def write8(self, value, char_mode=False):
+        self.delay += 0.001  # _delay_microseconds(1000) in write8().
+        self._output()  # RS
+        for nibble in range(2):
+            self._output()  # D4-D7
+            for edge in range(3):
+                self._output()  # EN
+        if char_mode:
+            self.lcd.data(value)
+        else:
+            self.lcd.command(value)
+
+    def clear(self):
+        self.write8(0x01)
+        self.delay += 0.003
+
+    def set_cursor(self, col, row):
+        self.write8(0x80 | (col + HD44780.ROW_OFFSETS[row]))
+
+    def message(self, text):
+        line = 0
+        for char in text:
+            if char == '\n':
+                line += 1
+                self.set_cursor(0, line)
+            else:
+                self.write8(ord(char), True)
+
+    def set_color(self, red, green, blue):
+        self._output()
+        self.color = (red, green, blue)
+
+    def screen(self):
+        return self.lcd.screen()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Compare validation round trips against the mock API with injected latency.
+#
+# two-call:  wo_api_request then serial_api_request, one after the other.
+# combined:  one /validate request.
+# fallback:  /validate is a 404, so /wo and /serial go out together.
+#
+#   python3 -m bench.validate_bench [latency_secs]
+
+import sys
+from time import perf_counter
+
+from loader_controller.iqapi import IQClient
+from bench.mockapi import MockIQAPI
+
+
+RUNS = 20
+SCAN = ('136', '9934386', '1000001')
+
+
+def two_call(client):
+    client.lookup('wo', SCAN[1])
+    client.lookup('serial', SCAN[2])
+
+
+def time_path(name, latency, validate, fn):
+    with MockIQAPI(latency=latency, validate=validate) as api:
+        client = IQClient(api.url)
+        fn(client)  # Open the connection first.
+        times = []
+        for i in range(RUNS):
+            client.cache.clear()
+            t0 = perf_counter()
+            fn(client)
+            times.append(perf_counter() - t0)
+        client.close()
+    times.sort()
+    print("%-9s median %7.2f ms   max %7.2f ms" %
+          (name, times[len(times) // 2] * 1000, times[-1] * 1000))
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.050
+    print("API latency %.0f ms per request\n" % (latency * 1000))
+    validate = lambda client: client.validate(*SCAN)
+    time_path('two-call', latency, True, two_call)
+    time_path('combined', latency, True, validate)
+    time_path('fallback', latency, False, validate)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Loader controller package.
+# Importing it, or any module in it, has no hardware, disk or network side
+# effects.  start() sets everything up and runs the controller.
+
+
+def start(backend=None):
+    # backend is 'pi' or 'sim', see controller.hardware_backend.
+    from .controller import start
+    start(backend)
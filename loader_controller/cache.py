@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+
+class TTLCache(object):
+    # Bounded in-memory cache.  Every entry carries its own expiry time and
+    # the least recently used entry is evicted once maxsize is reached.
+    # Entries stored with negative=True (an "invalid" API answer) are counted
+    # separately when they are hit.
+
+    def __init__(self, maxsize=256, clock=monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.data = OrderedDict()  # key -> (expires, negative, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, negative, value = entry
+            if self.clock() >= expires:
+                del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            if negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value, ttl, negative=False):
+        with self.lock:
+            self.data[key] = (self.clock() + ttl, negative, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.data), 'hits': self.hits,
+                    'negative_hits': self.negative_hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,813 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+###############################################################################
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stacey Sharp (github.com/ssharpjr)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from time import perf_counter
+
+from . import display, eventlog as log, hardware, iqapi, metrics, polling, \
+    scheduler, sensor, snapshot, station as station_core, watchdog as wdt
+
+
+# Variables
+# Events are logged to eventlog.log_path (tmpfs) as JSON lines.  DEBUG also
+# echoes them to the console; DEBUG = 2 adds the noisy ones.
+DEBUG = True
+api = iqapi.client  # Shared keep-alive IQ API client (URL is set in iqapi.py)
+sensor_poll = 10  # Backup poll of the pallet sensor, in seconds.
+wo_monitor_interval = 300  # Check the workorder every 5 minutes,
+wo_monitor_min = 60  # down to every minute near a scheduled changeover,
+wo_monitor_max = 300  # and no slower: a changeover is seen within 6 minutes.
+error_hold = 2  # Seconds an error stays up, unless a barcode is scanned.
+network_fail_hold = 5
+# Seconds between the scans checking out and the relay going on.  0 switches
+# it right away; otherwise the pallet sensor is armed and the relay goes on
+# from run_mode()'s scheduler, nothing sleeps.
+relay_settle = 0
+soft_restart_limit = 20  # Soft restarts allowed within soft_restart_window
+soft_restart_window = 60  # seconds before falling back to a full restart.
+
+# Offline validation.  While the API is unreachable, scans are checked
+# against a local snapshot of this press's workorders and recently seen
+# serial numbers, as long as the saved data is newer than offline_max_age.
+# Kept off the code's directory; the SD card only sees WAL checkpoints.
+snapshot_db = '/var/lib/loader_controller/snapshot.db'
+offline_max_age = 8 * 3600  # One shift, in seconds.
+snapshot_refresh = 900  # Seconds between background snapshot refreshes.
+offline = None  # snapshot.Snapshot, opened in start().
+
+press_watcher = None  # Prefetched /press/<PRESS_ID> state, started in run().
+
+# Workorder changes are pushed over /press/<PRESS_ID>/events when the server
+# has it.  While it is down, press_watcher's poll stands in for it; the timed
+# wo_monitor poll only runs without a press_watcher.
+push_updates = True
+subscriber = None  # iqapi.PressSubscriber, started in run().
+running_wo = None  # (wo_id, rmat) while the loader is running.
+wo_changed = threading.Event()
+run_wake = threading.Event()  # Wakes run_mode() early.
+
+# Per-stage timings and restart counts, in memory.  start() rewrites them
+# to metrics.textfile (tmpfs) every metrics.textfile_interval seconds, and
+# serves them on http://127.0.0.1:<metrics_port>/metrics if that is set.
+stats = metrics.Metrics()
+metrics_port = None
+exporter = None  # metrics.TextfileExporter, started in start().
+writer = None  # eventlog.LogWriter, started in start().
+
+# Relay watchdog (watchdog.py).  While the loader runs, the main loop kicks
+# it every watchdog_heartbeat seconds; if it misses them for watchdog_timeout
+# seconds the relay is dropped.  Set watchdog_device = '/dev/watchdog' to
+# have the board reset if the watchdog thread itself hangs.  The wo_monitor
+# request (up to iqapi's connect_timeout + read_timeout) runs on the API pool,
+# never on the thread that kicks it.
+watchdog_timeout = 5
+watchdog_heartbeat = 1
+watchdog_device = None
+watchdog = None  # watchdog.RelayWatchdog, started in start().
+
+# Scan the workorder and serial first, then check both with a single
+# /validate request.  Servers without /validate fall back to /wo + /serial.
+combined_validation = False
+
+validate_errors = {
+    'wo': "INVALID WORKORDER!",
+    'press': "INCORRECT\nWORKORDER!",
+    'serial': "INVALID SERIAL\nNUMBER!",
+    'material': "INCORRECT\nMATERIAL!",
+}
+
+# 'asyncio' runs the station on an event loop (station.py): the scanner,
+# reset button, sensor poll, workorder monitor and API requests are separate
+# tasks, so a stalled request never holds up the LCD, a reset or a restart.
+# 'threads' is the blocking main() loop below.
+core = 'asyncio'
+station = None  # station.Station, started in run().
+
+# Hardware backend.  'pi' drives the real relay, sensor and LCD.  'sim' runs
+# anywhere, with simulated pins and LCD (see hardware.py).  'daemon' talks to
+# the hardware daemon (hwdaemon.py), which keeps the relay and LCD as they
+# are while this process restarts.  The LOADER_HARDWARE environment variable
+# overrides it.
+hardware_backend = 'pi'
+
+# Event device of the USB barcode scanner, e.g.
+# '/dev/input/by-id/usb-<scanner>-event-kbd'.  It is read directly in the
+# background and scans are queued (scanner.py); None reads the tty.
+scanner_device = None
+
+# 'mcp' drives the LCD with whole-port block writes (lcdmcp.py).  'adafruit'
+# uses the Adafruit_CharLCD driver, one I2C transaction per pin change.
+lcd_driver = 'mcp'
+
+rst_btn = hardware.rst_btn  # INPUT - Manually restart the program.
+ir_pin = hardware.ir_pin  # INPUT - Reads the IR sensor state.
+ssr_pin = hardware.ssr_pin  # OUTPUT - Turns on the Solid State Relay.
+lcd_columns = hardware.lcd_columns
+lcd_rows = hardware.lcd_rows
+
+# Set by use_hardware(), from start().
+hw = None
+IO = None
+lcd = None
+screen = None
+renderer = None
+
+
+def use_hardware(backend):
+    # Point the controller at a hardware.PiHardware or SimHardware.
+    global hw, IO, lcd, screen, renderer
+    if renderer:
+        renderer.stop()
+    hw = backend
+    IO = hw.io  # RPi.GPIO or hardware.SimGPIO.
+    lcd = hw.lcd
+    # Only the characters that changed are sent to the LCD, and they are sent
+    # from the renderer's thread, so drawing never holds up a scan or API
+    # call.
+    # The hardware daemon's backend brings its own screen (hwdaemon.py).
+    screen = getattr(hw, 'screen', None) or \
+        display.FrameBufferLCD(lcd, lcd_columns, lcd_rows)
+    renderer = display.LCDRenderer(screen)
+    if getattr(hw, 'scanner', None):
+        hw.scanner.stats = stats  # Typing and queueing times (scanner.py).
+
+
+def lcd_ctrl(msg, color):
+    # Replace the whole screen with msg.  Colors are listed in display.py.
+    # Returns right away; the renderer draws the newest screen it was given.
+    renderer.show(msg, color)
+
+
+def lcd_hold(msg, color, secs):
+    # Show msg for secs without waiting.  The screens after it are drawn
+    # when the time is up, or as soon as the next barcode is scanned.
+    renderer.hold(msg, color, secs / hw.speed)
+
+
+def get_press_id():
+    # Get PRESS_ID from /boot/PRESS_ID file
+    # Close the program if no PRESS_ID is found
+    press_id_file = "/boot/PRESS_ID"
+    try:
+        with open(press_id_file) as f:
+            PRESS_ID = f.read().replace('\n', '')
+            if len(PRESS_ID) >= 3:
+                return PRESS_ID
+            else:
+                raise ValueError("PRESS_ID is Not Assigned!\nExiting")
+                sys.exit()
+    except IOError:
+        log.error('press_id_missing', path=press_id_file)
+        sys.exit()
+    except BaseException as e:
+        log.error('press_id_invalid', error=str(e))
+        sys.exit()
+
+
+def network_fail():
+    log.warning('network_fail')
+    if lcd:
+        lcd_hold("NETWORK FAILURE\nIf this persists\ncontact TPI IT Dept.\n \
+             Restarting...", 'red', network_fail_hold)
+    run_or_exit_program('run')
+
+
+def offline_notice():
+    log.warning('offline_mode')
+    if lcd:
+        lcd_ctrl("NETWORK DOWN\n\nUSING SAVED\nINFORMATION...", 'blue')
+
+
+def get_wo_scan():
+    if lcd:
+        lcd_ctrl("SCAN\n\nWORKORDER NUMBER", 'white')
+    # wo_scan = '9934386'  # Should be 9934386 for test.
+    wo_scan = hw.scan("Scan Workorder: ")
+    renderer.release()  # Cut an error screen short.
+    # wo_scan = sys.stdin.readline().rstrip()
+    return wo_scan
+
+
+def wo_api_request(wo_id):
+    # Notify user of potential pause.  The screen is drawn while the request
+    # is in flight.
+    if lcd:
+        lcd_ctrl("GETTING\nWORKORDER\nINFORMATION...", 'blue')
+
+    try:
+        data = api.lookup('wo', wo_id)
+    except Exception:
+        row = offline.wo(wo_id, offline_max_age)
+        if row is None:
+            raise  # Nothing saved for this workorder.
+        offline_notice()
+        return row
+
+    try:
+        if data.get('error'):
+            if lcd:
+                lcd_hold("INVALID WORKORDER!", 'red', error_hold)
+            log.event('wo_invalid', wo=wo_id)
+            run_or_exit_program('run')
+    except Exception:
+        pass
+    try:
+        press_from_api_wo = data['press']
+        rmat_from_api_wo = data['rmat']
+        offline.save_wo(wo_id, press_from_api_wo, rmat_from_api_wo)
+        return press_from_api_wo, rmat_from_api_wo
+    except:
+        pass
+
+
+def serial_api_request(sn):
+    # Notify user of the potential pause
+    if lcd:
+        lcd_ctrl("GETTING\nRAW MATERIAL\nSERIAL NUMBER\nINFORMATION...",
+                 'blue')
+
+    try:
+        data = api.lookup('serial', sn)
+    except Exception:
+        rmat_from_api = offline.serial(sn, offline_max_age)
+        if rmat_from_api is None:
+            network_fail()
+        offline_notice()
+        return rmat_from_api
+
+    try:
+        if data.get('error'):
+            if lcd:
+                lcd_hold("INVALID SERIAL\nNUMBER!", 'red', error_hold)
+            log.event('serial_invalid', serial=sn)
+            run_or_exit_program('run')
+    except Exception:
+        pass
+    try:
+        rmat_from_api = data['itemno']
+        offline.save_serial(sn, rmat_from_api)
+    except:
+        pass
+    return rmat_from_api
+
+
+def offline_verdict(PRESS_ID, wo_id, sn):
+    # Build a verdict from the offline snapshot, or None if it is missing.
+    wo = offline.wo(wo_id, offline_max_age)
+    itemno = offline.serial(sn, offline_max_age)
+    if wo is None or itemno is None:
+        return None
+    return iqapi.verdict(PRESS_ID, {'press': wo[0], 'rmat': wo[1]},
+                         {'itemno': itemno})
+
+
+def validate_request(PRESS_ID, wo_id, sn):
+    # Check the workorder and serial number with one API call.
+    # Returns the raw material item number if they are good, restarts with
+    # the error shown if not.
+    if lcd:
+        lcd_ctrl("CHECKING\nWORKORDER AND\nRAW MATERIAL...", 'blue')
+
+    try:
+        result = api.validate(PRESS_ID, wo_id, sn)
+    except Exception:
+        result = offline_verdict(PRESS_ID, wo_id, sn)
+        if result is None:
+            network_fail()
+        offline_notice()
+
+    if result['valid']:
+        offline.save_wo(wo_id, result['press'], result['rmat'])
+        offline.save_serial(sn, result['itemno'])
+        return result['rmat']
+    if lcd:
+        lcd_hold(validate_errors.get(result['reason'], "INVALID SCAN!"),
+                 'red', error_hold)
+    log.event('validation_failed', wo=wo_id, serial=sn,
+              reason=result['reason'])
+    run_or_exit_program('run')
+
+
+def get_rmat_scan():
+    # Get the Raw Material Serial Number.
+    # Check for the "S" qualifier.
+    # Strip the qualifier is present and return the serial number.
+    if lcd:
+        lcd_ctrl("SCAN\nRAW MATERIAL\nSERIAL NUMBER", 'white')
+    rmat_scan = str(hw.scan("Scan Raw Material Serial Number: "))
+    renderer.release()
+    if not rmat_scan.startswith('S'):
+        if lcd:
+            lcd_hold("NOT A VALID\nSERIAL NUMBER!", 'red', error_hold)
+        log.event('serial_unqualified', barcode=rmat_scan)
+        run_or_exit_program('run')
+    rmat_scan = rmat_scan[1:]  # Strip off the "S" Qualifier.
+    return rmat_scan
+
+
+def fetch_press(PRESS_ID):
+    # The wo_monitor request.  run_mode() runs it on the API pool.
+    with stats.time('wo_monitor'):
+        return api.get_json('/press/' + PRESS_ID, conditional=True)
+
+
+def wo_monitor(PRESS_ID, wo_id_from_wo, data=None):
+    # Check if the workorder number changes (RT workorder unloaded).
+    log.debug('wo_monitor', wo=wo_id_from_wo)
+    if data is None:
+        data = fetch_press(PRESS_ID)
+
+#    if data['error']:
+#        lcd_ctrl("WORKORDER CHANGED!\n\nRESTARTING", 'red')
+#        if DEBUG:
+#            print("Workorder changed! (data = error)")
+#        sleep(2)  # Pause so the user can read the error.
+#        run_or_exit_program('run')
+#
+    try:
+        press_id_from_api = data['press_id']
+        wo_id_from_api = data['wo_id']
+        itemno_from_api = data['itemno']
+        descrip_from_api = data['descrip']
+        itemno_mat_from_api = data['itemno_mat']
+        descrip_mat_from_api = data['descrip_mat']
+    except:
+        log.warning('press_data_incomplete', data=data)
+        wo_id_from_api = data.get('wo_id')
+
+    if wo_id_from_wo != wo_id_from_api:
+        log.event('wo_changed', wo=wo_id_from_wo, running=wo_id_from_api)
+        run_or_exit_program('run')
+    else:
+        log.debug('wo_unchanged', wo=wo_id_from_wo)
+    return data
+
+
+def press_update(data):
+    # Called from the subscriber thread for every pushed press status, and
+    # from press_watcher's thread for every polled one.  Drop the relay
+    # right away if the running order or its material changed.
+    if station:
+        station.push(data)
+        return
+    if press_watcher:
+        press_watcher.update(data)
+    running = running_wo
+    if running is None:
+        return
+    if data.get('wo_id') != running[0] or \
+            (running[1] and data.get('itemno_mat') != running[1]):
+        relay_off()
+        wo_changed.set()
+        run_wake.set()
+
+
+def controller_stalled():
+    # The watchdog dropped the relay while this thread was stuck.
+    log.event('stalled', wo=running_wo and running_wo[0])
+    if lcd:
+        lcd_hold("CONTROLLER STALLED\n\nRESTARTING", 'red', error_hold)
+    run_or_exit_program('run')
+
+
+def workorder_changed():
+    log.event('wo_changed', wo=running_wo and running_wo[0], pushed=True)
+    if lcd:
+        lcd_hold("WORKORDER CHANGED!\n\nRESTARTING", 'red', error_hold)
+    run_or_exit_program('run')
+
+
+def pallet_removed():
+    # Show the error and restart once the loader has been stopped.
+    log.event('pallet_removed')
+    if lcd:
+        lcd_hold("NO PALLET DETECTED\n\nRESTARTING", 'red', error_hold)
+    run_or_exit_program('run')
+
+
+def sensor_startup_check():
+    # Check the pallet sensor on startup.
+    # Keep checking until it is present.
+    log.debug('sensor_check')
+    waited = False
+    while IO.input(ir_pin) == 1:
+        # if IO.input(ir_pin) == 1:
+        log.debug('no_pallet')
+        if lcd:
+            lcd_ctrl("NO PALLET DETECTED!\n\nCHECKING AGAIN\nIN 10 SECS",
+                     'red')
+        waited = True
+        hw.sleep(10)
+    if lcd and waited:
+        lcd_hold("PALLET DETECTED\n\nCONTINUING", 'white', 2)
+
+
+def start_loader():
+    IO.output(ssr_pin, 1)  # Turn on the Solid State Relay.
+
+
+def relay_off():
+    # Drop the relay right away.  Called from the pallet sensor interrupt.
+    IO.output(ssr_pin, 0)
+
+
+def stop_loader():
+    IO.output(ssr_pin, 0)  # Turn off the Solid State Relay.
+    log.event('relay_off')
+
+
+class SoftRestart(BaseException):
+    # Raised to unwind back to the top of main().
+    # The GPIO setup, LCD, HTTP pool and PRESS_ID are kept, so getting back to
+    # the scan prompt does not cost a new interpreter.  Derived from
+    # BaseException so "except Exception" handlers let it through.
+    pass
+
+
+def restart_program():
+    log.event('restart')
+    IO.output(ssr_pin, 0)  # Never leave the loader running across a restart.
+    raise SoftRestart()
+
+
+def hard_restart():
+    # Last resort: replace the process and initialize everything again.
+    log.warning('hard_restart')
+    stats.inc('hard_restarts')
+    if watchdog:
+        watchdog.stop()  # The new process opens the device again.
+    if exporter:
+        exporter.stop()  # Keep the counts past exec().
+    if writer:
+        writer.stop()
+    renderer.flush(1)
+    hw.cleanup()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def reboot_system():
+    if lcd:
+        renderer.release()
+        lcd_ctrl("REBOOTING SYSTEM\n\nSTANDBY...", 'blue')
+        renderer.flush(1)
+    hw.cleanup()
+    os.system('sudo reboot')
+
+
+def run_or_exit_program(status):
+    if status == 'run':
+        restart_program()
+    elif status == 'exit':
+        log.event('exit')
+        if watchdog:
+            watchdog.stop()
+        if exporter:
+            exporter.stop()
+        renderer.release()
+        lcd_ctrl('', 'off')  # Blank the screen and turn off backlight
+        renderer.flush(1)
+        hw.cleanup()
+        if writer:
+            writer.stop()
+        sys.exit()
+
+
+# Interrupt Callback function
+# def beam_cb(channel):
+#     if DEBUG:
+#         print("beam_cb() callback called")
+#     sleep(0.1)
+#     stop_loader()
+#     check_outlet_beam()
+
+
+# def rst_btn_cb(channel):
+#     if DEBUG:
+#         print("rst_btn_cb() callback called")
+#     sleep(0.1)
+#     stop_loader()
+#     lcd_ctrl("RESETTING\nLOADER\nCONTROLLER", 'white')
+#     sleep(1)
+#     restart_program()
+
+
+def stop_now():
+    # Pallet sensor interrupt: drop the relay, then wake run_mode().
+    relay_off()
+    run_wake.set()
+
+
+def run_mode(PRESS_ID, wo_id_from_wo, rmat=None):
+    # Wait for the pallet sensor interrupt or a pushed workorder change.
+    # Both drop the relay themselves, within milliseconds, and wake this
+    # thread.  Otherwise it sleeps until the scheduler's next task: the
+    # slow sensor poll (a backup for a missed edge) or, without a
+    # press_watcher to poll for it, the API poll (on a per-press jittered,
+    # adaptive schedule, skipped while the events stream is up).  The
+    # poll's request runs on the API pool and wakes this thread
+    # when it is answered, so a slow API never holds up the watchdog
+    # heartbeat.  The relay goes on relay_settle seconds in, once the sensor
+    # is armed.
+    global running_wo
+    log.debug('run_mode', wo=wo_id_from_wo)
+    wo_changed.clear()
+    run_wake.clear()
+    pallet = sensor.PalletSensor(IO, ir_pin, on_removed=stop_now)
+    running_wo = (wo_id_from_wo, rmat)
+    pallet.start()
+    ready = perf_counter()
+    poll = polling.PollSchedule(PRESS_ID, wo_monitor_interval,
+                                wo_monitor_min, wo_monitor_max)
+
+    def energize():
+        tasks.cancel('relay_on')  # Once.
+        if pallet.removed.is_set() or wo_changed.is_set():
+            return
+        start_loader()  # Looks good, turn on the loader.
+        latency = perf_counter() - ready
+        stats.observe('relay_on', latency)
+        log.event('relay_on', wo=wo_id_from_wo, rmat=rmat, latency=latency)
+        if watchdog:
+            watchdog.arm(stop_now)
+
+    def check_pallet():
+        if pallet.removed.is_set() or pallet.check():
+            pallet_removed()
+
+    monitor = []  # The wo_monitor request in flight.
+
+    def check_wo():
+        if monitor or (subscriber and subscriber.connected):
+            return poll.next_delay()
+        request = api.submit(fetch_press, PRESS_ID)
+        request.add_done_callback(lambda request: run_wake.set())
+        monitor.append(request)
+        return wo_monitor_max  # Until monitor_answered() reschedules it.
+
+    def monitor_answered():
+        data = wo_monitor(PRESS_ID, wo_id_from_wo, monitor.pop().result())
+        # Epoch time of the next scheduled changeover, if the API sends one.
+        changeover = data.get('next_changeover')
+        tasks.add('wo_monitor', check_wo, wo_monitor_interval,
+                  delay=poll.next_delay(changeover=changeover))
+
+    tasks = scheduler.Scheduler(clock=hw.clock, wait=hw.wait)
+    if watchdog:
+        tasks.add('heartbeat', watchdog.kick, watchdog_heartbeat)
+    if relay_settle:
+        tasks.add('relay_on', energize, relay_settle)
+    else:
+        energize()
+    tasks.add('sensor', check_pallet, sensor_poll)
+    if not press_watcher:  # Otherwise its polls go through press_update().
+        tasks.add('wo_monitor', check_wo, wo_monitor_interval,
+                  delay=poll.first_delay())
+    try:
+        while True:
+            if tasks.step(run_wake):
+                run_wake.clear()
+                check_pallet()
+                if wo_changed.is_set():
+                    workorder_changed()
+                if monitor and monitor[0].done():
+                    monitor_answered()
+            if watchdog and watchdog.tripped:
+                controller_stalled()
+    finally:
+        if watchdog:
+            watchdog.disarm()
+        running_wo = None
+        pallet.stop()
+
+
+###############################################################################
+# Interrupts
+# If the reset button is pressed, restart the program
+# IO.add_event_detect(rst_btn, IO.RISING, callback=rst_btn_cb, bouncetime=300)
+###############################################################################
+
+
+###############################################################################
+# Main
+###############################################################################
+
+def loader_running(PRESS_ID, wo_id_from_wo, rmat=None):
+    if lcd:
+        lcd_msg = "PRESS: " + PRESS_ID + "\nWORKORDER: " + wo_id_from_wo +\
+                  "\n\nLOADER RUNNING"
+        lcd_ctrl(lcd_msg, 'green')
+    run_mode(PRESS_ID, wo_id_from_wo, rmat)   # Start the monitors
+
+
+def main(PRESS_ID, boot=True):
+    if boot:
+        log.event('boot', press=PRESS_ID)
+        if lcd:
+            lcd_msg = "LOADER CONTROLLER\n\n\nPRESS " + PRESS_ID
+            lcd_hold(lcd_msg, 'white', 2)
+
+    # Check if the Pallet Sensor is open (a Pallet is present).
+    with stats.time('sensor_check'):
+        sensor_startup_check()
+
+    # Request the Workorder Number (ID) Barcode.
+    with stats.time('wo_scan') as timer:
+        wo_id_from_wo = get_wo_scan()
+    log.event('wo_scanned', wo=wo_id_from_wo, latency=timer.elapsed)
+
+    if combined_validation:
+        with stats.time('serial_scan') as timer:
+            serial_from_label = get_rmat_scan()
+        log.event('serial_scanned', serial=serial_from_label,
+                  latency=timer.elapsed)
+        with stats.time('validate_api') as timer:
+            rmat = validate_request(PRESS_ID, wo_id_from_wo,
+                                    serial_from_label)
+        log.event('validate_api', wo=wo_id_from_wo,
+                  serial=serial_from_label, rmat=rmat, latency=timer.elapsed)
+        loader_running(PRESS_ID, wo_id_from_wo, rmat)
+        return
+
+    # Request Press Number and Raw Material Item Number from the API.
+    # No need to ask if it is the order the press is running right now.
+    running = press_watcher.current() if press_watcher else None
+    if running and running['wo_id'] == wo_id_from_wo:
+        press_from_api_wo = PRESS_ID
+        rmat_from_api_wo = running['itemno_mat']
+        log.event('wo_api', wo=wo_id_from_wo, press=press_from_api_wo,
+                  rmat=rmat_from_api_wo, prefetched=True)
+    else:
+        try:
+            with stats.time('wo_api') as timer:
+                press_from_api_wo, rmat_from_api_wo = \
+                    wo_api_request(wo_id_from_wo)
+        except Exception:
+            network_fail()
+        log.event('wo_api', wo=wo_id_from_wo, press=press_from_api_wo,
+                  rmat=rmat_from_api_wo, latency=timer.elapsed)
+
+    # Verify the Press Number.
+    if press_from_api_wo != PRESS_ID:
+        if lcd:
+            lcd_hold("INCORRECT\nWORKORDER!", 'red', error_hold)
+        log.event('wo_wrong_press', wo=wo_id_from_wo,
+                  wo_press=press_from_api_wo)
+        run_or_exit_program('run')
+
+    # Scan the Raw Material Serial Number Barcode.
+    with stats.time('serial_scan') as timer:
+        serial_from_label = get_rmat_scan()
+    log.event('serial_scanned', serial=serial_from_label,
+              latency=timer.elapsed)
+
+    # Request Raw Material Item Number from the API.
+    with stats.time('serial_api') as timer:
+        rmat_from_api_inv = serial_api_request(serial_from_label)
+    log.event('serial_api', serial=serial_from_label, rmat=rmat_from_api_inv,
+              latency=timer.elapsed)
+
+    # Verify the Raw Material Item Number.
+    if rmat_from_api_wo == rmat_from_api_inv:
+        loader_running(PRESS_ID, wo_id_from_wo, rmat_from_api_wo)
+    else:
+        log.event('material_mismatch', wo=wo_id_from_wo,
+                  serial=serial_from_label, rmat=rmat_from_api_inv,
+                  expected=rmat_from_api_wo)
+        if lcd:
+            lcd_hold("INCORRECT\nMATERIAL!", 'red', error_hold)
+        run_or_exit_program('run')
+
+
+def main_loop(PRESS_ID):
+    # main() over and over.  Restarts unwind to here.
+    boot = True
+    restarts = deque(maxlen=soft_restart_limit)
+    while True:
+        try:
+            main(PRESS_ID, boot)
+        except SoftRestart:
+            stats.inc('restarts')
+            boot = False
+            restarts.append(hw.clock())
+            if len(restarts) == soft_restart_limit and \
+                    restarts[-1] - restarts[0] < soft_restart_window:
+                hard_restart()  # Something is stuck, start clean.
+
+
+def make_station(PRESS_ID):
+    # A station.Station with this module's settings.
+    new = station_core.Station(
+        hw, api, PRESS_ID, renderer, offline=offline, stats=stats,
+        press_watcher=press_watcher, combined=combined_validation,
+        validate_errors=validate_errors, sensor_poll=sensor_poll,
+        wo_monitor=(wo_monitor_interval, wo_monitor_min, wo_monitor_max),
+        offline_max_age=offline_max_age, error_hold=error_hold,
+        network_fail_hold=network_fail_hold, relay_settle=relay_settle,
+        watchdog=watchdog, heartbeat=watchdog_heartbeat,
+        restart_limit=soft_restart_limit, restart_window=soft_restart_window)
+    new.subscriber = subscriber
+    return new
+
+
+def run_station(PRESS_ID):
+    global station
+    station = make_station(PRESS_ID)
+    try:
+        station.run()  # Returns when the scanner is closed or it is stuck.
+    except KeyboardInterrupt:
+        pass
+    except BaseException as e:
+        log.error('crashed', error=repr(e))
+    if station.stuck:
+        hard_restart()  # Start clean, as main_loop() does.
+    run_or_exit_program('exit')
+
+
+def run():
+    global press_watcher, subscriber
+    # Get the PRESS_ID before doing anything else
+    with stats.time('press_id'):
+        PRESS_ID = get_press_id()
+    stats.labels['press'] = PRESS_ID
+    log.context['press'] = PRESS_ID
+    if push_updates:
+        subscriber = iqapi.PressSubscriber(api.base_url, PRESS_ID,
+                                           press_update).start()
+    # The one /press poller: its answers go through press_update() like
+    # pushes, so it is the workorder monitor too.
+    press_watcher = iqapi.PressWatcher(api, PRESS_ID, subscriber=subscriber,
+                                       on_update=press_update).start()
+    snapshot.SnapshotRefresher(offline, api, PRESS_ID,
+                               interval=snapshot_refresh,
+                               press_watcher=press_watcher).start()
+    if core == 'asyncio':
+        run_station(PRESS_ID)
+    try:
+        main_loop(PRESS_ID)
+    except KeyboardInterrupt:
+        run_or_exit_program('exit')
+    except BaseException as e:
+        log.error('crashed', error=repr(e))
+        run_or_exit_program('exit')
+
+
+def start(backend=None):
+    # Entry point.  Nothing touches the hardware, the disk or the network
+    # until this is called.
+    global offline, exporter, writer, watchdog
+    backend = backend or os.environ.get('LOADER_HARDWARE', hardware_backend)
+    level = logging.DEBUG if DEBUG == 2 else logging.INFO
+    writer = log.LogWriter(echo=sys.stderr if DEBUG else None,
+                           echo_level=level).start(level)
+    if backend == 'sim':
+        use_hardware(hardware.SimHardware())
+    elif backend == 'daemon':
+        from . import hwdaemon
+        use_hardware(hwdaemon.RemoteHardware(scanner=scanner_device,
+                                             lease=watchdog_timeout))
+    else:
+        use_hardware(hardware.PiHardware(lcd_driver, lcd_columns, lcd_rows,
+                                         scanner_device))
+    os.makedirs(os.path.dirname(snapshot_db), exist_ok=True)
+    offline = snapshot.Snapshot(snapshot_db)
+    device = wdt.DeviceWatchdog(watchdog_device) if watchdog_device else None
+    watchdog = wdt.RelayWatchdog(watchdog_timeout, clock=hw.clock,
+                                 wait=hw.wait, device=device,
+                                 renew=getattr(hw, 'renew', None)).start()
+    exporter = metrics.TextfileExporter(stats).start()
+    if metrics_port:
+        metrics.serve(stats, metrics_port)
+    try:
+        run()
+    finally:
+        writer.stop()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+import threading
+from time import monotonic
+
+
+# Colors are Red, Green, Blue values.
+# all zeros equals off, all ones equals white
+colors = {
+    'red': (1.0, 0.0, 0.0),
+    'green': (0.0, 1.0, 0.0),
+    'blue': (0.0, 0.0, 1.0),
+    'white': (1.0, 1.0, 1.0),
+    'off': (0.0, 0.0, 0.0)
+    }
+
+
+# lcd.clear() takes about as long as 4 character writes.
+clear_cost = 4
+
+
+class FrameBufferLCD(object):
+    # Draws whole screens on a character LCD, but only sends the cells that
+    # changed since the last screen.
+    # Keeps a shadow copy of the display and the backlight color.  Every
+    # character costs several I2C writes through the MCP23017, so skipping
+    # unchanged cells makes updates faster, and not clearing the screen
+    # first stops the flicker.  A clear is only used when the new screen
+    # shares so little with the old one that it is cheaper.
+    # lcd is an Adafruit_RGBCharLCD or anything with clear(), set_cursor(),
+    # message() and set_color().
+
+    def __init__(self, lcd, columns=20, rows=4):
+        self.lcd = lcd
+        self.columns = columns
+        self.rows = rows
+        self.shadow = None  # Unknown until the first clear().
+        self.color = None
+        self.cursor = None  # (col, row) the LCD will write to next.
+
+    def frame(self, msg):
+        # Lay msg out as rows x columns, like lcd.message() would show it.
+        # Anything past the last column is not visible, so it is dropped.
+        lines = msg.split('\n')[:self.rows]
+        lines += [''] * (self.rows - len(lines))
+        return [line[:self.columns].ljust(self.columns) for line in lines]
+
+    def clear(self):
+        self.lcd.clear()
+        self.shadow = self.blank()
+        self.cursor = (0, 0)
+
+    def set_color(self, color):
+        if color != self.color:
+            self.lcd.set_color(*colors.get(color, colors['off']))
+            self.color = color
+
+    def show(self, msg, color):
+        self.set_color(color)
+        new = self.frame(msg)
+        if self.shadow is None or \
+                self.cost(self.blank(), new, (0, 0)) + clear_cost < \
+                self.cost(self.shadow, new, self.cursor):
+            # Mostly a different screen: clearing is cheaper than blanking
+            # the old text with spaces.
+            self.clear()
+        for col, row, text in self.runs(self.shadow, new):
+            if self.cursor != (col, row):
+                self.lcd.set_cursor(col, row)
+            self.lcd.message(text)
+            end = col + len(text)
+            # Past the last column the LCD goes on to another row.
+            self.cursor = (end, row) if end < self.columns else None
+        self.shadow = new
+
+    def blank(self):
+        return [' ' * self.columns] * self.rows
+
+    def runs(self, old, new):
+        # Yield (col, row, text) for every run of changed cells.
+        for row in range(self.rows):
+            for col, text in self.changes(old[row], new[row]):
+                yield col, row, text
+
+    def cost(self, old, new, cursor):
+        # LCD writes (characters plus cursor moves) to go from old to new.
+        writes = 0
+        for col, row, text in self.runs(old, new):
+            if cursor != (col, row):
+                writes += 1
+            writes += len(text)
+            cursor = (col + len(text), row)
+        return writes
+
+    def changes(self, old, new):
+        # Yield (col, text) runs of changed cells.  Runs one unchanged cell
+        # apart are merged: rewriting that cell costs the same as moving the
+        # cursor over it.
+        col = 0
+        while col < self.columns:
+            if old[col] == new[col]:
+                col += 1
+                continue
+            start = end = col
+            while end < self.columns:
+                if old[end] != new[end]:
+                    end += 1
+                elif end + 1 < self.columns and old[end + 1] != new[end + 1]:
+                    end += 2
+                else:
+                    break
+            yield start, new[start:end]
+            col = end
+
+    def invalidate(self):
+        # Forget the shadow, e.g. after something wrote to the LCD directly.
+        self.shadow = None
+        self.color = None
+        self.cursor = None
+
+
+class LCDRenderer(object):
+    # Draws screens on a background thread so slow I2C writes never hold up
+    # scanning, the relay or API calls.
+    # show() only stores the newest screen and returns.  If more screens
+    # arrive while one is being drawn, the ones in between are superseded
+    # and dropped; only the latest is drawn.
+    # hold() keeps a screen up for a while without anyone sleeping: screens
+    # shown meanwhile wait (the newest wins) until the time is up or
+    # release() is called.
+
+    def __init__(self, screen):
+        self.screen = screen  # FrameBufferLCD
+        self.cond = threading.Condition()
+        self.pending = None
+        self.deferred = None  # Newest screen shown during a hold.
+        self.held_until = None  # monotonic() time the hold ends.
+        self.drawing = False
+        self.drawn = 0
+        self.dropped = 0
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def show(self, msg, color):
+        with self.cond:
+            if self.held_until is not None:
+                if self.deferred is not None:
+                    self.dropped += 1
+                self.deferred = (msg, color)
+                return
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (msg, color)
+            self.cond.notify_all()
+
+    def hold(self, msg, color, secs):
+        # Show msg now and keep it up for secs (real seconds).
+        with self.cond:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (msg, color)
+            self.deferred = None
+            self.held_until = monotonic() + secs
+            self.cond.notify_all()
+
+    def release(self):
+        # End a hold early and draw the newest screen shown during it.
+        with self.cond:
+            self._release()
+            self.cond.notify_all()
+
+    def _release(self):
+        self.held_until = None
+        if self.deferred is not None:
+            self.pending, self.deferred = self.deferred, None
+
+    def flush(self, timeout=None):
+        # Wait until the latest screen is on the LCD.  During a hold that is
+        # the held screen.
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: self.pending is None and not self.drawing, timeout)
+
+    def stop(self):
+        # Draw what is pending, then end the thread.
+        with self.cond:
+            self._release()
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.held_until is not None and \
+                            monotonic() >= self.held_until:
+                        self._release()
+                    if self.pending is not None or self.stopping:
+                        break
+                    self.cond.wait(None if self.held_until is None else
+                                   self.held_until - monotonic())
+                if self.pending is None:
+                    return
+                frame, self.pending = self.pending, None
+                self.drawing = True
+            try:
+                self.screen.show(*frame)
+            except Exception:
+                self.screen.invalidate()  # Redraw everything next time.
+            with self.cond:
+                self.drawing = False
+                self.drawn += 1
+                self.cond.notify_all()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Structured, non-blocking event log.
+#
+# event('wo_scanned', wo='9934386') puts a record on a bounded queue and
+# returns; it never waits on a file or the tty.  LogWriter drains the queue
+# on its own thread, writes records in batches as JSON lines to a file on
+# tmpfs (/run, so it survives restarts but never wears the SD card),
+# rotates it by size and flushes every flush_interval seconds.  If the queue
+# is full, records are dropped and counted instead of blocking.
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+
+log_path = '/run/loader_controller.log'  # tmpfs.
+max_bytes = 1024 * 1024  # Rotate at 1 MB,
+backups = 3  # keeping loader_controller.log.1 to .3.
+flush_interval = 1.0  # Seconds.
+queue_size = 10000
+
+logger = logging.getLogger('loader_controller')
+logger.addHandler(logging.NullHandler())
+# Records only go through LogWriter's queue.  A root handler (basicConfig())
+# would write them on the caller's thread.
+logger.propagate = False
+
+context = {}  # Fields added to every record, e.g. press.
+
+
+def event(name, level=logging.INFO, **fields):
+    # Log one event.  fields are plain values: press, wo, serial, latency...
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={'fields': fields})
+
+
+def debug(name, **fields):
+    event(name, logging.DEBUG, **fields)
+
+
+def warning(name, **fields):
+    event(name, logging.WARNING, **fields)
+
+
+def error(name, **fields):
+    event(name, logging.ERROR, **fields)
+
+
+def to_json(record):
+    data = {'time': round(record.created, 6),
+            'level': record.levelname.lower(),
+            'event': record.getMessage()}
+    data.update(context)
+    data.update(getattr(record, 'fields', {}))
+    return json.dumps(data, default=str)
+
+
+def to_text(record):
+    fields = getattr(record, 'fields', {})
+    return ' '.join([record.levelname, record.getMessage()] +
+                    ['%s=%s' % (k, fields[k]) for k in sorted(fields)])
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks: a full queue drops the record.  Formatting is left to
+    # the writer thread.
+
+    def __init__(self, q):
+        logging.handlers.QueueHandler.__init__(self, q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter(object):
+
+    def __init__(self, path=log_path, max_bytes=max_bytes, backups=backups,
+                 flush_interval=flush_interval, batch=256, echo=None,
+                 echo_level=logging.WARNING):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch = batch
+        self.echo = echo  # A stream to also print records to, or None.
+        self.echo_level = echo_level
+        self.queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.file = None
+        self.size = 0
+        self.written = 0
+        self.thread = None
+
+    def start(self, level=logging.INFO):
+        logger.setLevel(level)
+        logger.addHandler(self.handler)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        # Write everything queued so far, then end the thread.
+        logger.removeHandler(self.handler)
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        dirty = False
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if dirty:
+                    self._flush()
+                    dirty = False
+                continue
+            records = [record]
+            while record is not None and len(records) < self.batch:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                records.append(record)
+            stopping = records[-1] is None
+            if stopping:
+                records.pop()
+            self._write(records)
+            dirty = True
+            if stopping:
+                self._flush()
+                self._close()
+                return
+
+    def _write(self, records):
+        if self.echo:
+            for record in records:
+                if record.levelno >= self.echo_level:
+                    self.echo.write(to_text(record) + '\n')
+            self.echo.flush()
+        text = ''.join(to_json(record) + '\n' for record in records)
+        try:
+            if self.file is None:
+                self._open()
+            self.file.write(text)
+        except (OSError, ValueError):
+            self._close()  # Try again with the next batch.
+            return
+        self.size += len(text)
+        self.written += len(records)
+        if self.size >= self.max_bytes:
+            self._rotate()
+
+    def _open(self):
+        self.file = open(self.path, 'a')
+        self.size = self.file.tell()
+
+    def _flush(self):
+        if self.file:
+            try:
+                self.file.flush()
+            except OSError:
+                self._close()
+
+    def _close(self):
+        if self.file:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+    def _rotate(self):
+        self._close()
+        try:
+            for i in range(self.backups - 1, 0, -1):
+                older = '%s.%d' % (self.path, i)
+                if os.path.exists(older):
+                    os.replace(older, '%s.%d' % (self.path, i + 1))
+            os.replace(self.path, self.path + '.1')
+        except OSError:
+            pass
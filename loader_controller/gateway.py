@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# LAN gateway for the IQ API.
+# Point iqapi.api_url on the controllers at this instead of the IQ API server.
+# /press answers are fetched from upstream at most once per press per
+# interval and served from memory to every controller.  Identical requests
+# that arrive together (a mass reboot) share one upstream call.
+# /press/<id>/events streams are passed through, one upstream stream per
+# controller, so push updates work behind the gateway too.
+#
+#   python3 -m loader_controller.gateway --upstream http://10.130.0.42 \
+#       --port 8080
+
+import argparse
+from concurrent.futures import Future
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import iqapi
+from .cache import TTLCache
+
+
+# Seconds to serve a cached answer for, per endpoint.  Anything not listed
+# is passed through (still single-flight).
+gateway_ttls = {'press': iqapi.press_poll}
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.endswith('/events'):
+            return self.relay_events()
+        try:
+            status, body, etag = self.server.gateway.fetch(self.path)
+        except Exception:
+            # Not JSON, so controllers treat it as a network failure rather
+            # than an invalid scan.
+            status, body, etag = 502, b'upstream unavailable', None
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def relay_events(self):
+        # Copy the upstream event stream as it arrives, until either side
+        # hangs up.  The controller then reconnects.
+        gateway = self.server.gateway
+        with gateway.lock:
+            gateway.requests += 1
+            gateway.streams += 1
+        client = iqapi.IQClient(gateway.client.base_url,
+                                read_timeout=3 * iqapi.events_heartbeat,
+                                keepalive_idle=float('inf'), pool_size=1)
+        try:
+            resp = client.get(self.path, stream=True,
+                              headers={'Accept': 'text/event-stream'})
+        except Exception:
+            client.close()
+            self.send_response(502)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            self.send_response(resp.status_code)
+            self.send_header('Content-Type',
+                             resp.headers.get('Content-Type',
+                                              'text/event-stream'))
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for chunk in resp.iter_content(chunk_size=None):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except Exception:
+            pass  # Either side went away.
+        finally:
+            resp.close()
+            client.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GatewayServer(ThreadingHTTPServer):
+    # Every controller may connect at once after a plant-wide reboot.
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class Gateway(object):
+
+    def __init__(self, upstream_url, ttls=gateway_ttls, host='0.0.0.0',
+                 port=8080, pool_size=16):
+        self.client = iqapi.IQClient(upstream_url, pool_size=pool_size)
+        self.ttls = ttls
+        self.cache = TTLCache(4096)
+        self.inflight = {}  # path -> Future shared by concurrent requests
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.upstream_requests = 0
+        self.coalesced = 0
+        self.streams = 0  # Event streams relayed.
+        self.server = GatewayServer((host, port), GatewayHandler)
+        self.server.gateway = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def fetch(self, path):
+        # Return (status, body, etag) for path, from cache, from a request
+        # already in flight, or from upstream.
+        endpoint = path.strip('/').split('/')[0]
+        ttl = self.ttls.get(endpoint)
+        with self.lock:
+            self.requests += 1
+        if ttl:
+            cached = self.cache.get(path)
+            if cached is not None:
+                return cached
+
+        with self.lock:
+            flight = self.inflight.get(path)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[path] = Future()
+                self.upstream_requests += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+
+        try:
+            resp = self.client.get(path)
+            etag = None
+            if resp.status_code == 200:
+                etag = '"' + hashlib.sha1(resp.content).hexdigest()[:16] + '"'
+            result = (resp.status_code, resp.content, etag)
+            if ttl and resp.status_code == 200:
+                self.cache.set(path, result, ttl)
+            flight.set_result(result)
+            return result
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[path]
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests,
+                    'upstream_requests': self.upstream_requests,
+                    'coalesced': self.coalesced,
+                    'streams': self.streams}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IQ API gateway")
+    parser.add_argument('--upstream', default=iqapi.api_url)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--interval', type=float, default=iqapi.press_poll,
+                        help="seconds to cache /press answers")
+    args = parser.parse_args()
+
+    ttls = dict(gateway_ttls, press=args.interval)
+    gateway = Gateway(args.upstream, ttls, args.host, args.port)
+    print("IQ API gateway on " + gateway.url + " -> " + args.upstream)
+    gateway.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
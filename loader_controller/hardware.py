@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Hardware backends for the loader controller.
+#
+# PiHardware drives the real relay, pallet sensor, reset button and RGB LCD.
+# SimHardware has the same interface on any Linux box: input levels are set
+# from code, the LCD keeps its text in memory, barcode scans come from a
+# script and sleeps can run faster than real time.
+#
+# Both have:
+#   io       RPi.GPIO or SimGPIO
+#   lcd      an LCD with clear/set_cursor/message/set_color
+#   scan(prompt), sleep(secs), wait(event, secs), clock(), cleanup()
+#   speed    how much faster than real time sleeps and clock() run
+
+import queue
+import threading
+import time
+
+
+###############################################################################
+# Raspberry Pi pins (BCM numbering).
+###############################################################################
+rst_btn = 18  # INPUT - Manually restart the program.
+ir_pin = 23  # INPUT - Reads the IR sensor state.
+ssr_pin = 24  # OUTPUT - Turns on the Solid State Relay.
+
+###############################################################################
+# MCP23017 pins connected to the LCD.
+# Note: These are MCP pins, not RPI pins.
+###############################################################################
+lcd_rs = 0
+lcd_en = 1
+lcd_d4 = 2
+lcd_d5 = 3
+lcd_d6 = 4
+lcd_d7 = 5
+lcd_red = 6
+lcd_green = 7
+lcd_blue = 8
+lcd_columns = 20
+lcd_rows = 4
+
+
+def setup_pins(io):
+    io.setmode(io.BCM)
+    io.setup(ssr_pin, io.OUT, initial=0)
+
+    # Wire IR sensor from PIN to GND. Default state = False.
+    # The edge will RISE when a signal is present.
+    # io.setup(ir_pin, io.IN, pull_up_down=io.PUD_UP)
+
+    # The Banner sensor sends a voltage signal so pull down.
+    io.setup(ir_pin, io.IN, pull_up_down=io.PUD_DOWN)
+
+    # Wire the restart button from PIN to 3V3.  Default state = True.
+    # The edge will FALL when pressed.
+    io.setup(rst_btn, io.IN, pull_up_down=io.PUD_DOWN)
+
+
+class PiHardware(object):
+    speed = 1.0
+
+    def __init__(self, lcd_driver='mcp', columns=lcd_columns, rows=lcd_rows,
+                 scanner=None):
+        import RPi.GPIO as IO  # For standard GPIO methods.
+        self.io = IO
+        setup_pins(IO)
+
+        # 'mcp' drives the LCD with whole-port block writes (lcdmcp.py, same
+        # pins as above).  'adafruit' uses the Adafruit_CharLCD driver, one
+        # I2C transaction per pin change.
+        if lcd_driver == 'mcp':
+            from . import lcdmcp
+            # MCP23017 at its default 0x20 I2C address on bus 1.
+            self.lcd = lcdmcp.MCPCharLCD(columns, rows)
+        else:
+            import Adafruit_CharLCD as LCD
+            import Adafruit_GPIO.MCP230xx as MCP
+
+            # Initialize MCP23017 device using its default 0x20 I2C address.
+            gpio = MCP.MCP23017()
+
+            # Initialize the LCD using the pins.
+            self.lcd = LCD.Adafruit_RGBCharLCD(
+                lcd_rs, lcd_en, lcd_d4, lcd_d5, lcd_d6, lcd_d7, columns, rows,
+                lcd_red, lcd_green, lcd_blue, gpio=gpio)
+
+        # The barcode scanner is a USB keyboard.  Given its event device
+        # (scanner.py), it is read directly; otherwise through the tty.
+        self.scanner = None
+        if scanner:
+            from .scanner import EvdevScanner
+            self.scanner = EvdevScanner(scanner).start()
+
+    def scan(self, prompt):
+        if self.scanner:
+            return self.scanner.scan(prompt)
+        return input(prompt)
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+    def wait(self, event, secs):
+        return event.wait(secs)
+
+    def clock(self):
+        return time.monotonic()
+
+    def cleanup(self):
+        self.io.cleanup()
+        if self.scanner:
+            self.scanner.close()  # Releases the grab.
+
+
+class SimGPIO(object):
+    # The parts of RPi.GPIO the controller uses.  Inputs are set with
+    # set_input(); edge callbacks run on their own thread, like RPi.GPIO's
+    # event thread.  Every output change is kept in history as
+    # (monotonic time, pin, value).
+    BCM = 11
+    OUT = 0
+    IN = 1
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.levels = {}
+        self.callbacks = {}
+        self.outputs = {}
+        self.output_times = {}
+        self.history = []
+        self.lock = threading.Lock()
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if direction == self.OUT:
+            self.output(pin, initial or 0)
+        elif pin not in self.levels:
+            self.levels[pin] = 1 if pull_up_down == self.PUD_UP else 0
+
+    def input(self, pin):
+        return self.levels.get(pin, 0)
+
+    def output(self, pin, value):
+        now = time.monotonic()
+        with self.lock:
+            self.outputs[pin] = value
+            self.output_times[pin] = now
+            self.history.append((now, pin, value))
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+
+    def set_input(self, pin, level):
+        old = self.levels.get(pin, 0)
+        self.levels[pin] = level
+        edge, callback = self.callbacks.get(pin, (None, None))
+        if callback is None or old == level:
+            return
+        if edge == self.BOTH or edge == (self.RISING if level else
+                                         self.FALLING):
+            threading.Thread(target=callback, args=(pin,)).start()
+
+
+class SimLCD(object):
+    # Character LCD that keeps its text and backlight color in memory.
+
+    def __init__(self, columns=lcd_columns, rows=lcd_rows):
+        self.columns = columns
+        self.rows = rows
+        self.color = (0.0, 0.0, 0.0)
+        self.clear()
+
+    def clear(self):
+        self.cells = [[' '] * self.columns for row in range(self.rows)]
+        self.col = self.row = 0
+
+    def home(self):
+        self.col = self.row = 0
+
+    def set_cursor(self, col, row):
+        self.col, self.row = col, min(row, self.rows - 1)
+
+    def message(self, text):
+        for char in text:
+            if char == '\n':
+                self.set_cursor(0, self.row + 1)
+            elif self.col < self.columns:
+                self.cells[self.row][self.col] = char
+                self.col += 1
+
+    def set_color(self, red, green, blue):
+        self.color = (red, green, blue)
+
+    def screen(self):
+        return [''.join(row) for row in self.cells]
+
+
+class SimHardware(object):
+    # Runs the controller without a Pi.  scans is a list of barcodes handed
+    # out in order (None reads them from the keyboard), scanner an
+    # EvdevScanner to read them from instead.  speed divides every
+    # sleep and wait and multiplies clock(), so speed=100 runs a 2 second
+    # error screen in 20 ms.
+
+    def __init__(self, scans=None, speed=1.0, pallet=True, scan_timeout=None,
+                 columns=lcd_columns, rows=lcd_rows, scanner=None):
+        self.io = SimGPIO()
+        setup_pins(self.io)
+        self.io.levels[ir_pin] = 0 if pallet else 1
+        self.lcd = SimLCD(columns, rows)
+        self.speed = float(speed)
+        self.started = time.monotonic()
+        self.scans = None
+        if scans is not None:
+            self.scans = queue.Queue()
+            for barcode in scans:
+                self.scans.put(barcode)
+        self.scan_timeout = scan_timeout  # Real seconds, None waits forever.
+        self.scanner = scanner
+
+    def scan(self, prompt):
+        # Like input(), raises EOFError once the script has run out.
+        if self.scanner:
+            return self.scanner.scan(prompt)
+        if self.scans is None:
+            return input(prompt)
+        try:
+            return self.scans.get(timeout=self.scan_timeout)
+        except queue.Empty:
+            raise EOFError(prompt)
+
+    def add_scan(self, barcode):
+        self.scans.put(barcode)
+
+    def sleep(self, secs):
+        time.sleep(secs / self.speed)
+
+    def wait(self, event, secs):
+        return event.wait(secs / self.speed)
+
+    def clock(self):
+        return self.started + (time.monotonic() - self.started) * self.speed
+
+    def cleanup(self):
+        self.io.cleanup()
+
+    def relay(self):
+        return self.io.outputs.get(ssr_pin, 0)
+
+    def remove_pallet(self):
+        self.io.set_input(ir_pin, 1)
+
+    def load_pallet(self):
+        self.io.set_input(ir_pin, 0)
+
+    def press_reset(self):
+        self.io.set_input(rst_btn, 1)
+        self.io.set_input(rst_btn, 0)
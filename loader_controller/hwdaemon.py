@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Hardware daemon: a small, long-lived process that owns the relay, the
+# pallet sensor, the reset button and the LCD.
+#
+# The controller (barcodes, API, validation) talks to it through
+# RemoteHardware, which has the same interface as PiHardware, so it can crash,
+# soft restart or os.execv() itself without the GPIO being set up again or the
+# LCD being cleared.
+#
+# - Inputs and the relay state are published in a status block, a small
+#   file on tmpfs mapped into both processes.  Reads are lock-free: the
+#   writer bumps seq to an odd number, updates the block and then bumps seq
+#   to the next even number.  A reader gives up (StaleStatus) on a block
+#   left odd or not updated for stale_after seconds: the daemon is gone.
+# - Relay and LCD commands go over a unix socket as JSON lines.  Edge events
+#   come back the same way.
+# - The daemon drops the relay itself when the pallet is pulled or the reset
+#   button is pressed, and refuses to energize it with no pallet.
+# - The relay is a lease.  The controller renews it with every watchdog kick
+#   (RelayWatchdog renew); if it lapses for lease seconds the daemon drops
+#   the relay, so a hung controller cannot leave the loader running.  It is
+#   dropped at once when the controller disconnects, and a controller that
+#   connects drops it before anything else: it does not know what the relay
+#   was running for.
+# - SIGTERM and Ctrl-C drop the relay on the way out.  SIGKILL, a crash or
+#   an OOM kill do not, and the pin stays as it was, so the daemon must run
+#   under a supervisor that drops it after the daemon stops, e.g. systemd
+#   with ExecStopPost running "hwdaemon drop" (deploy/client/README.md).
+#
+#   python3 -m loader_controller.hwdaemon [pi|sim|drop]
+
+import json
+import mmap
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from . import display, hardware
+
+
+socket_path = '/run/loader_hw.sock'
+status_path = '/run/loader_hw.status'  # tmpfs.
+tick = 0.05  # Seconds between input re-reads and status heartbeats.
+lease = 5.0  # Seconds the relay stays on without a renewal, watchdog_timeout.
+stale_after = 1.0  # Seconds without a heartbeat before a reader gives up.
+
+# seq, pid, ir level, reset level, relay, resets, pallet removals, updated
+# (the daemon's monotonic clock).
+STATUS = struct.Struct('<IIBBBxIId')
+Status = namedtuple('Status', 'seq pid ir rst relay resets removals updated')
+SEQ = struct.Struct('<I')
+
+
+class StaleStatus(OSError):
+    # The daemon stopped updating the status block, maybe mid-write.
+    pass
+
+
+class StatusBlock(object):
+    # One writer (the daemon), any number of readers.
+
+    def __init__(self, path=status_path, create=False):
+        if create:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(b'\0' * STATUS.size)
+            os.replace(path + '.tmp', path)
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), STATUS.size)
+        self.seq = 0
+
+    def write(self, ir, rst, relay, resets, removals):
+        self.seq += 1
+        SEQ.pack_into(self.map, 0, self.seq)  # Odd: being written.
+        STATUS.pack_into(self.map, 0, self.seq, os.getpid(), ir, rst, relay,
+                         resets, removals, time.monotonic())
+        self.seq += 1
+        SEQ.pack_into(self.map, 0, self.seq)  # Even: done, last.
+
+    def read(self, stale_after=stale_after):
+        # The daemon's clock is time.monotonic(), the same on both sides.
+        deadline = time.monotonic() + stale_after
+        while True:
+            seq = SEQ.unpack_from(self.map)[0]
+            if seq % 2 == 0:
+                status = Status._make(STATUS.unpack_from(self.map))
+                if SEQ.unpack_from(self.map)[0] == seq == status.seq:
+                    if time.monotonic() - status.updated > stale_after:
+                        raise StaleStatus('status not updated for %.1f s' %
+                                          (time.monotonic() - status.updated))
+                    return status
+            if time.monotonic() > deadline:
+                raise StaleStatus('status left mid-write')
+            time.sleep(0)  # Let the writer finish.
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server.hw_daemon
+        daemon.connect(self)
+        try:
+            for line in self.rfile:
+                try:
+                    daemon.command(json.loads(line.decode('utf-8')))
+                except (ValueError, TypeError, KeyError):
+                    pass  # Bad command; the connection stays up.
+        finally:
+            daemon.disconnect(self)
+
+    def send(self, msg):
+        self.wfile.write((json.dumps(msg) + '\n').encode('utf-8'))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class HardwareDaemon(object):
+    # hw is a hardware.PiHardware or SimHardware.
+
+    def __init__(self, hw, sock_path=socket_path, status_path=status_path,
+                 tick=tick, debounce=0.002, samples=3, lease=lease,
+                 columns=hardware.lcd_columns, rows=hardware.lcd_rows):
+        self.hw = hw
+        self.io = hw.io
+        self.sock_path = sock_path
+        self.status_path = status_path
+        self.tick = tick
+        self.debounce = debounce  # Pallet removal is confirmed like
+        self.samples = samples  # sensor.PalletSensor does.
+        self.lock = threading.Lock()
+        self.relay = 0
+        self.lease = lease  # For relay commands that do not give one.
+        self.lease_until = None  # monotonic() time the relay lease lapses.
+        self.lapses = 0
+        self.resets = 0
+        self.removals = 0
+        self.clients = set()
+        self.send_lock = threading.Lock()
+        # The shadow copy lives here, so a restarted controller's first
+        # screen is drawn as a diff too.
+        self.screen = display.FrameBufferLCD(hw.lcd, columns, rows)
+        self.renderer = display.LCDRenderer(self.screen)
+        self.stop_event = threading.Event()
+        self.server = None
+
+    def start(self):
+        self.status = StatusBlock(self.status_path, create=True)
+        self.publish()
+        self.io.add_event_detect(hardware.ir_pin, self.io.BOTH,
+                                 callback=self._ir_cb, bouncetime=50)
+        self.io.add_event_detect(hardware.rst_btn, self.io.BOTH,
+                                 callback=self._rst_cb, bouncetime=50)
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)  # Left over from a previous run.
+        self.server = Server(self.sock_path, Handler)
+        self.server.hw_daemon = self
+        for target in (self.server.serve_forever, self._run):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        # The daemon is going away: nothing is watching the pallet any more.
+        self.stop_event.set()
+        self.set_relay(0)
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            os.unlink(self.sock_path)
+        self.io.remove_event_detect(hardware.ir_pin)
+        self.io.remove_event_detect(hardware.rst_btn)
+        self.renderer.stop()
+
+    def publish(self):
+        with self.lock:
+            self.status.write(self.io.input(hardware.ir_pin),
+                              self.io.input(hardware.rst_btn), self.relay,
+                              self.resets, self.removals)
+
+    def broadcast(self, msg):
+        with self.send_lock:
+            for client in list(self.clients):
+                try:
+                    client.send(msg)
+                except OSError:
+                    self.clients.discard(client)
+
+    def connect(self, client):
+        self.clients.add(client)
+
+    def disconnect(self, client):
+        # Nothing renews the lease any more.
+        self.clients.discard(client)
+        if self.relay:
+            self.set_relay(0)
+
+    def command(self, msg):
+        if 'relay' in msg:
+            self.set_relay(1 if msg['relay'] else 0,
+                           msg.get('lease') or self.lease)
+        elif 'renew' in msg:
+            self.renew(msg['renew'])
+        elif 'show' in msg:
+            self.renderer.show(msg['show'], msg['color'])
+
+    def set_relay(self, value, lease=None):
+        with self.lock:
+            if value and self.io.input(hardware.ir_pin) == 1:
+                value = 0  # No pallet, no loader.
+            self.relay = value
+            self.lease_until = time.monotonic() + (lease or self.lease) \
+                if value else None
+            self.io.output(hardware.ssr_pin, value)
+        self.publish()
+
+    def renew(self, lease):
+        with self.lock:
+            if self.relay:
+                self.lease_until = time.monotonic() + lease
+
+    def lease_lapsed(self):
+        with self.lock:
+            if not self.relay or time.monotonic() < self.lease_until:
+                return False
+            self.io.output(hardware.ssr_pin, 0)
+            self.relay = 0
+            self.lease_until = None
+            self.lapses += 1
+        self.publish()
+        return True
+
+    def pallet_gone(self):
+        for i in range(self.samples):
+            if self.io.input(hardware.ir_pin) != 1:
+                return False
+            if i < self.samples - 1:
+                time.sleep(self.debounce)
+        return True
+
+    def _ir_cb(self, channel):
+        if self.pallet_gone():
+            with self.lock:
+                self.io.output(hardware.ssr_pin, 0)
+                if self.relay:
+                    self.removals += 1
+                self.relay = 0
+        self.publish()
+        self.broadcast({'pin': channel,
+                        'level': self.io.input(hardware.ir_pin)})
+
+    def _rst_cb(self, channel):
+        level = self.io.input(hardware.rst_btn)
+        if level:
+            with self.lock:
+                self.io.output(hardware.ssr_pin, 0)
+                self.relay = 0
+                self.resets += 1
+        self.publish()
+        self.broadcast({'pin': channel, 'level': level})
+
+    def _run(self):
+        # Heartbeat, the relay lease, and a backup read of the sensor in
+        # case an edge was missed.
+        while not self.stop_event.wait(self.tick):
+            if self.relay and self.pallet_gone():
+                self._ir_cb(hardware.ir_pin)
+            elif not self.lease_lapsed():
+                self.publish()
+
+
+###############################################################################
+# Controller side.
+###############################################################################
+
+class RemoteGPIO(object):
+    # The parts of RPi.GPIO the controller uses, backed by the daemon.
+    # setup() is a no-op: the daemon set the pins up once.
+    BCM = hardware.SimGPIO.BCM
+    OUT = hardware.SimGPIO.OUT
+    IN = hardware.SimGPIO.IN
+    PUD_DOWN = hardware.SimGPIO.PUD_DOWN
+    PUD_UP = hardware.SimGPIO.PUD_UP
+    RISING = hardware.SimGPIO.RISING
+    FALLING = hardware.SimGPIO.FALLING
+    BOTH = hardware.SimGPIO.BOTH
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        pass
+
+    def input(self, pin):
+        status = self.remote.status.read()
+        return {hardware.ir_pin: status.ir, hardware.rst_btn: status.rst,
+                hardware.ssr_pin: status.relay}.get(pin, 0)
+
+    def output(self, pin, value):
+        if pin == hardware.ssr_pin:
+            self.remote.send({'relay': value, 'lease': self.remote.lease})
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+
+    def event(self, pin, level):
+        # An edge reported by the daemon, on the reader thread.
+        edge, callback = self.callbacks.get(pin, (None, None))
+        if callback and edge in (self.BOTH, self.RISING if level else
+                                 self.FALLING):
+            callback(pin)
+
+
+class RemoteScreen(object):
+    # Takes the place of display.FrameBufferLCD: whole screens are sent to
+    # the daemon, which diffs them against what the LCD shows.
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.color = None
+
+    def show(self, msg, color):
+        self.remote.send({'show': msg, 'color': color})
+        self.color = color
+
+    def invalidate(self):
+        pass
+
+
+class RemoteHardware(object):
+    # Same interface as hardware.PiHardware (see hardware.py), plus screen.
+    # Barcodes are still read here, from the tty or the scanner's event
+    # device (see PiHardware).  lease is how long the relay stays on without
+    # renew(); the controller passes watchdog_timeout and renews on every
+    # watchdog kick.
+    speed = 1.0
+
+    def __init__(self, sock_path=socket_path, status_path=status_path,
+                 scanner=None, lease=lease):
+        self.status = StatusBlock(status_path)
+        self.lease = lease
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(sock_path)
+        self.send_lock = threading.Lock()
+        # Whatever a previous controller left running, this one did not
+        # validate it.
+        self.send({'relay': 0})
+        self.io = RemoteGPIO(self)
+        self.screen = self.lcd = RemoteScreen(self)
+        self.scanner = None
+        if scanner:
+            from .scanner import EvdevScanner
+            self.scanner = EvdevScanner(scanner).start()
+        self.thread = threading.Thread(target=self._read)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, msg):
+        data = (json.dumps(msg) + '\n').encode('utf-8')
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def renew(self):
+        # Keeps the relay on for another lease seconds.
+        self.send({'renew': self.lease})
+
+    def _read(self):
+        try:
+            for line in self.sock.makefile('rb'):
+                msg = json.loads(line.decode('utf-8'))
+                self.io.event(msg['pin'], msg['level'])
+        except (OSError, ValueError):
+            pass
+
+    def scan(self, prompt):
+        if self.scanner:
+            return self.scanner.scan(prompt)
+        return input(prompt)
+
+    def sleep(self, secs):
+        time.sleep(secs)
+
+    def wait(self, event, secs):
+        return event.wait(secs)
+
+    def clock(self):
+        return time.monotonic()
+
+    def cleanup(self):
+        # Only the connection: the hardware stays as it is.
+        self.io.cleanup()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.status.close()
+        if self.scanner:
+            self.scanner.close()
+
+
+def drop_relay():
+    # The supervisor's stop hook: the daemon is gone, whatever killed it.
+    import RPi.GPIO as IO
+    IO.setwarnings(False)
+    IO.setmode(IO.BCM)
+    IO.setup(hardware.ssr_pin, IO.OUT, initial=0)
+
+
+def serve(daemon):
+    # Until SIGTERM or Ctrl-C, then drop the relay.
+
+    def terminate(signum, frame):
+        raise SystemExit(0)  # Unwinds to daemon.stop() below.
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'pi'
+    if backend == 'drop':
+        return drop_relay()
+    if backend == 'sim':
+        hw = hardware.SimHardware()
+    else:
+        hw = hardware.PiHardware()
+    daemon = HardwareDaemon(hw).start()
+    try:
+        serve(daemon)
+    finally:
+        hw.cleanup()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
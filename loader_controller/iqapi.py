@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+import json
+from time import monotonic, perf_counter
+import threading
+
+from .cache import TTLCache
+from .polling import PollSchedule
+
+
+# Variables
+api_url = 'http://10.130.0.42'  # Web API URL
+connect_timeout = 3.05  # Seconds to wait for the TCP connection.
+read_timeout = 10  # Seconds to wait for the API to answer.
+keepalive_idle = 60  # Drop pooled connections idle longer than this.
+
+# Seconds to cache lookups for, per endpoint.  "Invalid" answers (the API
+# returned an error) are cached for negative_ttl so a bad scan that gets
+# rescanned does not go back to IQMS every time.
+cache_ttls = {'wo': 60, 'serial': 600}
+negative_ttl = 10
+cache_size = 256
+
+# Seconds between background /press/<PRESS_ID> fetches, the same rate as
+# the controller's wo_monitor.  None are made while the events stream is up.
+press_poll = 300
+events_heartbeat = 15  # The events stream sends a keep-alive this often.
+
+
+class IQClient(object):
+    # Pooled, keep-alive HTTP client for the IQ API.
+    # A scan only pays for the TCP handshake the first time (or after the
+    # connection has been idle), instead of on every request.
+
+    def __init__(self, base_url, connect_timeout=connect_timeout,
+                 read_timeout=read_timeout, keepalive_idle=keepalive_idle,
+                 pool_size=4, cache_ttls=cache_ttls,
+                 negative_ttl=negative_ttl, cache_size=cache_size):
+        self.base_url = base_url.rstrip('/')
+        self.cache_ttls = cache_ttls
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(cache_size)
+        self.timeout = (connect_timeout, read_timeout)
+        self.keepalive_idle = keepalive_idle
+        self.pool_size = pool_size
+        self.session = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+        self.executor = None
+        self.validate_supported = True  # Cleared if /validate is a 404.
+        # Conditional GETs: path -> (etag, last_modified, data, bytes,
+        # parse_secs) from the last full answer.
+        self.validators = {}
+        self.not_modified = 0
+        self.bytes_saved = 0
+        self.parse_saved = 0.0
+
+    def _get_session(self):
+        # Return the pooled session, replacing it if it has sat idle.
+        # Over Wi-Fi the server (or an AP) silently drops idle sockets, and
+        # reusing one of those stalls until the read timeout.
+        with self.lock:
+            now = monotonic()
+            if self.session is not None and \
+                    now - self.last_used > self.keepalive_idle:
+                self.session.close()
+                self.session = None
+            if self.session is None:
+                # Imported here, requests takes longer to import than the
+                # rest of the controller put together.
+                import requests
+                from requests.adapters import HTTPAdapter
+                self.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size)
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+            self.last_used = now
+            return self.session
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self._get_session().get(self.base_url + path, **kwargs)
+
+    def get_json(self, path, conditional=False):
+        # With conditional=True the request carries the ETag/Last-Modified
+        # of the previous answer, and a 304 returns the data parsed last
+        # time without downloading or parsing the body again.
+        if not conditional:
+            resp = self.get(path)
+            return json.loads(resp.text)
+
+        headers = {}
+        cached = self.validators.get(path)
+        if cached:
+            if cached[0]:
+                headers['If-None-Match'] = cached[0]
+            if cached[1]:
+                headers['If-Modified-Since'] = cached[1]
+        resp = self.get(path, headers=headers)
+        if resp.status_code == 304 and cached:
+            with self.lock:
+                self.not_modified += 1
+                self.bytes_saved += cached[3]
+                self.parse_saved += cached[4]
+            return cached[2]
+
+        t0 = perf_counter()
+        data = json.loads(resp.text)
+        parse_secs = perf_counter() - t0
+        etag = resp.headers.get('ETag')
+        modified = resp.headers.get('Last-Modified')
+        if etag or modified:
+            self.validators[path] = (etag, modified, data,
+                                     len(resp.content), parse_secs)
+        return data
+
+    def revalidation_stats(self):
+        with self.lock:
+            return {'not_modified': self.not_modified,
+                    'bytes_saved': self.bytes_saved,
+                    'parse_saved': self.parse_saved}
+
+    def lookup(self, endpoint, key):
+        # Cached GET of /<endpoint>/<key>.  Network errors are not cached.
+        path = '/' + endpoint + '/' + key
+        data = self.cache.get(path)
+        if data is not None:
+            return data
+        data = self.get_json(path)
+        if data.get('error'):
+            self.cache.set(path, data, self.negative_ttl, negative=True)
+        elif self.cache_ttls.get(endpoint):
+            self.cache.set(path, data, self.cache_ttls[endpoint])
+        return data
+
+    def submit(self, fn, *args):
+        # Run fn(*args) on the client's thread pool and return a Future.
+        with self.lock:
+            if self.executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.executor = ThreadPoolExecutor(self.pool_size)
+        return self.executor.submit(fn, *args)
+
+    def lookup_async(self, endpoint, key):
+        # Start a lookup in the background and return a Future, so the LCD
+        # can be redrawn while the request is in flight.
+        return self.submit(self.lookup, endpoint, key)
+
+    def validate(self, press_id, wo_id, serial):
+        # Check a workorder and raw material serial for a press in one
+        # request.  Returns a verdict:
+        #   {'valid': bool, 'reason': None, 'wo', 'press', 'serial' or
+        #    'material', 'press': ..., 'rmat': ..., 'itemno': ...}
+        # Servers without /validate get the two lookups instead.
+        if self.validate_supported:
+            resp = self.get('/validate/' + press_id + '/' + wo_id + '/' +
+                            serial)
+            if resp.status_code != 404:
+                return json.loads(resp.text)
+            self.validate_supported = False
+        return self._validate_with_lookups(press_id, wo_id, serial)
+
+    def _validate_with_lookups(self, press_id, wo_id, serial):
+        # Both barcodes are known, so look them up at the same time.
+        pending = self.lookup_async('serial', serial)
+        wo = self.lookup('wo', wo_id)
+        inv = pending.result()
+        return verdict(press_id, wo, inv)
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+
+def verdict(press_id, wo, inv):
+    # Build a /validate style verdict from /wo and /serial answers.
+    if wo.get('error'):
+        return {'valid': False, 'reason': 'wo'}
+    result = {'valid': False, 'reason': None, 'press': wo['press'],
+              'rmat': wo['rmat'], 'itemno': inv.get('itemno')}
+    if wo['press'] != press_id:
+        result['reason'] = 'press'
+    elif inv.get('error'):
+        result['reason'] = 'serial'
+    elif inv['itemno'] != wo['rmat']:
+        result['reason'] = 'material'
+    else:
+        result['valid'] = True
+    return result
+
+
+class PressWatcher(object):
+    # Keeps the /press/<press_id> answer fresh in a background thread.
+    # current() only returns it while it is younger than max_age.  With a
+    # PressSubscriber, its pushes keep the answer fresh while it is
+    # connected and the thread does not poll.  on_update(data) is called
+    # with every answer it fetches, so the controller's workorder monitor
+    # and snapshot refresh need no /press poll of their own.
+
+    def __init__(self, client, press_id, interval=press_poll, max_age=None,
+                 subscriber=None, on_update=None):
+        self.client = client
+        self.press_id = press_id
+        self.subscriber = subscriber
+        self.on_update = on_update
+        self.interval = interval
+        self.max_age = max_age or 2 * interval
+        # Per-press phase and jitter.
+        self.schedule = PollSchedule(press_id, interval, min_interval=0)
+        self.data = None
+        self.fetched = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self):
+        data = self.client.get_json('/press/' + self.press_id,
+                                    conditional=True)
+        self.update(data)
+        if self.on_update:
+            self.on_update(data)
+        return data
+
+    def update(self, data):
+        # Store a press status, fetched here or pushed by PressSubscriber.
+        if 'wo_id' in data:
+            self.data, self.fetched = data, monotonic()
+
+    def pushed(self):
+        return bool(self.subscriber and self.subscriber.connected)
+
+    def current(self):
+        if self.data is not None and (
+                self.pushed() or monotonic() - self.fetched < self.max_age):
+            return self.data
+
+    def _run(self):
+        # A fleet that boots together spreads its first fetches over one
+        # interval.
+        self.stop_event.wait(self.schedule.first_delay())
+        while not self.stop_event.is_set():
+            if not self.pushed():
+                try:
+                    self.refresh()
+                except Exception:
+                    pass
+            self.stop_event.wait(self.schedule.jittered(self.interval))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class PressSubscriber(object):
+    # Holds a server-sent events connection to /press/<press_id>/events and
+    # calls on_update(data) with every press status the server pushes.
+    # connected is only True while the stream is live, so callers know when
+    # to fall back to polling.  supported goes False while the server
+    # answers 404 for the events endpoint (an older server, or one being
+    # redeployed); it is asked again every missing_retry seconds.
+    # Uses its own client: the stream holds a connection open far longer
+    # than IQClient.keepalive_idle.
+
+    def __init__(self, base_url, press_id, on_update,
+                 heartbeat=events_heartbeat, retry=5, missing_retry=600):
+        self.client = IQClient(base_url, read_timeout=3 * heartbeat,
+                               keepalive_idle=float('inf'), pool_size=1)
+        self.press_id = press_id
+        self.on_update = on_update
+        self.retry = retry  # Seconds between reconnect attempts.
+        self.missing_retry = missing_retry
+        self.connected = False
+        self.supported = True
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _listen(self):
+        resp = self.client.get('/press/' + self.press_id + '/events',
+                               stream=True,
+                               headers={'Accept': 'text/event-stream'})
+        try:
+            if resp.status_code == 404:
+                self.supported = False
+                return
+            resp.raise_for_status()
+            self.supported = True
+            self.connected = True
+            data = []
+            # One byte at a time so an event is handled as soon as its
+            # blank line arrives, however the server frames the stream.
+            for line in resp.iter_lines(chunk_size=1):
+                if self.stop_event.is_set():
+                    return
+                line = line.decode('utf-8')
+                if line.startswith('data:'):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    self.on_update(json.loads('\n'.join(data)))
+                    data = []
+        finally:
+            self.connected = False
+            resp.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self._listen()
+            except Exception:
+                pass
+            self.stop_event.wait(self.retry if self.supported else
+                                 self.missing_retry)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.client.close()
+
+
+# Shared client.  controller.py uses this one too.
+client = IQClient(api_url)
+
+
+def wo_id_api_request(press_id):
+    data = client.get_json('/press/' + press_id)
+
+    try:
+        wo_id = data['wo_id']
+        return wo_id
+    except:
+        print("\nAPI Data is incomplete")
+        print(data)
+
+
+def press_api_request(press_id):
+    data = client.get_json('/press/' + press_id)
+
+    try:
+        press_id = data['press']
+        wo_id = data['wo_id']
+        itemno = data['itemno']
+        descrip = data['descrip']
+        itemno_mat = data['itemno_mat']
+        descrip_mat = data['descrip_mat']
+        return press_id, wo_id, itemno, descrip, itemno_mat, descrip_mat
+    except:
+        print("\nAPI Data is incomplete")
+        print(data)
+
+
+def wo_api_request(wo_id):
+    data = client.lookup('wo', wo_id)
+
+    try:
+        press_from_api_wo = data['press']
+        rmat_from_api_wo = data['rmat']
+        return press_from_api_wo, rmat_from_api_wo
+    except:
+        print("\nAPI Data is incomplete")
+        print(data)
+
+
+def serial_api_request(sn):
+    data = client.lookup('serial', sn)
+
+    try:
+        rmat_from_api = data['itemno']
+    except:
+        print("\nAPI Data is incomplete")
+        print(data)
+    return rmat_from_api
+
+
+def test_press_api_request(press_id):
+    press_id, wo_id, itemno, descrip,\
+    itemno_mat, descrip_mat = press_api_request(press_id)
+
+    print("Testing Press API Request")
+    print("\nPress: " + press_id)
+    print("Work Order: " + wo_id)
+    print("Item Number: " + itemno)
+    print("Item Description: " + descrip)
+    print("Raw Material Item Number: " + itemno_mat)
+    print("Raw Material Description: " + descrip_mat)
+
+
+def test_wo_api_request(wo_id):
+    press, rmat = wo_api_request(wo_id)
+
+    print("Testing WO API Request")
+    print("Press: " + press)
+    print("\nWork Order: " + wo_id)
+    print("Raw Material Item Number: " + rmat)
+
+if __name__ == '__main__':
+    test_press_api_request('136')
+    test_wo_api_request('10284800')
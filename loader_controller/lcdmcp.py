@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# RGB character LCD on an MCP23017, driven with whole-port block writes.
+#
+# The Adafruit driver sets RS, D4-D7 and EN with separate gpio.output()
+# calls, each one its own I2C transaction (9 per character).  Here the MCP23017
+# is put in byte mode with its registers banked (IOCON.BANK | IOCON.SEQOP) so
+# the register pointer stays on OLATA (with BANK = 0, byte mode toggles it
+# between OLATA and OLATB, and every other state would land on port B), and
+# every port A state for a run of characters (data + EN high, data + EN low
+# for each nibble) goes out in one block write: 4 bytes per character, up to
+# 8 characters per transaction.
+#
+# Same wiring and the same clear/set_cursor/message/set_color calls as
+# Adafruit_CharLCD.Adafruit_RGBCharLCD, so it can be used in its place.
+
+from time import sleep
+
+
+###############################################################################
+# MCP23017 pins connected to the LCD.
+# Note: These are MCP pins, not RPI pins.  0-7 are port A, 8-15 port B.
+###############################################################################
+lcd_rs = 0
+lcd_en = 1
+lcd_d4 = 2  # D4-D7 are on pins 2-5.
+lcd_red = 6
+lcd_green = 7
+lcd_blue = 8
+lcd_columns = 20
+lcd_rows = 4
+
+# MCP23017 registers (IOCON.BANK = 1).
+IODIRA = 0x00
+IODIRB = 0x10
+IOCON = 0x05
+OLATA = 0x0A
+OLATB = 0x1A
+IOCON_BANK0 = 0x0A  # IOCON's address at power on (BANK = 0).
+BANK = 0x80  # IOCON: port A and B registers in separate banks.
+SEQOP = 0x20  # IOCON: do not increment the register address.
+
+# HD44780 commands.
+LCD_CLEARDISPLAY = 0x01
+LCD_RETURNHOME = 0x02
+LCD_ENTRYMODESET = 0x04
+LCD_DISPLAYCONTROL = 0x08
+LCD_FUNCTIONSET = 0x20
+LCD_SETDDRAMADDR = 0x80
+LCD_ENTRYLEFT = 0x02
+LCD_DISPLAYON = 0x04
+LCD_2LINE = 0x08
+LCD_ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+SMBUS_BLOCK_MAX = 32  # Bytes per SMBus block write.
+
+
+class MCPCharLCD(object):
+
+    def __init__(self, columns=lcd_columns, rows=lcd_rows, address=0x20,
+                 busnum=1, bus=None):
+        if bus is None:
+            import smbus  # python3-smbus, only needed on the Pi.
+            bus = smbus.SMBus(busnum)
+        self.bus = bus
+        self.address = address
+        self.columns = columns
+        self.rows = rows
+        # Backlight pins are active low, so all ones is off.
+        self.backlight_a = (1 << lcd_red) | (1 << lcd_green)
+        self.backlight_b = 1 << (lcd_blue - 8)
+
+        # After a restart the chip may already be banked.  Then 0x05 is
+        # IOCON and this puts it back to BANK = 0; at power on 0x05 is
+        # GPINTENB, which is 0 anyway.
+        self.bus.write_byte_data(address, IOCON, 0x00)
+        self.bus.write_byte_data(address, IOCON_BANK0, BANK | SEQOP)
+        self.bus.write_byte_data(address, IODIRA, 0x00)
+        self.bus.write_byte_data(address, IODIRB, 0x00)
+        self.bus.write_byte_data(address, OLATB, self.backlight_b)
+        # 4-bit mode init (the first one takes over 4.1 ms), then 2 lines,
+        # display on, left to right.
+        self.write([0x33])
+        sleep(0.005)
+        self.write([0x32])
+        sleep(0.001)
+        self.write([LCD_FUNCTIONSET | LCD_2LINE,
+                    LCD_DISPLAYCONTROL | LCD_DISPLAYON,
+                    LCD_ENTRYMODESET | LCD_ENTRYLEFT])
+        self.clear()
+
+    def _port_states(self, value, char_mode):
+        # Port A states to clock one byte in, high nibble first.  The LCD
+        # latches D4-D7 when EN falls.
+        base = self.backlight_a | (char_mode << lcd_rs)
+        high = base | ((value >> 4) & 0x0F) << lcd_d4
+        low = base | (value & 0x0F) << lcd_d4
+        en = 1 << lcd_en
+        return [high | en, high, low | en, low]
+
+    def write(self, values, char_mode=False):
+        # Send a run of bytes (commands, or characters with char_mode).
+        states = []
+        for value in values:
+            states.extend(self._port_states(value, char_mode))
+        for i in range(0, len(states), SMBUS_BLOCK_MAX):
+            self.bus.write_i2c_block_data(self.address, OLATA,
+                                          states[i:i + SMBUS_BLOCK_MAX])
+
+    def clear(self):
+        self.write([LCD_CLEARDISPLAY])
+        sleep(0.003)  # 1.52 ms at 270 kHz, longer on a slow oscillator.
+
+    def home(self):
+        self.write([LCD_RETURNHOME])
+        sleep(0.003)
+
+    def set_cursor(self, col, row):
+        row = min(row, self.rows - 1)
+        self.write([LCD_SETDDRAMADDR | (col + LCD_ROW_OFFSETS[row])])
+
+    def message(self, text):
+        # Write text at the cursor; a newline moves to the next row.
+        for row, line in enumerate(text.split('\n')):
+            if row:
+                self.set_cursor(0, row)
+            self.write(line.encode('ascii', 'replace'), char_mode=True)
+
+    def set_color(self, red, green, blue):
+        # Any non-zero value turns that LED on (no PWM).
+        self.backlight_a = (0 if red else 1 << lcd_red) | \
+            (0 if green else 1 << lcd_green)
+        self.backlight_b = 0 if blue else 1 << (lcd_blue - 8)
+        self.bus.write_byte_data(self.address, OLATA, self.backlight_a)
+        self.bus.write_byte_data(self.address, OLATB, self.backlight_b)
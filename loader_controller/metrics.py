@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Per-stage timing histograms and event counters, exported in the
+# Prometheus text format.
+#
+# Recording only touches a few integers in memory (about a microsecond).
+# The text is built when it is read: by TextfileExporter, which rewrites a
+# file on tmpfs (/run) for node_exporter's textfile collector every few
+# seconds, or by serve(), a small HTTP endpoint on localhost.
+
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+
+# Bucket upper bounds in seconds.  Stages range from a GPIO write (well
+# under a millisecond) to an operator walking over with a barcode.
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+textfile = '/run/loader_controller.prom'  # tmpfs, never the SD card.
+textfile_interval = 15  # Seconds between textfile rewrites.
+
+
+class Timer(object):
+    # with metrics.time('wo_api'): ...  Records even if the block raises,
+    # restarts included.
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = perf_counter() - self.start
+        self.metrics.observe(self.stage, self.elapsed)
+
+
+class Metrics(object):
+
+    def __init__(self, prefix='loader', buckets=buckets, labels=None):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.labels = dict(labels or {})  # Added to every sample, e.g. press.
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [count per bucket..., +Inf, sum]
+        self.counters = {}
+
+    def observe(self, stage, secs):
+        i = bisect_left(self.buckets, secs)
+        with self.lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = [0] * (len(self.buckets) + 1) + \
+                    [0.0]
+            hist[i] += 1
+            hist[-1] += secs
+
+    def time(self, stage):
+        return Timer(self, stage)
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def count(self, stage):
+        # Number of observations for stage.
+        with self.lock:
+            hist = self.stages.get(stage)
+            return sum(hist[:-1]) if hist else 0
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        return '{' + ','.join('%s="%s"' % (k, labels[k])
+                              for k in sorted(labels)) + '}'
+
+    def render(self):
+        with self.lock:
+            stages = dict((k, list(v)) for k, v in self.stages.items())
+            counters = dict(self.counters)
+        name = self.prefix + '_stage_seconds'
+        lines = ['# HELP %s Time spent in each step of the controller.' % name,
+                 '# TYPE %s histogram' % name]
+        for stage in sorted(stages):
+            hist = stages[stage]
+            total = 0
+            for le, n in zip(self.buckets + (float('inf'),), hist):
+                total += n
+                le = '+Inf' if le == float('inf') else repr(le)
+                lines.append('%s_bucket%s %d' %
+                             (name, self._labels(stage=stage, le=le), total))
+            lines.append('%s_sum%s %r' %
+                         (name, self._labels(stage=stage), hist[-1]))
+            lines.append('%s_count%s %d' %
+                         (name, self._labels(stage=stage), total))
+        for counter in sorted(counters):
+            cname = '%s_%s_total' % (self.prefix, counter)
+            lines.append('# TYPE %s counter' % cname)
+            lines.append('%s%s %d' % (cname, self._labels(),
+                                      counters[counter]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=textfile):
+        # Write to a temp file and rename, so the collector never reads a
+        # half-written file.
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class TextfileExporter(object):
+    # Rewrites the textfile in the background.
+
+    def __init__(self, metrics, path=textfile, interval=textfile_interval):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.metrics.write(self.path)
+        except OSError:
+            pass  # Metrics must never take the controller down.
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.write()
+
+
+def serve(metrics, port, host='127.0.0.1'):
+    # Serve GET /metrics from a background thread.  Returns the server.
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+import random
+import time
+import zlib
+
+
+class PollSchedule(object):
+    # Decides how long to wait before the next press status poll.
+    # - The jitter and the starting phase come from a random generator seeded
+    #   with the press ID, so each press gets its own (repeatable) timing and
+    #   a fleet that boots together does not poll together.
+    # - The interval backs off towards max_interval while nothing changes.
+    # - Within changeover_window seconds either side of a scheduled
+    #   changeover it drops to min_interval.
+
+    def __init__(self, press_id, interval=300, min_interval=60,
+                 max_interval=900, jitter=0.2, backoff=1.5,
+                 changeover_window=900):
+        self.rng = random.Random(zlib.crc32(str(press_id).encode('utf-8')))
+        self.phase = self.rng.random()
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.backoff = backoff
+        self.changeover_window = changeover_window
+        self.current = interval
+
+    def first_delay(self):
+        # Spread controllers that start at the same time over one interval.
+        return self.min_interval + \
+            self.phase * (self.interval - self.min_interval)
+
+    def next_delay(self, changed=False, changeover=None, now=None):
+        # changeover is the epoch time of the next scheduled changeover,
+        # if the API gave one.
+        if changed:
+            self.current = self.interval
+        else:
+            self.current = min(self.current * self.backoff, self.max_interval)
+        delay = self.current
+        if changeover is not None:
+            if now is None:
+                now = time.time()
+            if abs(changeover - now) <= self.changeover_window:
+                delay = self.min_interval
+        delay *= 1 + self.jitter * (2 * self.rng.random() - 1)
+        return max(self.min_interval, delay)
+
+    def jittered(self, interval):
+        # interval +/- jitter, for pollers with a fixed rate.
+        return interval * (1 + self.jitter * (2 * self.rng.random() - 1))
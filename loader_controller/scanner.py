@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# USB barcode scanner read straight from its evdev device.
+#
+# The scanner is a keyboard that types the barcode and presses Enter.
+# Reading it through input() on the tty loses or garbles scans that arrive
+# while the program is busy, and blocks whoever is waiting.  EvdevScanner
+# grabs the device (so the keystrokes no longer reach the console), reads
+# raw input_event records on a background thread, puts the keys together
+# into barcodes on Enter and queues each one with its timestamps.  Given a
+# metrics.Metrics, scan() records how long each barcode took to type
+# (scan_typing) and how long it waited in the queue (scan_queued).
+#
+# SimScannerDevice writes the same records into a pipe, at whatever rate a
+# test wants.
+
+import os
+import queue
+import select
+import struct
+import threading
+from collections import namedtuple
+from fcntl import ioctl
+from time import monotonic
+
+
+# struct input_event: struct timeval time; __u16 type, code; __s32 value.
+EVENT = struct.Struct('llHHi')
+EV_SYN = 0
+EV_KEY = 1
+EV_MSC = 4
+MSC_SCAN = 4
+EVIOCGRAB = 0x40044590  # _IOW('E', 0x90, int)
+EVIOCSCLOCKID = 0x400445a0  # _IOW('E', 0xa0, int)
+CLOCK_MONOTONIC = 1
+
+KEY_ENTER = 28
+KEY_KPENTER = 96
+KEY_LEFTSHIFT = 42
+KEY_RIGHTSHIFT = 54
+
+# Key codes (linux/input-event-codes.h) -> (character, shifted character).
+KEYS = {2: '1!', 3: '2@', 4: '3#', 5: '4$', 6: '5%', 7: '6^', 8: '7&',
+        9: '8*', 10: '9(', 11: '0)', 12: '-_', 13: '=+', 52: '.>', 53: '/?',
+        57: '  '}
+for code, row in ((16, 'qwertyuiop'), (30, 'asdfghjkl'), (44, 'zxcvbnm')):
+    for i, char in enumerate(row):
+        KEYS[code + i] = char + char.upper()
+CODES = dict((pair[0], (code, False)) for code, pair in KEYS.items())
+CODES.update((pair[1], (code, True)) for code, pair in KEYS.items())
+
+# barcode, event time of the first and last key, and the time it was
+# queued.  All on the monotonic clock.
+Scan = namedtuple('Scan', 'barcode started finished queued')
+
+
+class BarcodeAssembler(object):
+    # Turns key events into barcodes.  Only key presses count; releases,
+    # autorepeats and other event types are skipped.
+
+    def __init__(self):
+        self.chars = []
+        self.shift = set()
+        self.started = None
+
+    def feed(self, t, type, code, value):
+        # Returns a Scan when Enter completes a barcode, else None.
+        if type != EV_KEY:
+            return None
+        if code in (KEY_LEFTSHIFT, KEY_RIGHTSHIFT):
+            if value:
+                self.shift.add(code)
+            else:
+                self.shift.discard(code)
+            return None
+        if value != 1:
+            return None
+        if code in (KEY_ENTER, KEY_KPENTER):
+            barcode, self.chars = ''.join(self.chars), []
+            started, self.started = self.started, None
+            if not barcode:
+                return None
+            return Scan(barcode, started, t, monotonic())
+        pair = KEYS.get(code)
+        if pair:
+            if self.started is None:
+                self.started = t
+            self.chars.append(pair[1 if self.shift else 0])
+        return None
+
+
+class EvdevScanner(object):
+    # path is the scanner's event device, e.g.
+    # /dev/input/by-id/usb-<scanner>-event-kbd.  fd is an already open one
+    # (SimScannerDevice.fd).  stats is a metrics.Metrics or None.
+
+    def __init__(self, path=None, fd=None, grab=True, stats=None):
+        self.grabbed = False
+        if fd is None:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                # Event times on monotonic() instead of the wall clock.
+                ioctl(fd, EVIOCSCLOCKID, struct.pack('i', CLOCK_MONOTONIC))
+            except OSError:
+                pass
+            if grab:
+                ioctl(fd, EVIOCGRAB, 1)
+                self.grabbed = True
+        self.fd = fd
+        self.wake_fd, self.wake_write_fd = os.pipe()  # close() wakes _run.
+        self.queue = queue.Queue()
+        self.assembler = BarcodeAssembler()
+        self.scans = 0
+        self.last = None  # The Scan scan() returned last.
+        self.stats = stats
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _run(self):
+        buf = b''
+        try:
+            while True:
+                readable = select.select([self.fd, self.wake_fd], [], [])[0]
+                if self.wake_fd in readable:
+                    break  # close()
+                data = os.read(self.fd, EVENT.size * 64)
+                if not data:
+                    break
+                buf += data
+                end = len(buf) - len(buf) % EVENT.size
+                for sec, usec, type, code, value in EVENT.iter_unpack(
+                        buf[:end]):
+                    scan = self.assembler.feed(sec + usec / 1e6, type, code,
+                                               value)
+                    if scan:
+                        self.scans += 1
+                        self.queue.put(scan)
+                buf = buf[end:]
+        except OSError:
+            pass  # Unplugged or closed.
+        self.queue.put(None)  # Tells scan() there is nothing more.
+
+    def get(self, timeout=None):
+        # The next Scan.  Raises queue.Empty on timeout and EOFError once
+        # the device is gone and the queue is empty.
+        scan = self.queue.get(timeout=timeout)
+        if scan is None:
+            self.queue.put(None)
+            raise EOFError('scanner closed')
+        return scan
+
+    def scan(self, prompt=None):
+        # Drop-in for input(prompt).  The Scan itself is kept in last.
+        scan = self.last = self.get()
+        if self.stats:
+            self.stats.observe('scan_typing', scan.finished - scan.started)
+            self.stats.observe('scan_queued', monotonic() - scan.queued)
+        return scan.barcode
+
+    def close(self):
+        # Give the keyboard back and stop the reader before the fd goes:
+        # closing it under a blocked os.read() is not safe.
+        if self.fd is None:
+            return
+        if self.grabbed:
+            try:
+                ioctl(self.fd, EVIOCGRAB, 0)
+            except OSError:
+                pass  # Unplugged.
+            self.grabbed = False
+        os.write(self.wake_write_fd, b'\0')
+        if self.thread:
+            self.thread.join(1)
+        for fd in (self.fd, self.wake_fd, self.wake_write_fd):
+            os.close(fd)
+        self.fd = None
+
+
+class SimScannerDevice(object):
+    # The write end of a pipe that EvdevScanner(fd=...) reads from, fed
+    # with the events a USB scanner sends.
+
+    def __init__(self):
+        self.fd, self.write_fd = os.pipe()
+
+    def events(self, barcode, t=None):
+        # Press and release for every key, with the MSC_SCAN and SYN_REPORT
+        # records a real keyboard sends, then Enter.
+        t = monotonic() if t is None else t
+        sec, usec = int(t), int((t % 1) * 1e6)
+        records = []
+
+        def key(code, value):
+            records.append(EVENT.pack(sec, usec, EV_MSC, MSC_SCAN, code))
+            records.append(EVENT.pack(sec, usec, EV_KEY, code, value))
+            records.append(EVENT.pack(sec, usec, EV_SYN, 0, 0))
+
+        for char in barcode:
+            code, shift = CODES[char]
+            if shift:
+                key(KEY_LEFTSHIFT, 1)
+            key(code, 1)
+            key(code, 0)
+            if shift:
+                key(KEY_LEFTSHIFT, 0)
+        key(KEY_ENTER, 1)
+        key(KEY_ENTER, 0)
+        return b''.join(records)
+
+    def type(self, barcode):
+        data = self.events(barcode)
+        while data:
+            data = data[os.write(self.write_fd, data):]
+
+    def close(self):
+        os.close(self.write_fd)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Periodic tasks on one thread, kept in a heap by deadline.
+#
+# Deadlines are on the monotonic clock and each one is computed from the
+# previous deadline, not from when the task finished, so a slow task does
+# not push the ones after it later and later.  Between tasks the thread
+# sleeps until the earliest deadline, or until woken through an Event.
+
+import heapq
+import threading
+from time import monotonic
+
+
+class Task(object):
+
+    def __init__(self, name, fn, interval, deadline):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.deadline = deadline
+        self.runs = 0
+        self.missed = 0  # Deadlines skipped because the task ran late.
+        self.cancelled = False
+
+
+class Scheduler(object):
+    # clock() and wait(event, secs) default to real time; controller passes
+    # hw.clock and hw.wait so simulated hardware can run faster.
+
+    def __init__(self, clock=monotonic, wait=None, idle=60.0):
+        self.clock = clock
+        self.wait = wait or (lambda event, secs: event.wait(secs))
+        self.idle = idle  # Longest sleep when no task is due.
+        self.heap = []
+        self.tasks = {}
+        self.seq = 0  # Ties on deadline run in the order they were added.
+
+    def add(self, name, fn, interval, delay=None):
+        # Run fn() every interval seconds, first after delay (default:
+        # interval).  If fn returns a number, that is the delay until its
+        # next run instead, for tasks with an adaptive rate.  Intervals and
+        # delays must be more than zero.
+        self.cancel(name)
+        first = interval if delay is None else delay
+        task = Task(name, fn, interval, self.clock() + first)
+        self.tasks[name] = task
+        self._push(task)
+        return task
+
+    def cancel(self, name):
+        task = self.tasks.pop(name, None)
+        if task:
+            task.cancelled = True  # Dropped when it reaches the top.
+
+    def _push(self, task):
+        self.seq += 1
+        heapq.heappush(self.heap, (task.deadline, self.seq, task))
+
+    def next_deadline(self):
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def run_pending(self):
+        # Run every task that is due.  Exceptions propagate; the task that
+        # raised is not rescheduled.
+        ran = 0
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > self.clock():
+                return ran
+            deadline, seq, task = heapq.heappop(self.heap)
+            delay = task.fn()
+            task.runs += 1
+            ran += 1
+            if task.cancelled:
+                continue
+            if delay is None:
+                delay = task.interval
+            task.deadline = deadline + delay
+            now = self.clock()
+            if task.deadline <= now:
+                # Overran one or more periods: skip them, stay in phase.
+                periods = int((now - task.deadline) // delay) + 1
+                task.missed += periods
+                task.deadline += periods * delay
+            self._push(task)
+
+    def step(self, wake=None):
+        # Sleep until the next task is due or wake is set, then run what is
+        # due.  Returns True if woken early.
+        wake = wake or threading.Event()
+        deadline = self.next_deadline()
+        timeout = self.idle if deadline is None else \
+            max(0.0, deadline - self.clock())
+        woken = wake.is_set() or bool(self.wait(wake, timeout))
+        self.run_pending()
+        return woken
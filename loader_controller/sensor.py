@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+import threading
+from time import monotonic, sleep
+
+
+class PalletSensor(object):
+    # Watch the pallet IR sensor with an edge interrupt instead of polling.
+    # The Banner sensor output goes HIGH (1) when the pallet is removed.
+    # on_removed() is called from the GPIO callback thread, so it should only
+    # do something quick and safe, like dropping the relay.
+
+    def __init__(self, io, pin, on_removed=None, bouncetime=50,
+                 debounce=0.002, samples=3):
+        self.io = io  # RPi.GPIO or a module with the same interface.
+        self.pin = pin
+        self.on_removed = on_removed
+        self.bouncetime = bouncetime  # ms, passed to add_event_detect.
+        self.debounce = debounce  # Seconds between confirmation samples.
+        self.samples = samples
+        self.removed = threading.Event()
+        self.removed_at = None  # monotonic() time the removal was confirmed.
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.removed.clear()
+        self.removed_at = None
+        self.io.add_event_detect(self.pin, self.io.RISING,
+                                 callback=self._edge_cb,
+                                 bouncetime=self.bouncetime)
+        # The pallet may have been pulled before the interrupt was armed.
+        self.check()
+
+    def stop(self):
+        self.io.remove_event_detect(self.pin)
+
+    def _edge_cb(self, channel):
+        self.check()
+
+    def check(self):
+        # Software debounce: the pin has to read HIGH on every sample.
+        # Returns True if the pallet is gone.
+        for i in range(self.samples):
+            if self.io.input(self.pin) != 1:
+                return False
+            if i < self.samples - 1:
+                sleep(self.debounce)
+        with self.lock:
+            if self.removed.is_set():
+                return True
+            if self.on_removed:
+                self.on_removed()
+            self.removed_at = monotonic()
+            self.removed.set()
+        return True
+
+    def wait(self, timeout=None):
+        # Block until the pallet is removed or timeout expires.
+        return self.removed.wait(timeout)
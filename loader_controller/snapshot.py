@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Local SQLite snapshot of the press's workorders and recently seen serial
+# numbers, so scans can still be validated while the API is unreachable.
+
+import sqlite3
+import threading
+import time
+
+from .polling import PollSchedule
+
+
+# Seconds between background refreshes.  The snapshot only has to stay
+# newer than the controller's offline_max_age (hours), and a workorder
+# scanned online is saved as it is looked up.
+refresh_interval = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workorders (
+    wo_id TEXT PRIMARY KEY,
+    press TEXT NOT NULL,
+    rmat TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS serials (
+    serial TEXT PRIMARY KEY,
+    itemno TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class Snapshot(object):
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock  # Wall clock, the snapshot outlives reboots.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # Saves happen on the scan path.  In WAL mode with synchronous=NORMAL
+        # a commit is an append to the log, with no fsync; the log is synced
+        # at checkpoints.  A power cut can lose the last few saves, which the
+        # next lookups put back.
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def save_wo(self, wo_id, press, rmat):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO workorders VALUES "
+                            "(?, ?, ?, ?)", (wo_id, press, rmat, self.clock()))
+
+    def save_serial(self, serial, itemno):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO serials VALUES (?, ?, ?)",
+                            (serial, itemno, self.clock()))
+
+    def wo(self, wo_id, max_age):
+        # Return (press, rmat) if the workorder was seen within max_age secs.
+        with self.lock:
+            return self.db.execute(
+                "SELECT press, rmat FROM workorders "
+                "WHERE wo_id = ? AND updated >= ?",
+                (wo_id, self.clock() - max_age)).fetchone()
+
+    def serial(self, serial, max_age):
+        # Return the itemno if the serial was seen within max_age secs.
+        with self.lock:
+            row = self.db.execute(
+                "SELECT itemno FROM serials WHERE serial = ? AND updated >= ?",
+                (serial, self.clock() - max_age)).fetchone()
+        if row:
+            return row[0]
+
+    def prune(self, max_age):
+        with self.lock, self.db:
+            cutoff = self.clock() - max_age
+            self.db.execute("DELETE FROM workorders WHERE updated < ?",
+                            (cutoff,))
+            self.db.execute("DELETE FROM serials WHERE updated < ?", (cutoff,))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SnapshotRefresher(object):
+    # Background thread that keeps the snapshot up to date for one press.
+    # Each pass only asks for this press's running workorder and its upcoming
+    # schedule; serial numbers are added as they are looked up.  Given an
+    # iqapi.PressWatcher, the running workorder is taken from it instead of
+    # another /press request.
+
+    def __init__(self, snapshot, client, press_id, interval=refresh_interval,
+                 keep=7 * 24 * 3600, press_watcher=None):
+        self.snapshot = snapshot
+        self.client = client  # iqapi.IQClient
+        self.press_id = press_id
+        self.press_watcher = press_watcher
+        self.interval = interval
+        self.keep = keep  # Rows older than this are pruned.
+        self.schedule = PollSchedule(press_id)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self):
+        if self.press_watcher:
+            data = self.press_watcher.current() or {}
+        else:
+            data = self.client.get_json('/press/' + self.press_id,
+                                        conditional=True)
+        if 'wo_id' in data:
+            self.snapshot.save_wo(data['wo_id'], self.press_id,
+                                  data['itemno_mat'])
+        resp = self.client.get('/press/' + self.press_id + '/schedule')
+        if resp.status_code == 200:  # Older servers do not have this.
+            for wo in resp.json().get('workorders', []):
+                self.snapshot.save_wo(wo['wo_id'], self.press_id, wo['rmat'])
+        self.snapshot.prune(self.keep)
+
+    def _run(self):
+        # Not needed right away, so spread the fleet's first refresh out.
+        self.stop_event.wait(self.schedule.phase * self.interval)
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass  # Offline.  Keep what we have and try again later.
+            self.stop_event.wait(self.schedule.jittered(self.interval))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# The controller on an asyncio event loop.
+#
+# The scan / validate / run cycle, the scanner, the reset button, the backup
+# pallet poll and the workorder monitor are separate tasks.  Anything that
+# blocks runs on a thread and is awaited: API requests on a small pool, the
+# scanner on a thread of its own.  A request that takes its full 10 second
+# timeout only holds up the task that made it.
+#
+# The relay never waits on the loop.  The pallet sensor interrupt, the reset
+# button and a pushed workorder change drop it from their own threads, then
+# wake the loop to show why and start over.
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import eventlog as log, hardware, iqapi, metrics, polling, sensor
+
+
+class Restart(Exception):
+    # Ends the cycle: message is shown in red for hold seconds (the
+    # station's error_hold by default) and event is logged with fields.
+
+    def __init__(self, message, event, hold=None, **fields):
+        Exception.__init__(self, message)
+        self.message = message
+        self.event = event
+        self.hold = hold
+        self.fields = fields
+
+
+class Station(object):
+    # renderer is a display.LCDRenderer.  offline is a snapshot.Snapshot or
+    # None.
+    # Nothing waits for the operator to read a screen: errors are held on
+    # the LCD (renderer.hold) while the next cycle already takes scans, and
+    # a scan cuts the hold short.  Scans queued before the workorder prompt
+    # (mid-run, during a reset, with no pallet) are dropped.
+    # restart_limit restarts within restart_window seconds means something
+    # is stuck: run() returns with stuck set, for a clean start.
+
+    def __init__(self, hw, api, press_id, renderer, offline=None, stats=None,
+                 press_watcher=None, combined=False, validate_errors=None,
+                 sensor_poll=10, wo_monitor=(300, 60, 300),
+                 offline_max_age=8 * 3600, error_hold=2, network_fail_hold=5,
+                 relay_settle=0, workers=4, watchdog=None, heartbeat=1.0,
+                 restart_limit=20, restart_window=60):
+        self.hw = hw
+        self.io = hw.io
+        self.api = api
+        self.press_id = press_id
+        self.renderer = renderer
+        self.show = renderer.show
+        self.offline = offline
+        self.stats = stats or metrics.Metrics()
+        self.press_watcher = press_watcher
+        self.subscriber = None  # iqapi.PressSubscriber, pauses the monitor.
+        self.combined = combined
+        self.validate_errors = validate_errors or {}
+        self.sensor_poll = sensor_poll
+        self.wo_monitor = wo_monitor  # (interval, min, max) seconds.
+        self.offline_max_age = offline_max_age
+        self.error_hold = error_hold  # Seconds errors are held on the LCD.
+        self.network_fail_hold = network_fail_hold
+        self.relay_settle = relay_settle
+        self.workers = workers
+        self.watchdog = watchdog  # watchdog.RelayWatchdog or None.
+        self.heartbeat = heartbeat  # Seconds between watchdog kicks.
+        self.restarts = deque(maxlen=restart_limit)  # clock() of each.
+        self.restart_window = restart_window
+        self.stuck = False
+        self.speed = getattr(hw, 'speed', 1.0)  # SimHardware runs faster.
+        self.relay_lock = threading.Lock()
+        self.armed = False  # The relay may only go on while this is set.
+        self.running = None  # (wo_id, rmat) while the loader is running.
+        self.cycles = 0  # Workorder prompts shown.
+        self.loop = None
+        self.started = threading.Event()
+
+    # Called from other threads.
+
+    def stop(self):
+        self.started.wait()
+        try:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        except RuntimeError:
+            pass  # Already finished.
+
+    def push(self, data):
+        # A press status from PressSubscriber or PressWatcher's poll, which
+        # stand in for the workorder monitor.  Drops the relay right away
+        # if the running workorder or its material changed.
+        if self.press_watcher:
+            self.press_watcher.update(data)
+        running = self.running
+        if running is None or self.loop is None:
+            return
+        if data.get('wo_id') != running[0] or \
+                (running[1] and data.get('itemno_mat') != running[1]):
+            self._stop_now(self.changed)
+
+    def _stop_now(self, event):
+        # Drop the relay first, then wake the loop.
+        with self.relay_lock:
+            self.armed = False
+            self.io.output(hardware.ssr_pin, 0)
+        try:
+            self.loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # The loop has already finished.
+
+    def _reset_cb(self, channel):
+        self._stop_now(self.reset)
+
+    def _read_scans(self):
+        # The scanner blocks this thread only.  Barcodes are queued, so one
+        # scanned while the cycle is busy is used when it asks for the next.
+        # drop_scans() clears out the rest at the start of the next cycle.
+        while True:
+            try:
+                barcode = self.hw.scan("Scan: ")
+            except EOFError:
+                barcode = None
+            try:
+                if barcode is None:
+                    self.loop.call_soon_threadsafe(self.stopping.set)
+                    return
+                self.loop.call_soon_threadsafe(self.scans.put_nowait,
+                                               barcode)
+            except RuntimeError:
+                return  # The loop has already finished.
+
+    # Relay.
+
+    def relay_on(self):
+        # Returns False if the relay was dropped since the cycle armed it.
+        with self.relay_lock:
+            if self.armed:
+                self.io.output(hardware.ssr_pin, 1)
+            return self.armed
+
+    def relay_off(self):
+        with self.relay_lock:
+            self.armed = False
+            self.io.output(hardware.ssr_pin, 0)
+
+    # The loop.
+
+    def run(self, boot=True):
+        # Blocks until the scanner runs out, stop() is called or the
+        # station is stuck.
+        asyncio.run(self.main(boot))
+
+    def sleep(self, secs):
+        return asyncio.sleep(secs / self.speed)
+
+    def hold(self, msg, color, secs):
+        self.renderer.hold(msg, color, secs / self.speed)
+
+    def drop_scans(self):
+        # A barcode scanned before the workorder prompt was not meant for
+        # this cycle; it must not be taken as the workorder.
+        dropped = 0
+        while not self.scans.empty():
+            self.scans.get_nowait()
+            dropped += 1
+        if dropped:
+            log.debug('scans_dropped', count=dropped)
+            self.stats.inc('scans_dropped', dropped)
+
+    async def next_scan(self):
+        barcode = await self.scans.get()
+        self.renderer.release()  # The operator has moved on.
+        return barcode
+
+    async def call(self, fn, *args):
+        # Run a blocking call on the request pool.
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def main(self, boot=True):
+        self.loop = asyncio.get_running_loop()
+        self.scans = asyncio.Queue()
+        self.stopping = asyncio.Event()
+        self.reset = asyncio.Event()
+        self.changed = asyncio.Event()
+        self.executor = ThreadPoolExecutor(self.workers)
+        self.io.add_event_detect(hardware.rst_btn, self.io.RISING,
+                                 callback=self._reset_cb, bouncetime=300)
+        reader = threading.Thread(target=self._read_scans)
+        reader.daemon = True
+        reader.start()
+        self.started.set()
+        try:
+            if boot:
+                log.event('boot', press=self.press_id)
+                self.hold("LOADER CONTROLLER\n\n\nPRESS " + self.press_id,
+                          'white', 2)
+            while not self.stopping.is_set():
+                await self._supervise(self.cycle())
+        finally:
+            self.relay_off()
+            self.io.remove_event_detect(hardware.rst_btn)
+            self.executor.shutdown(wait=False)
+
+    async def _supervise(self, cycle):
+        # Run one cycle, cut short by the reset button or stop().
+        cycle = asyncio.ensure_future(cycle)
+        reset = asyncio.ensure_future(self.reset.wait())
+        stopping = asyncio.ensure_future(self.stopping.wait())
+        tasks = (cycle, reset, stopping)
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if not cycle.cancelled() and cycle.exception():
+            raise cycle.exception()
+        if self.reset.is_set() and not self.stopping.is_set():
+            log.event('reset')
+            self.stats.inc('resets')
+            self.hold("RESETTING\nLOADER\nCONTROLLER", 'white', 1)
+            self.reset.clear()
+
+    async def cycle(self):
+        try:
+            await self._cycle()
+        except Restart as e:
+            self.relay_off()
+            log.event(e.event, **e.fields)
+            log.event('restart')
+            self.stats.inc('restarts')
+            self.hold(e.message, 'red',
+                      self.error_hold if e.hold is None else e.hold)
+            self.restarts.append(self.hw.clock())
+            if len(self.restarts) == self.restarts.maxlen and \
+                    self.restarts[-1] - self.restarts[0] < \
+                    self.restart_window:
+                self.stuck = True
+                self.stopping.set()
+        finally:
+            self.relay_off()
+
+    async def _cycle(self):
+        with self.stats.time('sensor_check'):
+            await self.wait_for_pallet()
+
+        self.drop_scans()
+        self.cycles += 1
+        self.show("SCAN\n\nWORKORDER NUMBER", 'white')
+        with self.stats.time('wo_scan') as timer:
+            wo_id = await self.next_scan()
+        log.event('wo_scanned', wo=wo_id, latency=timer.elapsed)
+
+        if self.combined:
+            serial = await self.scan_serial()
+            with self.stats.time('validate_api') as timer:
+                rmat = await self.validate(wo_id, serial)
+            log.event('validate_api', wo=wo_id, serial=serial, rmat=rmat,
+                      latency=timer.elapsed)
+        else:
+            rmat = await self.check_wo(wo_id)
+            serial = await self.scan_serial()
+            with self.stats.time('serial_api') as timer:
+                itemno = await self.lookup_serial(serial)
+            log.event('serial_api', serial=serial, rmat=itemno,
+                      latency=timer.elapsed)
+            if itemno != rmat:
+                raise Restart("INCORRECT\nMATERIAL!", 'material_mismatch',
+                              wo=wo_id, serial=serial, rmat=itemno,
+                              expected=rmat)
+        await self.run_loader(wo_id, rmat)
+
+    async def wait_for_pallet(self):
+        waited = False
+        while self.io.input(hardware.ir_pin) == 1:
+            log.debug('no_pallet')
+            self.show("NO PALLET DETECTED!\n\nCHECKING AGAIN\nIN 10 SECS",
+                      'red')
+            waited = True
+            await self.sleep(10)
+        if waited:
+            self.hold("PALLET DETECTED\n\nCONTINUING", 'white', 2)
+
+    async def scan_serial(self):
+        self.show("SCAN\nRAW MATERIAL\nSERIAL NUMBER", 'white')
+        with self.stats.time('serial_scan') as timer:
+            barcode = await self.next_scan()
+        if not barcode.startswith('S'):
+            raise Restart("NOT A VALID\nSERIAL NUMBER!", 'serial_unqualified',
+                          barcode=barcode)
+        serial = barcode[1:]  # Strip off the "S" qualifier.
+        log.event('serial_scanned', serial=serial, latency=timer.elapsed)
+        return serial
+
+    def network_fail(self):
+        return Restart("NETWORK FAILURE\nIf this persists\n"
+                       "contact TPI IT Dept.\nRestarting...", 'network_fail',
+                       hold=self.network_fail_hold)
+
+    def fields(self, endpoint, data, *names):
+        # The named fields of an API answer.  An incomplete answer is a
+        # network failure, as in the threaded core.
+        try:
+            return [data[name] for name in names]
+        except (KeyError, TypeError):
+            log.warning('api_incomplete', endpoint=endpoint, data=data)
+            raise self.network_fail()
+
+    def offline_notice(self):
+        log.warning('offline_mode')
+        self.show("NETWORK DOWN\n\nUSING SAVED\nINFORMATION...", 'blue')
+
+    async def lookup(self, endpoint, key):
+        # api.lookup(), or None if the API could not be reached.
+        try:
+            return await self.call(self.api.lookup, endpoint, key)
+        except Exception as e:
+            log.warning('api_failed', endpoint=endpoint, error=repr(e))
+            return None
+
+    async def check_wo(self, wo_id):
+        # Returns the workorder's raw material if it is for this press.
+        running = self.press_watcher.current() if self.press_watcher \
+            else None
+        if running and running.get('wo_id') == wo_id and \
+                running.get('itemno_mat'):
+            press, rmat = self.press_id, running['itemno_mat']
+            log.event('wo_api', wo=wo_id, press=press, rmat=rmat,
+                      prefetched=True)
+        else:
+            self.show("GETTING\nWORKORDER\nINFORMATION...", 'blue')
+            with self.stats.time('wo_api') as timer:
+                data = await self.lookup('wo', wo_id)
+            if data is None:
+                row = self.offline and \
+                    self.offline.wo(wo_id, self.offline_max_age)
+                if not row:
+                    raise self.network_fail()
+                self.offline_notice()
+                press, rmat = row
+            elif data.get('error'):
+                raise Restart("INVALID WORKORDER!", 'wo_invalid', wo=wo_id)
+            else:
+                press, rmat = self.fields('wo', data, 'press', 'rmat')
+                if self.offline:
+                    self.offline.save_wo(wo_id, press, rmat)
+            log.event('wo_api', wo=wo_id, press=press, rmat=rmat,
+                      latency=timer.elapsed)
+        if press != self.press_id:
+            raise Restart("INCORRECT\nWORKORDER!", 'wo_wrong_press',
+                          wo=wo_id, wo_press=press)
+        return rmat
+
+    async def lookup_serial(self, serial):
+        self.show("GETTING\nRAW MATERIAL\nSERIAL NUMBER\nINFORMATION...",
+                  'blue')
+        data = await self.lookup('serial', serial)
+        if data is None:
+            itemno = self.offline and \
+                self.offline.serial(serial, self.offline_max_age)
+            if itemno is None:
+                raise self.network_fail()
+            self.offline_notice()
+            return itemno
+        if data.get('error'):
+            raise Restart("INVALID SERIAL\nNUMBER!", 'serial_invalid',
+                          serial=serial)
+        itemno, = self.fields('serial', data, 'itemno')
+        if self.offline:
+            self.offline.save_serial(serial, itemno)
+        return itemno
+
+    async def validate(self, wo_id, serial):
+        # One /validate request.  Returns the raw material if both are good.
+        self.show("CHECKING\nWORKORDER AND\nRAW MATERIAL...", 'blue')
+        try:
+            result = await self.call(self.api.validate, self.press_id,
+                                     wo_id, serial)
+        except Exception as e:
+            log.warning('api_failed', endpoint='validate', error=repr(e))
+            wo = self.offline and self.offline.wo(wo_id, self.offline_max_age)
+            itemno = self.offline and \
+                self.offline.serial(serial, self.offline_max_age)
+            if not wo or itemno is None:
+                raise self.network_fail()
+            self.offline_notice()
+            result = iqapi.verdict(self.press_id,
+                                   {'press': wo[0], 'rmat': wo[1]},
+                                   {'itemno': itemno})
+        valid, = self.fields('validate', result, 'valid')
+        if not valid:
+            reason = result.get('reason')
+            raise Restart(self.validate_errors.get(reason, "INVALID SCAN!"),
+                          'validation_failed', wo=wo_id, serial=serial,
+                          reason=reason)
+        press, rmat, itemno = self.fields('validate', result, 'press', 'rmat',
+                                          'itemno')
+        if self.offline:
+            self.offline.save_wo(wo_id, press, rmat)
+            self.offline.save_serial(serial, itemno)
+        return rmat
+
+    async def run_loader(self, wo_id, rmat):
+        # Energize the relay and hold it until the pallet is pulled or the
+        # workorder changes.  The sensor is armed before the relay, so a
+        # pallet pulled during the settle time keeps it off.
+        gone = asyncio.Event()
+        stalled = asyncio.Event()
+        self.changed.clear()
+        self.armed = True
+        pallet = sensor.PalletSensor(self.io, hardware.ir_pin,
+                                     on_removed=lambda: self._stop_now(gone))
+        pallet.start()
+        watchers = [asyncio.ensure_future(self._poll_pallet(pallet))]
+        if not self.press_watcher:  # Its polls come in through push().
+            watchers.append(asyncio.ensure_future(self._monitor(wo_id)))
+        waits = [asyncio.ensure_future(gone.wait()),
+                 asyncio.ensure_future(self.changed.wait()),
+                 asyncio.ensure_future(stalled.wait())]
+        try:
+            with self.stats.time('relay_on') as timer:
+                if self.relay_settle:
+                    await self.sleep(self.relay_settle)
+                on = self.relay_on()
+            if on:
+                if self.watchdog:
+                    self.watchdog.arm(lambda: self._stop_now(stalled))
+                    watchers.append(asyncio.ensure_future(self._kick()))
+                self.running = (wo_id, rmat)
+                log.event('relay_on', wo=wo_id, rmat=rmat,
+                          latency=timer.elapsed)
+                self.show("PRESS: " + self.press_id + "\nWORKORDER: " +
+                          wo_id + "\n\nLOADER RUNNING", 'green')
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if self.watchdog:
+                self.watchdog.disarm()
+            self.running = None
+            pallet.stop()
+            for task in watchers + waits:
+                task.cancel()
+            await asyncio.gather(*(watchers + waits), return_exceptions=True)
+        if gone.is_set():
+            raise Restart("NO PALLET DETECTED\n\nRESTARTING",
+                          'pallet_removed')
+        if stalled.is_set():
+            raise Restart("CONTROLLER STALLED\n\nRESTARTING", 'stalled',
+                          wo=wo_id)
+        raise Restart("WORKORDER CHANGED!\n\nRESTARTING", 'wo_changed',
+                      wo=wo_id)
+
+    async def _kick(self):
+        # Stops with the loop: if this task cannot run, nothing else can.
+        while True:
+            self.watchdog.kick()
+            await self.sleep(self.heartbeat)
+
+    async def _poll_pallet(self, pallet):
+        # Backup for a missed edge.  check() takes a few milliseconds of
+        # debounce samples, cheaper than a hop to a thread.
+        while True:
+            await self.sleep(self.sensor_poll)
+            pallet.check()
+
+    async def _monitor(self, wo_id):
+        # Without a press_watcher, poll /press/<press_id> on a jittered,
+        # adaptive schedule while the events stream is down.  A stalled
+        # request only delays this task.
+        poll = polling.PollSchedule(self.press_id, *self.wo_monitor)
+        delay = poll.first_delay()
+        while True:
+            await self.sleep(delay)
+            changeover = None
+            if not (self.subscriber and self.subscriber.connected):
+                try:
+                    with self.stats.time('wo_monitor'):
+                        data = await self.call(self.api.get_json,
+                                               '/press/' + self.press_id,
+                                               True)
+                except Exception as e:
+                    log.warning('wo_monitor_failed', error=repr(e))
+                else:
+                    log.debug('wo_monitor', wo=wo_id,
+                              running=data.get('wo_id'))
+                    self.push(data)
+                    changeover = data.get('next_changeover')
+            delay = poll.next_delay(changeover=changeover)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim: autoindent shiftwidth=4 expandtab textwidth=80 tabstop=4 softtabstop=4
+
+# Relay watchdog.
+#
+# While the loader runs, the controller's main loop kicks the watchdog every
+# second or so.  If it misses kicks for timeout seconds (a hung request, a
+# deadlock, a stalled SD card), the watchdog thread drops the relay itself,
+# at most timeout + timeout / 10 seconds after the last kick.
+#
+# With the hardware daemon (hwdaemon.py) every kick also renews the relay's
+# lease there, so the daemon drops the relay if this whole process stalls or
+# dies.
+#
+# The watchdog thread can hang too.  With a device (DeviceWatchdog on
+# /dev/watchdog) it pets the board's hardware watchdog on every check; if
+# the thread stops, the board resets, and the relay output goes low with it.
+
+import fcntl
+import os
+import struct
+import threading
+from time import monotonic
+
+from . import eventlog as log
+
+
+WDIOC_SETTIMEOUT = 0xC0045706  # _IOWR('W', 6, int), linux/watchdog.h
+
+
+class DeviceWatchdog(object):
+    # The Linux watchdog device.  The Pi's bcm2835_wdt allows up to 15 s.
+
+    def __init__(self, path='/dev/watchdog', timeout=15):
+        self.fd = os.open(path, os.O_WRONLY)
+        try:
+            fcntl.ioctl(self.fd, WDIOC_SETTIMEOUT, struct.pack('I', timeout))
+        except OSError:
+            pass  # Keep the driver's default.
+
+    def pet(self):
+        os.write(self.fd, b'\0')
+
+    def close(self):
+        # 'V' first (the magic close), so a clean exit does not reset the
+        # board.
+        os.write(self.fd, b'V')
+        os.close(self.fd)
+
+
+class SimWatchdogDevice(object):
+    # Stands in for DeviceWatchdog: expired() says whether the board would
+    # have been reset by now.
+
+    def __init__(self, timeout=15, clock=monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.last = clock()
+        self.pets = 0
+        self.closed = False
+
+    def pet(self):
+        self.last = self.clock()
+        self.pets += 1
+
+    def close(self):
+        self.closed = True
+
+    def expired(self):
+        return not self.closed and self.clock() - self.last > self.timeout
+
+
+class RelayWatchdog(object):
+    # arm(drop) when the relay goes on, kick() from the main loop while it
+    # runs, disarm() when it goes off.  drop() is called from the watchdog
+    # thread, so it should only do something quick, like dropping the relay.
+    # clock and wait default to real time; the controller passes hw.clock and
+    # hw.wait so simulated hardware can run faster.  renew() is called on
+    # arm() and every kick (RemoteHardware.renew).
+
+    def __init__(self, timeout=5.0, clock=monotonic, wait=None, device=None,
+                 renew=None):
+        self.timeout = timeout
+        self.renew = renew
+        self.period = timeout / 10.0  # Checks, and device pets.
+        self.clock = clock
+        self.wait = wait or (lambda event, secs: event.wait(secs))
+        self.device = device
+        self.lock = threading.Lock()
+        self.drop = None  # Set while armed.
+        self.last = None  # clock() of the last kick.
+        self.tripped = False
+        self.trips = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def arm(self, drop):
+        with self.lock:
+            self.drop = drop
+            self.last = self.clock()
+            self.tripped = False
+        if self.renew:
+            self.renew()
+
+    def kick(self):
+        self.last = self.clock()
+        if self.renew:
+            self.renew()
+
+    def disarm(self):
+        # Also forgets a trip, which the run that tripped has dealt with.
+        with self.lock:
+            self.drop = None
+            self.tripped = False
+
+    def check(self):
+        # Returns True if it tripped.
+        with self.lock:
+            if self.drop is None:
+                return False
+            stalled = self.clock() - self.last
+            if stalled < self.timeout:
+                return False
+            drop, self.drop = self.drop, None
+            self.tripped = True
+            self.trips += 1
+        drop()
+        log.error('watchdog_tripped', stalled=stalled)
+        return True
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.check()
+            if self.device:
+                self.device.pet()
+            self.wait(self.stop_event, self.period)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.device:
+            self.device.close()
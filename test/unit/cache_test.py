@@ -0,0 +1,78 @@
+import unittest
+
+from loader_controller import iqapi
+from loader_controller.cache import TTLCache
+from bench.mockapi import MockIQAPI
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, clock=self.clock)
+
+    def test_entry_expires_after_ttl(self):
+        self.cache.set('a', 1, ttl=10)
+        self.clock.now = 9.9
+        self.assertEqual(1, self.cache.get('a'))
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual({'size': 0, 'hits': 1, 'negative_hits': 0,
+                          'misses': 1, 'evictions': 0}, self.cache.stats())
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1, ttl=10)
+        self.cache.set('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.set('c', 3, ttl=10)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+        self.assertEqual(1, self.cache.stats()['evictions'])
+
+
+class TestCachedLookup(unittest.TestCase):
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.client = iqapi.IQClient(self.api.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def test_rescan_is_served_from_cache(self):
+        first = self.client.lookup('serial', '1000001')
+        second = self.client.lookup('serial', '1000001')
+        self.assertEqual(first, second)
+        self.assertEqual(1, self.api.requests)
+        self.assertEqual(1, self.client.cache.stats()['hits'])
+
+    def test_invalid_answer_is_negative_cached(self):
+        self.client.lookup('serial', '999')
+        data = self.client.lookup('serial', '999')
+        self.assertIn('error', data)
+        self.assertEqual(1, self.api.requests)
+        self.assertEqual(1, self.client.cache.stats()['negative_hits'])
+
+    def test_error_false_is_a_good_answer(self):
+        self.api.serials['1000003'] = {'error': False, 'itemno': 'RM-PP-2001'}
+        self.client.lookup('serial', '1000003')
+        self.client.lookup('serial', '1000003')
+        self.assertEqual(1, self.client.cache.stats()['hits'])
+        self.assertEqual(0, self.client.cache.stats()['negative_hits'])
+
+    def test_endpoint_without_ttl_is_not_cached(self):
+        self.client.lookup('press', '136')
+        self.client.lookup('press', '136')
+        self.assertEqual(2, self.api.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
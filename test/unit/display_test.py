@@ -0,0 +1,148 @@
+import random
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller.display import FrameBufferLCD, LCDRenderer
+from bench.simlcd import SimSMBus, AdafruitRGBLCDModel
+
+
+SCREENS = [
+    ("SCAN\n\nWORKORDER NUMBER", 'white'),
+    ("GETTING\nWORKORDER\nINFORMATION...", 'blue'),
+    ("SCAN\nRAW MATERIAL\nSERIAL NUMBER", 'white'),
+    ("PRESS: 136\nWORKORDER: 9934386\n\nLOADER RUNNING", 'green'),
+    ("NO PALLET DETECTED\n\nRESTARTING", 'red'),
+    ("NETWORK FAILURE\nIf this persists\ncontact TPI IT Dept.\n \
+             Restarting...", 'red'),
+]
+
+
+class TestFrameBufferLCD(unittest.TestCase):
+    def setUp(self):
+        self.bus = SimSMBus()
+        self.lcd = AdafruitRGBLCDModel(self.bus)
+        self.screen = FrameBufferLCD(self.lcd)
+
+    def test_screen_matches_frame(self):
+        rng = random.Random(1)
+        for i in range(50):
+            msg, color = rng.choice(SCREENS)
+            self.screen.show(msg, color)
+            self.assertEqual(self.screen.frame(msg), self.lcd.screen())
+
+    def test_same_screen_sends_nothing(self):
+        self.screen.show(*SCREENS[0])
+        before = self.bus.transactions
+        self.screen.show(*SCREENS[0])
+        self.assertEqual(before, self.bus.transactions)
+
+    def test_color_only_set_when_changed(self):
+        self.screen.show("A", 'white')
+        self.screen.show("B", 'white')
+        before = self.bus.transactions
+        self.screen.show("B", 'red')
+        self.assertEqual(before + 1, self.bus.transactions)
+
+    def test_changed_cells_only(self):
+        self.screen.show("PRESS: 136\nWORKORDER: 9934386", 'green')
+        before = self.bus.transactions
+        self.screen.show("PRESS: 136\nWORKORDER: 9934387", 'green')
+        # One set_cursor and one character, 9 transactions each.
+        self.assertEqual(before + 18, self.bus.transactions)
+
+
+class SlowLCD(AdafruitRGBLCDModel):
+    # Blocks in message() until release is set, like a slow I2C bus.
+
+    def __init__(self, bus):
+        AdafruitRGBLCDModel.__init__(self, bus)
+        self.release = threading.Event()
+        self.messages = []
+        self.fail = False
+
+    def message(self, text):
+        self.release.wait(5)
+        if self.fail:
+            self.fail = False
+            raise IOError("I2C write failed")
+        self.messages.append(text)
+        AdafruitRGBLCDModel.message(self, text)
+
+
+class TestLCDRenderer(unittest.TestCase):
+    def setUp(self):
+        self.lcd = SlowLCD(SimSMBus())
+        self.screen = FrameBufferLCD(self.lcd)
+        self.renderer = LCDRenderer(self.screen)
+
+    def test_show_does_not_wait_for_lcd(self):
+        self.renderer.show(*SCREENS[0])
+        self.assertFalse(self.renderer.flush(0.05))
+        self.lcd.release.set()
+        self.assertTrue(self.renderer.flush(5))
+        self.assertEqual(self.screen.frame(SCREENS[0][0]), self.lcd.screen())
+
+    def test_latest_screen_wins(self):
+        self.renderer.show(*SCREENS[0])
+        for msg, color in SCREENS[1:]:
+            self.renderer.show(msg, color)
+        self.lcd.release.set()
+        self.assertTrue(self.renderer.flush(5))
+        # The first screen was already being drawn, everything between it
+        # and the last one was superseded.
+        self.assertLessEqual(self.renderer.drawn, 2)
+        self.assertEqual(self.renderer.drawn + self.renderer.dropped,
+                         len(SCREENS))
+        self.assertEqual(self.screen.frame(SCREENS[-1][0]),
+                         self.lcd.screen())
+
+    def test_keeps_drawing_after_lcd_error(self):
+        self.lcd.fail = True
+        self.lcd.release.set()
+        self.renderer.show(*SCREENS[0])
+        self.assertTrue(self.renderer.flush(5))
+        self.renderer.show(*SCREENS[1])
+        self.assertTrue(self.renderer.flush(5))
+        self.assertEqual(self.screen.frame(SCREENS[1][0]), self.lcd.screen())
+
+    def test_stop_draws_pending_screen(self):
+        self.lcd.release.set()
+        self.renderer.show(*SCREENS[0])
+        self.renderer.stop()
+        self.assertFalse(self.renderer.thread.is_alive())
+        self.assertEqual(self.screen.frame(SCREENS[0][0]), self.lcd.screen())
+
+    def test_hold_defers_later_screens(self):
+        self.lcd.release.set()
+        start = monotonic()
+        self.renderer.hold(*SCREENS[4], secs=0.2)
+        self.renderer.show(*SCREENS[0])
+        self.renderer.show(*SCREENS[2])
+        self.assertTrue(self.renderer.flush(5))
+        self.assertEqual(self.screen.frame(SCREENS[4][0]), self.lcd.screen())
+        while self.screen.shadow != self.screen.frame(SCREENS[2][0]):
+            self.assertLess(monotonic() - start, 5)
+            sleep(0.005)
+        self.assertGreaterEqual(monotonic() - start, 0.2)
+        self.assertEqual(1, self.renderer.dropped)
+
+    def test_release_ends_hold(self):
+        self.lcd.release.set()
+        self.renderer.hold(*SCREENS[4], secs=60)
+        self.renderer.show(*SCREENS[1])
+        self.assertTrue(self.renderer.flush(5))
+        self.renderer.release()
+        self.assertTrue(self.renderer.flush(5))
+        self.assertEqual(self.screen.frame(SCREENS[1][0]), self.lcd.screen())
+
+    def test_stop_draws_deferred_screen(self):
+        self.lcd.release.set()
+        self.renderer.hold(*SCREENS[4], secs=60)
+        self.renderer.show(*SCREENS[0])
+        self.renderer.stop()
+        self.assertEqual(self.screen.frame(SCREENS[0][0]), self.lcd.screen())
+
+
+if __name__ == '__main__':
+    unittest.main()
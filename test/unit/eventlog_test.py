@@ -0,0 +1,110 @@
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import unittest
+from time import monotonic
+
+from loader_controller import eventlog
+
+
+class SlowStream(object):
+    # A console that takes 100 ms per write, like a stalled serial tty.
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        threading.Event().wait(0.1)
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'loader.log')
+        eventlog.context.clear()
+        self.addCleanup(eventlog.context.clear)
+
+    def records(self, path=None):
+        with open(path or self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_structured_records(self):
+        writer = eventlog.LogWriter(self.path).start()
+        eventlog.context['press'] = '136'
+        eventlog.event('serial_api', serial='1000001', latency=0.05)
+        eventlog.debug('run_mode')  # Below the writer's level.
+        writer.stop()
+        records = self.records()
+        self.assertEqual(1, len(records))
+        self.assertEqual({'level': 'info', 'event': 'serial_api',
+                          'press': '136', 'serial': '1000001',
+                          'latency': 0.05},
+                         dict((k, v) for k, v in records[0].items()
+                              if k != 'time'))
+
+    def test_slow_console_does_not_block(self):
+        stream = SlowStream()
+        writer = eventlog.LogWriter(self.path, echo=stream,
+                                    echo_level=eventlog.logging.INFO).start()
+        start = monotonic()
+        for i in range(10):
+            eventlog.event('wo_scanned', wo=str(i))
+        self.assertLess(monotonic() - start, 0.05)
+        writer.stop()
+        self.assertEqual(10, len(stream.lines))
+        self.assertEqual(10, len(self.records()))
+
+    def test_full_queue_drops(self):
+        writer = eventlog.LogWriter(self.path)
+        writer.queue = writer.handler.queue = queue.Queue(2)
+        eventlog.logger.setLevel(eventlog.logging.INFO)
+        eventlog.logger.addHandler(writer.handler)
+        try:
+            for i in range(5):
+                eventlog.event('wo_scanned', wo=str(i))
+        finally:
+            eventlog.logger.removeHandler(writer.handler)
+        self.assertEqual(3, writer.handler.dropped)
+
+    def test_rotation(self):
+        writer = eventlog.LogWriter(self.path, max_bytes=200, backups=2,
+                                    batch=1).start()
+        for i in range(20):
+            eventlog.event('wo_scanned', wo=str(i))
+        writer.stop()
+        self.assertEqual(['loader.log', 'loader.log.1', 'loader.log.2'],
+                         sorted(os.listdir(self.tmp)))
+        # Newest records are in the current file.
+        newest = self.records() or self.records(self.path + '.1')
+        self.assertEqual('19', newest[-1]['wo'])
+
+    def test_root_handler_is_not_called(self):
+        stream = SlowStream()
+        root = eventlog.logging.StreamHandler(stream)
+        eventlog.logging.getLogger().addHandler(root)
+        self.addCleanup(eventlog.logging.getLogger().removeHandler, root)
+        writer = eventlog.LogWriter(self.path).start()
+        start = monotonic()
+        eventlog.event('relay_on')
+        self.assertLess(monotonic() - start, 0.05)
+        writer.stop()
+        self.assertEqual([], stream.lines)
+        self.assertEqual(1, len(self.records()))
+
+    def test_unwritable_path(self):
+        writer = eventlog.LogWriter('/nonexistent/loader.log').start()
+        eventlog.event('boot')
+        writer.stop()
+        self.assertEqual(0, writer.written)
+
+
+if __name__ == '__main__':
+    unittest.main()
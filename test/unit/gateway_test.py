@@ -0,0 +1,87 @@
+import queue
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import iqapi
+from loader_controller.gateway import Gateway
+from bench.mockapi import MockIQAPI
+
+
+class TestGateway(unittest.TestCase):
+    def setUp(self):
+        self.api = MockIQAPI(latency=0.3).start()
+        self.gateway = Gateway(self.api.url, host='127.0.0.1', port=0).start()
+
+    def tearDown(self):
+        self.gateway.stop()
+        self.api.stop()
+
+    def test_press_answer_is_cached(self):
+        client = iqapi.IQClient(self.gateway.url)
+        for i in range(3):
+            self.assertEqual('9934386', client.get_json('/press/136')['wo_id'])
+        client.close()
+        self.assertEqual(1, self.api.requests)
+
+    def test_unchanged_press_answer_is_304(self):
+        client = iqapi.IQClient(self.gateway.url)
+        first = client.get_json('/press/136', conditional=True)
+        second = client.get_json('/press/136', conditional=True)
+        client.close()
+        self.assertEqual(first, second)
+        self.assertEqual(1, client.revalidation_stats()['not_modified'])
+
+    def test_concurrent_requests_are_coalesced(self):
+        results = []
+
+        def poll():
+            client = iqapi.IQClient(self.gateway.url)
+            results.append(client.get_json('/wo/9934386'))
+            client.close()
+
+        threads = [threading.Thread(target=poll) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(20, len(results))
+        self.assertEqual(1, self.api.requests)
+        self.assertEqual(19, self.gateway.stats()['coalesced'])
+
+    def test_events_are_relayed(self):
+        self.api.heartbeat = 0.2
+        updates = queue.Queue()
+        subscriber = iqapi.PressSubscriber(self.gateway.url, '136',
+                                           updates.put, retry=0.05).start()
+        self.addCleanup(subscriber.stop)
+        self.assertEqual('9934386', updates.get(timeout=5)['wo_id'])
+        self.assertTrue(subscriber.connected)
+        changed_at = monotonic()
+        self.api.set_press('136', wo_id='9934390')
+        self.assertEqual('9934390', updates.get(timeout=1)['wo_id'])
+        self.assertLess(monotonic() - changed_at, 1)
+        self.assertEqual(1, self.gateway.stats()['streams'])
+
+    def test_upstream_without_events_is_404(self):
+        self.api.events = False
+        subscriber = iqapi.PressSubscriber(self.gateway.url, '136',
+                                           lambda data: None).start()
+        self.addCleanup(subscriber.stop)
+        deadline = monotonic() + 5
+        while subscriber.supported:
+            self.assertLess(monotonic(), deadline)
+            sleep(0.001)
+
+    def test_upstream_failure_is_not_json(self):
+        # Nothing listens on port 1, so every upstream call fails.
+        gateway = Gateway('http://127.0.0.1:1', host='127.0.0.1',
+                          port=0).start()
+        client = iqapi.IQClient(gateway.url)
+        self.assertEqual(502, client.get('/press/136').status_code)
+        self.assertRaises(ValueError, client.get_json, '/press/136')
+        client.close()
+        gateway.stop()
+
+if __name__ == '__main__':
+    unittest.main()
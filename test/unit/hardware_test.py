@@ -0,0 +1,73 @@
+import threading
+import unittest
+from time import monotonic
+
+from loader_controller import hardware
+
+
+class TestSimGPIO(unittest.TestCase):
+    def setUp(self):
+        self.io = hardware.SimGPIO()
+        hardware.setup_pins(self.io)
+
+    def test_relay_starts_off(self):
+        self.assertEqual(0, self.io.outputs[hardware.ssr_pin])
+
+    def test_callback_only_on_matching_edge(self):
+        edges = []
+        fired = threading.Event()
+
+        def callback(pin):
+            edges.append(self.io.input(pin))
+            fired.set()
+
+        self.io.add_event_detect(hardware.ir_pin, self.io.RISING,
+                                 callback=callback)
+        self.io.set_input(hardware.ir_pin, 0)  # No change.
+        self.assertFalse(fired.wait(0.02))
+        self.io.set_input(hardware.ir_pin, 1)
+        self.assertTrue(fired.wait(1))
+        fired.clear()
+        self.io.set_input(hardware.ir_pin, 0)  # Falling edge.
+        self.assertFalse(fired.wait(0.02))
+        self.assertEqual([1], edges)
+
+
+class TestSimLCD(unittest.TestCase):
+    def test_message_and_cursor(self):
+        lcd = hardware.SimLCD(20, 4)
+        lcd.message("SCAN\n\nWORKORDER NUMBER")
+        lcd.set_cursor(10, 3)
+        lcd.message("X")
+        self.assertEqual(['SCAN'.ljust(20), ' ' * 20,
+                          'WORKORDER NUMBER'.ljust(20),
+                          ' ' * 10 + 'X' + ' ' * 9], lcd.screen())
+        lcd.clear()
+        self.assertEqual([' ' * 20] * 4, lcd.screen())
+
+
+class TestSimHardware(unittest.TestCase):
+    def test_scripted_scans(self):
+        hw = hardware.SimHardware(scans=['9934386', 'S1000001'],
+                                  scan_timeout=0)
+        self.assertEqual('9934386', hw.scan('Scan Workorder: '))
+        self.assertEqual('S1000001', hw.scan('Scan Serial: '))
+        self.assertRaises(EOFError, hw.scan, 'Scan Workorder: ')
+
+    def test_time_runs_faster(self):
+        hw = hardware.SimHardware(speed=1000)
+        start, sim_start = monotonic(), hw.clock()
+        hw.sleep(10)
+        self.assertFalse(hw.wait(threading.Event(), 10))
+        self.assertLess(monotonic() - start, 1)
+        self.assertGreaterEqual(hw.clock() - sim_start, 20)
+
+    def test_pallet(self):
+        hw = hardware.SimHardware(pallet=False)
+        self.assertEqual(1, hw.io.input(hardware.ir_pin))
+        hw.load_pallet()
+        self.assertEqual(0, hw.io.input(hardware.ir_pin))
+
+
+if __name__ == '__main__':
+    unittest.main()
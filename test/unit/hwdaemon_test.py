@@ -0,0 +1,223 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import hardware
+from loader_controller import hwdaemon
+from loader_controller import watchdog
+
+
+class TestStatusBlock(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'status')
+
+    def test_reader_sees_writes(self):
+        writer = hwdaemon.StatusBlock(self.path, create=True)
+        reader = hwdaemon.StatusBlock(self.path)
+        writer.write(ir=1, rst=0, relay=0, resets=2, removals=5)
+        status = reader.read()
+        self.assertEqual((1, 0, 0, 2, 5),
+                         (status.ir, status.rst, status.relay, status.resets,
+                          status.removals))
+        self.assertEqual(os.getpid(), status.pid)
+        self.assertEqual(0, status.seq % 2)
+        writer.close()
+        reader.close()
+
+    def test_reader_gives_up_on_daemon_that_died_mid_write(self):
+        writer = hwdaemon.StatusBlock(self.path, create=True)
+        reader = hwdaemon.StatusBlock(self.path)
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        writer.write(ir=0, rst=0, relay=1, resets=0, removals=0)
+        hwdaemon.SEQ.pack_into(writer.map, 0, writer.seq + 1)
+        start = monotonic()
+        with self.assertRaises(hwdaemon.StaleStatus):
+            reader.read(stale_after=0.05)
+        self.assertLess(monotonic() - start, 0.5)
+
+    def test_reader_reports_stale_status(self):
+        writer = hwdaemon.StatusBlock(self.path, create=True)
+        reader = hwdaemon.StatusBlock(self.path)
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        writer.write(ir=0, rst=0, relay=1, resets=0, removals=0)
+        self.assertEqual(1, reader.read(stale_after=0.05).relay)
+        sleep(0.1)  # No heartbeat.
+        with self.assertRaises(hwdaemon.StaleStatus):
+            reader.read(stale_after=0.05)
+
+
+class TestHardwareDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.sock = os.path.join(self.tmp, 'hw.sock')
+        self.status = os.path.join(self.tmp, 'hw.status')
+        self.hw = hardware.SimHardware()
+        self.daemon = hwdaemon.HardwareDaemon(self.hw, self.sock,
+                                              self.status).start()
+        self.remote = self.connect()
+
+    def tearDown(self):
+        self.remote.cleanup()
+        self.daemon.stop()
+
+    def connect(self):
+        return hwdaemon.RemoteHardware(self.sock, self.status)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = monotonic() + timeout
+        while not condition():
+            if monotonic() > deadline:
+                self.fail("timed out")
+            sleep(0.001)
+
+    def relay_on(self):
+        self.remote.io.output(hardware.ssr_pin, 1)
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.wait_for(lambda: self.remote.io.input(hardware.ssr_pin) == 1)
+
+    def test_relay_command(self):
+        self.relay_on()
+        self.remote.io.output(hardware.ssr_pin, 0)
+        self.wait_for(lambda: self.remote.io.input(hardware.ssr_pin) == 0)
+        self.assertEqual(0, self.hw.relay())
+
+    def test_relay_refused_without_pallet(self):
+        self.hw.io.levels[hardware.ir_pin] = 1
+        self.remote.io.output(hardware.ssr_pin, 1)
+        self.wait_for(lambda: self.remote.status.read().seq > 2)
+        sleep(0.05)
+        self.assertEqual(0, self.hw.relay())
+
+    def test_daemon_drops_relay_when_pallet_pulled(self):
+        edges = []
+        fired = threading.Event()
+
+        def callback(pin):
+            edges.append(self.remote.io.input(pin))
+            fired.set()
+
+        self.remote.io.add_event_detect(hardware.ir_pin,
+                                        self.remote.io.RISING,
+                                        callback=callback)
+        self.relay_on()
+        start = monotonic()
+        self.hw.remove_pallet()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertLess(monotonic() - start, 0.05)
+        self.assertTrue(fired.wait(1))
+        self.assertEqual([1], edges)
+        self.assertEqual(1, self.remote.status.read().removals)
+
+    def test_backup_read_catches_missed_edge(self):
+        self.relay_on()
+        self.hw.io.levels[hardware.ir_pin] = 1  # No edge callback.
+        self.wait_for(lambda: self.hw.relay() == 0, timeout=1)
+
+    def test_reset_button_drops_relay(self):
+        self.relay_on()
+        self.hw.press_reset()
+        self.wait_for(lambda: self.remote.status.read().resets == 1)
+        self.assertEqual(0, self.hw.relay())
+
+    def test_screen_is_drawn_by_daemon(self):
+        self.remote.screen.show("SCAN\n\nWORKORDER NUMBER", 'white')
+        self.wait_for(lambda: self.daemon.renderer.drawn == 1)
+        self.daemon.renderer.flush(1)
+        self.assertEqual('WORKORDER NUMBER    ', self.hw.lcd.screen()[2])
+        self.assertEqual((1.0, 1.0, 1.0), self.hw.lcd.color)
+
+    def test_renewed_lease_keeps_relay(self):
+        self.remote.lease = 0.1
+        self.relay_on()
+        for i in range(10):
+            sleep(0.05)
+            self.remote.renew()
+        self.assertEqual(1, self.hw.relay())
+
+    def test_watchdog_kicks_renew_lease(self):
+        self.remote.lease = 0.1
+        wd = watchdog.RelayWatchdog(0.1, renew=self.remote.renew)
+        self.relay_on()
+        wd.arm(lambda: None)  # Its thread is not started: a hung process.
+        for i in range(10):
+            sleep(0.05)
+            wd.kick()
+        self.assertEqual(1, self.hw.relay())
+        self.wait_for(lambda: self.hw.relay() == 0, timeout=0.5)
+
+    def test_hung_controller_loses_relay(self):
+        # Connected, but nothing renews the lease.
+        self.remote.lease = 0.1
+        self.relay_on()
+        start = monotonic()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertGreater(monotonic() - start, 0.05)
+        self.assertLess(monotonic() - start, 0.5)
+        self.assertEqual(1, self.daemon.lapses)
+
+    def test_new_controller_drops_relay(self):
+        self.relay_on()
+        other = self.connect()  # The old one has hung.
+        self.addCleanup(other.cleanup)
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertEqual(0, other.io.input(hardware.ssr_pin))
+
+    def test_controller_crash_drops_relay(self):
+        self.relay_on()
+        code = ("import os, sys\n"
+                "from loader_controller import hwdaemon\n"
+                "remote = hwdaemon.RemoteHardware(sys.argv[1], sys.argv[2])\n"
+                "remote.send({'relay': 1})\n"
+                "while remote.status.read().relay != 1:\n"
+                "    pass\n"
+                "os._exit(1)\n")
+        root = os.path.join(os.path.dirname(__file__), '..', '..')
+        subprocess.call([sys.executable, '-c', code, self.sock, self.status],
+                        cwd=root)
+        self.wait_for(lambda: self.hw.relay() == 0, timeout=1)
+        self.assertEqual(0, self.daemon.lapses)  # Dropped on disconnect.
+
+
+class TestServe(unittest.TestCase):
+    def test_sigterm_drops_relay(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        sock = os.path.join(tmp, 'hw.sock')
+        status = os.path.join(tmp, 'hw.status')
+        code = ("import sys\n"
+                "from loader_controller import hardware, hwdaemon\n"
+                "daemon = hwdaemon.HardwareDaemon(hardware.SimHardware(),\n"
+                "                                 sys.argv[1], sys.argv[2])\n"
+                "hwdaemon.serve(daemon.start())\n")
+        root = os.path.join(os.path.dirname(__file__), '..', '..')
+        proc = subprocess.Popen([sys.executable, '-c', code, sock, status],
+                                cwd=root)
+        deadline = monotonic() + 5
+        while not os.path.exists(sock):
+            self.assertLess(monotonic(), deadline)
+            sleep(0.01)
+        remote = hwdaemon.RemoteHardware(sock, status)
+        self.addCleanup(remote.cleanup)
+        remote.io.output(hardware.ssr_pin, 1)
+        while remote.status.read().relay != 1:
+            self.assertLess(monotonic(), deadline)
+            sleep(0.001)
+        proc.send_signal(signal.SIGTERM)
+        self.assertEqual(0, proc.wait(5))
+        self.assertEqual(0, remote.status.read().relay)
+        self.assertFalse(os.path.exists(sock))
+
+
+if __name__ == '__main__':
+    unittest.main()
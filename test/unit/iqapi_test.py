@@ -0,0 +1,221 @@
+import queue
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import iqapi
+from bench.mockapi import MockIQAPI
+
+
+class TestIQClient(unittest.TestCase):
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.client = iqapi.IQClient(self.api.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def test_get_json_returns_api_data(self):
+        data = self.client.get_json('/wo/9934386')
+        self.assertEqual('136', data['press'])
+        self.assertEqual('RM-PP-2001', data['rmat'])
+
+    def test_connection_is_reused(self):
+        for i in range(5):
+            self.client.get_json('/serial/1000001')
+        self.assertEqual(5, self.api.requests)
+        self.assertEqual(1, self.api.connections)
+
+    def test_idle_connection_is_replaced(self):
+        self.client.keepalive_idle = 0
+        self.client.get_json('/serial/1000001')
+        self.client.last_used -= 1
+        self.client.get_json('/serial/1000001')
+        self.assertEqual(2, self.api.connections)
+
+    def test_separate_connect_and_read_timeouts(self):
+        client = iqapi.IQClient(self.api.url, connect_timeout=1,
+                                read_timeout=7)
+        self.assertEqual((1, 7), client.timeout)
+
+    def test_lookup_async_returns_future(self):
+        pending = self.client.lookup_async('serial', '1000001')
+        self.assertEqual('RM-PP-2001', pending.result(timeout=5)['itemno'])
+
+    def test_conditional_get_skips_unchanged_body(self):
+        first = self.client.get_json('/press/136', conditional=True)
+        second = self.client.get_json('/press/136', conditional=True)
+        self.assertEqual(first, second)
+        self.assertEqual(1, self.api.not_modified)
+        stats = self.client.revalidation_stats()
+        self.assertEqual(1, stats['not_modified'])
+        self.assertGreater(stats['bytes_saved'], 100)
+
+    def test_changed_body_is_downloaded(self):
+        self.client.get_json('/press/136', conditional=True)
+        self.api.presses['136'] = dict(self.api.presses['136'], wo_id='1')
+        data = self.client.get_json('/press/136', conditional=True)
+        self.assertEqual('1', data['wo_id'])
+        self.assertEqual(0, self.api.not_modified)
+
+
+class TestValidate(unittest.TestCase):
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def start(self, validate):
+        self.api = MockIQAPI(validate=validate).start()
+        self.client = iqapi.IQClient(self.api.url)
+
+    def test_combined_validation_is_one_request(self):
+        self.start(validate=True)
+        result = self.client.validate('136', '9934386', '1000001')
+        self.assertTrue(result['valid'])
+        self.assertEqual(1, self.api.requests)
+
+    def test_falls_back_to_two_lookups(self):
+        self.start(validate=False)
+        result = self.client.validate('136', '9934386', '1000001')
+        self.assertTrue(result['valid'])
+        self.assertFalse(self.client.validate_supported)
+        self.client.validate('136', '9934386', '1000002')
+        self.assertEqual(1, self.api.paths.count('/validate/136/9934386/'
+                                                 '1000001'))
+
+    def test_both_paths_give_the_same_verdicts(self):
+        scans = [('136', '9934386', '1000001'), ('136', '9934386', '1000002'),
+                 ('136', '10284800', '1000002'), ('136', '1', '1000001'),
+                 ('136', '9934386', '999')]
+        self.start(validate=True)
+        combined = [self.client.validate(*scan) for scan in scans]
+        self.tearDown()
+        self.start(validate=False)
+        fallback = [self.client.validate(*scan) for scan in scans]
+        self.assertEqual(combined, fallback)
+        self.assertEqual([True, False, False, False, False],
+                         [r['valid'] for r in combined])
+        self.assertEqual([None, 'material', 'press', 'wo', 'serial'],
+                         [r['reason'] for r in combined])
+
+
+class TestVerdict(unittest.TestCase):
+    def test_error_false_is_not_an_error(self):
+        result = iqapi.verdict('136', {'error': False, 'press': '136',
+                                       'rmat': 'RM-PP-2001'},
+                               {'error': False, 'itemno': 'RM-PP-2001'})
+        self.assertTrue(result['valid'])
+
+
+class TestPressWatcher(unittest.TestCase):
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.client = iqapi.IQClient(self.api.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.api.stop()
+
+    def test_current_is_prefetched_state(self):
+        watcher = iqapi.PressWatcher(self.client, '136')
+        self.assertIsNone(watcher.current())
+        watcher.refresh()
+        self.assertEqual('9934386', watcher.current()['wo_id'])
+
+    def test_fetches_are_passed_on(self):
+        updates = []
+        watcher = iqapi.PressWatcher(self.client, '136',
+                                     on_update=updates.append)
+        watcher.refresh()
+        self.assertEqual(['9934386'], [data['wo_id'] for data in updates])
+
+    def test_stale_state_is_not_returned(self):
+        watcher = iqapi.PressWatcher(self.client, '136', max_age=5)
+        watcher.refresh()
+        watcher.fetched -= 5
+        self.assertIsNone(watcher.current())
+
+    def test_first_fetch_is_at_the_press_phase(self):
+        watcher = iqapi.PressWatcher(self.client, '136', interval=0.5)
+        first = watcher.schedule.first_delay()
+        self.assertEqual(watcher.schedule.phase * 0.5, first)
+        start = monotonic()
+        watcher.start()
+        for i in range(200):
+            if watcher.current():
+                break
+            watcher.stop_event.wait(0.005)
+        elapsed = monotonic() - start
+        watcher.stop()
+        self.assertEqual('RM-PP-2001', watcher.current()['itemno_mat'])
+        self.assertGreaterEqual(elapsed, first)
+
+    def test_phases_differ_between_presses(self):
+        phases = set(iqapi.PressWatcher(self.client, str(press)).schedule
+                     .first_delay() for press in range(100, 120))
+        self.assertEqual(20, len(phases))
+
+    def test_no_polls_while_events_stream_is_up(self):
+        subscriber = iqapi.PressSubscriber(self.client.base_url, '136',
+                                           lambda data: None)
+        subscriber.connected = True
+        watcher = iqapi.PressWatcher(self.client, '136', interval=0.01,
+                                     subscriber=subscriber).start()
+        watcher.update({'wo_id': '9934386', 'itemno_mat': 'RM-PP-2001'})
+        watcher.fetched -= 1  # Older than max_age, but pushed.
+        watcher.stop_event.wait(0.1)
+        watcher.stop()
+        self.assertEqual(0, self.api.requests)
+        self.assertEqual('9934386', watcher.current()['wo_id'])
+        subscriber.connected = False
+        self.assertIsNone(watcher.current())
+
+
+class TestPressSubscriber(unittest.TestCase):
+    def setUp(self):
+        self.updates = queue.Queue()
+        self.subscriber = None
+
+    def tearDown(self):
+        self.subscriber.stop()
+        self.api.stop()
+
+    def subscribe(self, missing_retry=600, **kwargs):
+        self.api = MockIQAPI(**kwargs).start()
+        self.subscriber = iqapi.PressSubscriber(
+            self.api.url, '136', self.updates.put, retry=0.05,
+            missing_retry=missing_retry).start()
+
+    def test_change_is_pushed_within_a_second(self):
+        self.subscribe(heartbeat=0.2)
+        self.assertEqual('9934386', self.updates.get(timeout=5)['wo_id'])
+        self.assertTrue(self.subscriber.connected)
+        changed_at = monotonic()
+        self.api.set_press('136', wo_id='9934390')
+        self.assertEqual('9934390', self.updates.get(timeout=1)['wo_id'])
+        self.assertLess(monotonic() - changed_at, 1)
+
+    def test_server_without_events(self):
+        self.subscribe(events=False)
+        deadline = monotonic() + 5
+        while self.subscriber.supported:
+            self.assertLess(monotonic(), deadline)
+            sleep(0.001)
+        self.assertFalse(self.subscriber.connected)
+        self.assertEqual(['/press/136/events'], self.api.paths)
+
+    def test_events_come_back_after_a_404(self):
+        # A redeploy answers 404 for a while; push is not off for good.
+        self.subscribe(events=False, missing_retry=0.2)
+        deadline = monotonic() + 5
+        while self.subscriber.supported:
+            self.assertLess(monotonic(), deadline)
+            sleep(0.001)
+        self.api.events = True
+        self.assertEqual('9934386', self.updates.get(timeout=5)['wo_id'])
+        self.assertTrue(self.subscriber.supported)
+        self.assertTrue(self.subscriber.connected)
+
+
+if __name__ == '__main__':
+    unittest.main()
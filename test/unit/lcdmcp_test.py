@@ -0,0 +1,70 @@
+import unittest
+
+from loader_controller import lcdmcp
+from loader_controller.display import FrameBufferLCD
+from bench.simlcd import SimSMBus, SimMCP23017LCD
+
+
+class TestMCPCharLCD(unittest.TestCase):
+    def setUp(self):
+        self.device = SimMCP23017LCD()
+        self.bus = SimSMBus(self.device)
+        self.lcd = lcdmcp.MCPCharLCD(bus=self.bus)
+
+    def test_message_reaches_the_screen(self):
+        self.lcd.message("SCAN\n\nWORKORDER NUMBER")
+        self.assertEqual(['SCAN'.ljust(20), ' ' * 20,
+                          'WORKORDER NUMBER'.ljust(20), ' ' * 20],
+                         self.device.screen())
+
+    def test_set_cursor_and_clear(self):
+        self.lcd.set_cursor(15, 3)
+        self.lcd.message("12345")
+        self.assertEqual(' ' * 15 + '12345', self.device.screen()[3])
+        self.lcd.clear()
+        self.assertEqual([' ' * 20] * 4, self.device.screen())
+
+    def test_eight_characters_per_transaction(self):
+        before = self.bus.transactions
+        self.lcd.message('X' * 20)
+        self.assertEqual(3, self.bus.transactions - before)
+
+    def test_backlight_is_active_low(self):
+        self.lcd.set_color(1.0, 0.0, 0.0)
+        self.assertEqual(1 << 7, self.device.port_a)
+        self.assertEqual(1, self.device.port_b)
+        self.lcd.message('A')  # Data writes keep the backlight bits.
+        self.assertEqual(1 << 7, self.device.port_a & 0xC0)
+
+    def test_block_writes_stay_on_port_a(self):
+        # Port B carries the blue backlight.
+        self.lcd.set_color(0.0, 0.0, 1.0)
+        writes = self.device.port_b_writes
+        self.lcd.message("SCAN\nRAW MATERIAL\nSERIAL NUMBER")
+        self.assertEqual(writes, self.device.port_b_writes)
+        self.assertEqual(0, self.device.port_b)
+
+    def test_reinit_of_a_banked_chip(self):
+        # A controller restart finds the chip already in BANK = 1.
+        self.lcd.message("OLD")
+        lcd = lcdmcp.MCPCharLCD(bus=self.bus)
+        lcd.message("NEW")
+        self.assertEqual('NEW'.ljust(20), self.device.screen()[0])
+
+    def test_unbanked_byte_mode_would_garble(self):
+        # With IOCON = SEQOP alone, block writes alternate OLATA / OLATB.
+        device = SimMCP23017LCD()
+        device.write(0x0A, SimMCP23017LCD.SEQOP)
+        device.write_block(0x14, self.lcd._port_states(ord('A'), True))
+        self.assertEqual(2, device.port_b_writes)
+
+    def test_works_under_the_framebuffer(self):
+        screen = FrameBufferLCD(self.lcd)
+        for msg in ["PRESS: 136\nWORKORDER: 9934386\n\nLOADER RUNNING",
+                    "NO PALLET DETECTED\n\nRESTARTING"]:
+            screen.show(msg, 'green')
+            self.assertEqual(screen.frame(msg), self.device.screen())
+
+
+if __name__ == '__main__':
+    unittest.main()
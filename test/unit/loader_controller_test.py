@@ -1,14 +1,274 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
-import loader_controller
+from time import monotonic, sleep
 
-class TestWoScan(object):
+from loader_controller import controller as loader_controller
+from loader_controller import eventlog
+from loader_controller import hardware
+from loader_controller import iqapi
+from loader_controller import snapshot
+from loader_controller import watchdog
+from bench.mockapi import MockIQAPI
+
+
+class TestImport(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        # A fresh interpreter: no hardware, requests, threads or files.
+        code = ("import sys, threading\n"
+                "import loader_controller.controller as c\n"
+                "print(c.hw, c.offline, threading.active_count(),\n"
+                "      'requests' in sys.modules, 'RPi' in sys.modules)\n")
+        root = os.path.join(os.path.dirname(__file__), '..', '..')
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual('None None 1 False False', out.decode().strip())
+
+
+class TestWoScan(unittest.TestCase):
     def setUp(self):
-        self.get_wo_scan = loader_controller.get_wo_scan()
+        loader_controller.use_hardware(
+            hardware.SimHardware(scans=['12345678'], scan_timeout=1))
 
     def test_get_wo_scan_returns_correct_value(self):
-        self.assertEqual(12345678, self.get_wo_scan(wo_id))
+        self.assertEqual('12345678', loader_controller.get_wo_scan())
+
+    def test_get_wo_scan_shows_prompt(self):
+        loader_controller.get_wo_scan()
+        loader_controller.renderer.flush(1)
+        self.assertEqual('WORKORDER NUMBER    ',
+                         loader_controller.hw.lcd.screen()[2])
+
+    def test_out_of_scans_is_eof(self):
+        loader_controller.get_wo_scan()
+        self.assertRaises(EOFError, loader_controller.get_wo_scan)
+
+
+class TestMainOnSimHardware(unittest.TestCase):
+    # The whole scan, validate, run, pallet removed cycle, 100x real time.
+
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.lc = loader_controller
+        self.lc.DEBUG = False
+        self.lc.api = iqapi.IQClient(self.api.url)
+        self.lc.offline = snapshot.Snapshot(':memory:')
+        self.error = None
+
+    def tearDown(self):
+        self.lc.api.close()
+        self.api.stop()
+
+    def start(self, scans, pallet=True, watchdog_timeout=None):
+        self.hw = hardware.SimHardware(scans=scans, speed=100, pallet=pallet,
+                                       scan_timeout=5)
+        self.lc.use_hardware(self.hw)
+        if watchdog_timeout:
+            self.lc.watchdog = watchdog.RelayWatchdog(
+                watchdog_timeout, clock=self.hw.clock,
+                wait=self.hw.wait).start()
+            self.addCleanup(self.lc.watchdog.stop)
+            self.addCleanup(setattr, self.lc, 'watchdog', None)
+        self.thread = threading.Thread(target=self._main)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _main(self):
+        try:
+            self.lc.main('136')
+        except BaseException as e:
+            self.error = e
+
+    def wait_for(self, condition, timeout=5):
+        deadline = monotonic() + timeout
+        while not condition():
+            if monotonic() > deadline:
+                self.fail("timed out")
+            sleep(0.001)
+
+    def screen(self):
+        self.lc.renderer.flush(1)
+        return '\n'.join(self.hw.lcd.screen())
+
+    def test_good_scans_run_the_loader_until_pallet_removed(self):
+        start = monotonic()
+        relay_ons = self.lc.stats.count('relay_on')
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.assertIn('LOADER RUNNING', self.screen())
+        self.assertEqual('green', self.lc.screen.color)
+
+        self.hw.remove_pallet()
+        self.thread.join(5)
+        self.assertEqual(0, self.hw.relay())
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertIn('NO PALLET DETECTED', self.screen())
+        self.assertEqual(relay_ons + 1, self.lc.stats.count('relay_on'))
+        # 2 s splash, 0.5 s relay settle and a 2 s error screen.
+        self.assertLess(monotonic() - start, 2)
+
+    def test_scan_events_are_logged(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'loader.log')
+        writer = eventlog.LogWriter(path).start()
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.hw.remove_pallet()
+        self.thread.join(5)
+        writer.stop()
+        with open(path) as f:
+            events = dict((r['event'], r) for r in map(json.loads, f))
+        self.assertEqual('9934386', events['wo_scanned']['wo'])
+        self.assertEqual('RM-PP-2001', events['serial_api']['rmat'])
+        self.assertIn('latency', events['wo_api'])
+        self.assertIn('relay_on', events)
+        self.assertIn('pallet_removed', events)
+        self.assertIn('restart', events)
+
+    def test_wrong_material_never_starts_the_loader(self):
+        self.start(['9934386', 'S1000002'])
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertIn('INCORRECT', self.screen())
+        self.assertIn('MATERIAL!', self.screen())
+        self.assertNotIn((hardware.ssr_pin, 1),
+                         [(pin, value) for t, pin, value in
+                          self.hw.io.history])
+
+    def test_error_screen_does_not_hold_up_restart(self):
+        # A 200 s error screen (2 s at 100x) stays up, but main() restarts
+        # straight away and is ready for the next scan.
+        self.addCleanup(setattr, self.lc, 'error_hold', self.lc.error_hold)
+        self.lc.error_hold = 200
+        self.start(['9934386', 'S1000002'])
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertLess(monotonic() - self.hw.started, 0.5)
+        self.assertIn('MATERIAL!', self.screen())
+        self.lc.lcd_ctrl("SCAN\n\nWORKORDER NUMBER", 'white')
+        self.assertIn('MATERIAL!', self.screen())  # The prompt waits...
+        self.hw.add_scan('9934386')
+        self.lc.get_wo_scan()  # ...but a scan ends the error early.
+        self.assertIn('WORKORDER NUMBER', self.screen())
+
+    def test_relay_settle_is_scheduled(self):
+        # 50 s settle, 0.5 s at 100x.  A pallet pulled meanwhile keeps the
+        # relay off.
+        self.addCleanup(setattr, self.lc, 'relay_settle',
+                        self.lc.relay_settle)
+        self.lc.relay_settle = 50
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: 'LOADER RUNNING' in self.screen())
+        self.hw.remove_pallet()
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertNotIn((hardware.ssr_pin, 1),
+                         [(pin, value) for t, pin, value in
+                          self.hw.io.history])
+
+    def test_backup_poll_catches_missed_edge(self):
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        start = monotonic()
+        self.hw.io.levels[hardware.ir_pin] = 1  # No edge callback.
+        self.thread.join(5)
+        self.assertEqual(0, self.hw.relay())
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        # sensor_poll is 10 s, 0.1 s at 100x, plus the 2 s error screen.
+        self.assertLess(monotonic() - start, 0.5)
+
+    def monitor_every_30s(self):
+        for name in ('wo_monitor_interval', 'wo_monitor_min',
+                     'wo_monitor_max'):
+            self.addCleanup(setattr, self.lc, name, getattr(self.lc, name))
+            setattr(self.lc, name, 30)
+
+    def test_hung_monitor_request_does_not_trip_watchdog(self):
+        # The request hangs for 100 s (1 s at 100x) on the API pool; this
+        # thread keeps kicking the 5 s watchdog and watching the pallet.
+        self.monitor_every_30s()
+        self.start(['9934386', 'S1000001'], watchdog_timeout=5)
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.api.latency = 1.0
+        self.wait_for(lambda: '/press/136' in self.api.paths)
+        sleep(0.2)  # 20 s, four watchdog timeouts.
+        self.assertEqual(1, self.hw.relay())
+        self.assertFalse(self.lc.watchdog.tripped)
+        start = monotonic()
+        self.hw.remove_pallet()
+        self.thread.join(5)
+        self.assertLess(monotonic() - start, 0.1)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertIn('NO PALLET DETECTED', self.screen())
+
+    def test_press_watcher_is_the_only_press_poller(self):
+        # With a press_watcher, run_mode() schedules no wo_monitor poll;
+        # the watcher's own fetch ends the run.
+        self.monitor_every_30s()
+        watcher = iqapi.PressWatcher(self.lc.api, '136',
+                                     on_update=self.lc.press_update)
+        self.addCleanup(setattr, self.lc, 'press_watcher', None)
+        self.lc.press_watcher = watcher
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        sleep(0.5)
+        self.assertNotIn('/press/136', self.api.paths)
+        self.api.set_press('136', wo_id='9934390')
+        watcher.refresh()
+        self.assertEqual(0, self.hw.relay())
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+
+    def test_watchdog_drops_relay_when_loop_stalls(self):
+        # The thread itself stalls for 50 s (0.5 s at 100x) handling the
+        # monitor's answer; the 5 s watchdog drops the relay.
+        self.monitor_every_30s()
+        wo_monitor = self.lc.wo_monitor
+        self.addCleanup(setattr, self.lc, 'wo_monitor', wo_monitor)
+
+        def stalled(*args):
+            sleep(0.5)
+            return wo_monitor(*args)
+
+        self.lc.wo_monitor = stalled
+        self.start(['9934386', 'S1000001'], watchdog_timeout=5)
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.wait_for(lambda: '/press/136' in self.api.paths)
+        start = monotonic()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertLess(monotonic() - start, 0.2)
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
+        self.assertIn('CONTROLLER STALLED', self.screen())
+
+    def test_relay_settle_after_a_trip(self):
+        # The previous run tripped the watchdog.  With a settle time longer
+        # than the heartbeat the next run still energizes.
+        self.addCleanup(setattr, self.lc, 'relay_settle',
+                        self.lc.relay_settle)
+        self.lc.relay_settle = 3
+        self.start(['9934386', 'S1000001'], pallet=False, watchdog_timeout=5)
+        self.lc.watchdog.arm(lambda: None)
+        self.wait_for(lambda: self.lc.watchdog.tripped)
+        self.lc.watchdog.disarm()  # As run_mode() does on the way out.
+        self.hw.load_pallet()
+        self.wait_for(lambda: self.hw.relay() == 1, timeout=10)
+        self.assertNotIn('CONTROLLER STALLED', self.screen())
+
+    def test_waits_for_pallet_before_asking_for_scan(self):
+        self.start(['9934386', 'S1000001'], pallet=False)
+        self.wait_for(lambda: 'NO PALLET' in self.screen())
+        self.hw.load_pallet()
+        self.wait_for(lambda: self.hw.relay() == 1, timeout=10)
+        self.hw.remove_pallet()
+        self.thread.join(5)
+        self.assertIsInstance(self.error, self.lc.SoftRestart)
 
 
 if __name__ == '__main__':
     unittest.main()
-
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.request
+
+from loader_controller import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = metrics.Metrics(buckets=(0.01, 0.1, 1.0),
+                                       labels={'press': '136'})
+
+    def test_buckets_are_cumulative(self):
+        for secs in (0.005, 0.01, 0.05, 0.5, 5):
+            self.metrics.observe('wo_api', secs)
+        text = self.metrics.render()
+        self.assertIn('loader_stage_seconds_bucket{le="0.01",press="136",'
+                      'stage="wo_api"} 2\n', text)
+        self.assertIn('loader_stage_seconds_bucket{le="0.1",press="136",'
+                      'stage="wo_api"} 3\n', text)
+        self.assertIn('loader_stage_seconds_bucket{le="+Inf",press="136",'
+                      'stage="wo_api"} 5\n', text)
+        self.assertIn('loader_stage_seconds_count{press="136",'
+                      'stage="wo_api"} 5\n', text)
+        self.assertEqual(5, self.metrics.count('wo_api'))
+
+    def test_timer_records_when_block_raises(self):
+        with self.assertRaises(KeyError):
+            with self.metrics.time('serial_api'):
+                raise KeyError()
+        self.assertEqual(1, self.metrics.count('serial_api'))
+
+    def test_counters(self):
+        self.metrics.inc('restarts')
+        self.metrics.inc('restarts')
+        self.assertIn('loader_restarts_total{press="136"} 2\n',
+                      self.metrics.render())
+
+    def test_textfile_is_replaced(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'loader.prom')
+        exporter = metrics.TextfileExporter(self.metrics, path)
+        self.metrics.observe('relay_on', 0.5)
+        exporter.write()
+        with open(path) as f:
+            self.assertEqual(self.metrics.render(), f.read())
+        self.assertEqual(['loader.prom'], os.listdir(tmp))
+
+    def test_unwritable_textfile_is_ignored(self):
+        metrics.TextfileExporter(self.metrics, '/nonexistent/x.prom').write()
+
+    def test_http_endpoint(self):
+        self.metrics.observe('wo_scan', 3)
+        server = metrics.serve(self.metrics, 0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/metrics' % server.server_address[1]
+        body = urllib.request.urlopen(url).read().decode('utf-8')
+        self.assertEqual(self.metrics.render(), body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from loader_controller.polling import PollSchedule
+
+
+class TestPollSchedule(unittest.TestCase):
+    def test_same_press_gets_same_timing(self):
+        a = PollSchedule('136')
+        b = PollSchedule('136')
+        self.assertEqual(a.first_delay(), b.first_delay())
+        self.assertEqual([a.next_delay() for i in range(5)],
+                         [b.next_delay() for i in range(5)])
+
+    def test_presses_start_at_different_phases(self):
+        delays = set(PollSchedule(str(p)).first_delay()
+                     for p in range(100, 150))
+        self.assertGreater(len(delays), 40)
+
+    def test_backs_off_while_stable(self):
+        poll = PollSchedule('136', interval=300, max_interval=900, jitter=0)
+        self.assertEqual([450, 675, 900, 900],
+                         [poll.next_delay() for i in range(4)])
+        self.assertEqual(300, poll.next_delay(changed=True))
+
+    def test_tightens_near_changeover(self):
+        poll = PollSchedule('136', min_interval=60, jitter=0,
+                            changeover_window=600)
+        self.assertEqual(450, poll.next_delay(changeover=2000, now=1000))
+        self.assertEqual(60, poll.next_delay(changeover=1500, now=1000))
+        self.assertEqual(60, poll.next_delay(changeover=1500, now=2000))
+        self.assertEqual(900, poll.next_delay(changeover=1500, now=3000))
+
+    def test_jitter_stays_in_bounds(self):
+        poll = PollSchedule('136', interval=300, max_interval=300,
+                            jitter=0.2)
+        for i in range(100):
+            self.assertTrue(240 <= poll.next_delay() <= 360)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import queue
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import hardware
+from loader_controller import metrics
+from loader_controller import scanner
+
+
+class TestBarcodeAssembler(unittest.TestCase):
+    def feed(self, data):
+        assembler = scanner.BarcodeAssembler()
+        scans = []
+        for sec, usec, type, code, value in scanner.EVENT.iter_unpack(data):
+            scan = assembler.feed(sec + usec / 1e6, type, code, value)
+            if scan:
+                scans.append(scan)
+        return scans
+
+    def test_shifted_characters(self):
+        device = scanner.SimScannerDevice()
+        self.addCleanup(device.close)
+        scans = self.feed(device.events('WO-1234/a.b'))
+        self.assertEqual(['WO-1234/a.b'], [scan.barcode for scan in scans])
+
+    def test_empty_enter_is_ignored(self):
+        device = scanner.SimScannerDevice()
+        self.addCleanup(device.close)
+        data = device.events('') + device.events('12345')
+        self.assertEqual(['12345'], [scan.barcode for scan in self.feed(data)])
+
+    def test_autorepeat_is_ignored(self):
+        assembler = scanner.BarcodeAssembler()
+        assembler.feed(1.0, scanner.EV_KEY, 2, 1)
+        assembler.feed(1.1, scanner.EV_KEY, 2, 2)  # Held down.
+        assembler.feed(1.2, scanner.EV_KEY, 2, 0)
+        scan = assembler.feed(1.3, scanner.EV_KEY, scanner.KEY_ENTER, 1)
+        self.assertEqual(('1', 1.0, 1.3), scan[:3])
+
+
+class TestEvdevScanner(unittest.TestCase):
+    def setUp(self):
+        self.device = scanner.SimScannerDevice()
+        self.reader = scanner.EvdevScanner(fd=self.device.fd).start()
+
+    def tearDown(self):
+        try:
+            self.device.close()
+        except OSError:
+            pass
+        self.reader.thread.join(1)
+        self.reader.close()
+
+    def test_scans_are_timestamped_and_queued(self):
+        before = monotonic()
+        self.device.type('12345678')
+        scan = self.reader.get(timeout=1)
+        self.assertEqual('12345678', scan.barcode)
+        self.assertLessEqual(before - 0.001, scan.started)
+        self.assertLessEqual(scan.started, scan.finished)
+        self.assertLessEqual(scan.finished, scan.queued + 0.001)
+        self.assertLess(scan.queued - before, 0.1)
+
+    def test_scan_is_a_drop_in_for_input(self):
+        self.device.type('8055')
+        self.assertEqual('8055', self.reader.scan("Scan: "))
+        with self.assertRaises(queue.Empty):
+            self.reader.get(timeout=0.01)
+
+    def test_eof_when_device_closes(self):
+        self.device.type('1')
+        self.device.close()
+        self.assertEqual('1', self.reader.scan())
+        with self.assertRaises(EOFError):
+            self.reader.scan()
+        with self.assertRaises(EOFError):
+            self.reader.scan()
+
+    def test_scan_timings_go_to_stats(self):
+        self.reader.stats = stats = metrics.Metrics()
+        self.device.type('8055')
+        self.assertEqual('8055', self.reader.scan())
+        self.assertEqual('8055', self.reader.last.barcode)
+        self.assertEqual(1, stats.count('scan_typing'))
+        self.assertEqual(1, stats.count('scan_queued'))
+
+    def test_close_wakes_blocked_reader(self):
+        sleep(0.01)  # Blocked waiting for a key.
+        self.reader.close()
+        self.assertFalse(self.reader.thread.is_alive())
+        with self.assertRaises(EOFError):
+            self.reader.scan()
+
+    def test_close_releases_grab_first(self):
+        calls = []
+        self.addCleanup(setattr, scanner, 'ioctl', scanner.ioctl)
+        scanner.ioctl = lambda fd, request, arg: calls.append(
+            (request, arg, self.reader.thread.is_alive()))
+        self.reader.grabbed = True
+        self.reader.close()
+        self.assertEqual([(scanner.EVIOCGRAB, 0, True)], calls)
+
+    def test_sim_hardware_reads_scanner(self):
+        hw = hardware.SimHardware(scanner=self.reader)
+        self.device.type('WO1')
+        self.assertEqual('WO1', hw.scan("Scan: "))
+
+    def test_burst_throughput(self):
+        # A scanner in continuous mode types about 1000 characters a second
+        # and can fire scans back to back.  Write 2000 scans of 8 characters
+        # as fast as the pipe takes them (partial records and all), and they
+        # must all arrive, in order, well ahead of the scanner.
+        barcodes = ['%08d' % i for i in range(2000)]
+        data = b''.join(self.device.events(barcode) for barcode in barcodes)
+
+        def write():
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self.device.write_fd, view[:1000]):]
+
+        start = monotonic()
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+        received = [self.reader.get(timeout=5).barcode for barcode in barcodes]
+        elapsed = monotonic() - start
+        writer.join(1)
+        self.assertEqual(barcodes, received)
+        # 2000 x 9 keys at 1000 keys/s is 18 s of scanning.
+        self.assertLess(elapsed, 2)
+        self.assertEqual(2000, self.reader.scans)
+
+    def test_burst_while_consumer_is_busy(self):
+        # Scans that arrive while the controller is busy wait in the queue.
+        for i in range(50):
+            self.device.type('%04d' % i)
+        deadline = monotonic() + 2
+        while self.reader.scans < 50 and monotonic() < deadline:
+            sleep(0.001)
+        self.assertEqual(['%04d' % i for i in range(50)],
+                         [self.reader.scan() for i in range(50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
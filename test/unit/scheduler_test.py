@@ -0,0 +1,93 @@
+import threading
+import unittest
+
+from loader_controller.scheduler import Scheduler
+
+
+class FakeTime(object):
+    # A clock that only moves when something waits or works.
+
+    def __init__(self):
+        self.now = 0.0
+        self.waits = []
+
+    def clock(self):
+        return self.now
+
+    def wait(self, event, secs):
+        self.waits.append(secs)
+        if event.is_set():
+            return True
+        self.now += secs
+        return False
+
+    def work(self, secs):
+        self.now += secs
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.time = FakeTime()
+        self.tasks = Scheduler(clock=self.time.clock, wait=self.time.wait)
+
+    def test_slow_task_does_not_drift(self):
+        starts = []
+
+        def slow():
+            starts.append(self.time.now)
+            self.time.work(0.3)
+
+        self.tasks.add('sensor', slow, 1.0)
+        for i in range(5):
+            self.tasks.step()
+        self.assertEqual([1.0, 2.0, 3.0, 4.0, 5.0], starts)
+
+    def test_sleeps_until_next_task(self):
+        self.tasks.add('sensor', lambda: None, 10)
+        self.tasks.add('wo_monitor', lambda: None, 25)
+        for i in range(4):
+            self.tasks.step()
+        # Due at 10, 20, 25, 30: one wake per task run, none in between.
+        self.assertEqual([10, 10, 5, 5], self.time.waits)
+
+    def test_adaptive_delay(self):
+        delays = iter([60, 90, 135])
+        task = self.tasks.add('wo_monitor', lambda: next(delays), 300,
+                              delay=42)
+        for i in range(3):
+            self.tasks.step()
+        self.assertEqual(42 + 60 + 90 + 135, task.deadline)
+
+    def test_overrun_skips_missed_periods(self):
+        task = self.tasks.add('sensor', lambda: self.time.work(2.5), 1.0)
+        self.tasks.step()
+        self.assertEqual(4.0, task.deadline)  # 2.0 and 3.0 were missed.
+        self.assertEqual(2, task.missed)
+
+    def test_wake_returns_early(self):
+        self.tasks.add('sensor', lambda: None, 10)
+        wake = threading.Event()
+        wake.set()
+        self.assertTrue(self.tasks.step(wake))
+        self.assertEqual(0, self.time.now)
+
+    def test_cancel(self):
+        ran = []
+        self.tasks.add('a', lambda: ran.append('a'), 1)
+        self.tasks.add('b', lambda: ran.append('b'), 2)
+        self.tasks.cancel('a')
+        self.tasks.step()
+        self.assertEqual(['b'], ran)
+        self.assertEqual(2.0, self.time.now)
+
+    def test_exception_propagates(self):
+        def fail():
+            raise KeyError()
+
+        self.tasks.add('sensor', fail, 1)
+        self.assertRaises(KeyError, self.tasks.step)
+        self.assertIsNone(self.tasks.next_deadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
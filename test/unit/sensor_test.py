@@ -0,0 +1,47 @@
+import unittest
+from time import monotonic
+
+from loader_controller import sensor
+from loader_controller.hardware import SimGPIO
+
+
+class TestPalletSensor(unittest.TestCase):
+    ir_pin = 23
+    ssr_pin = 24
+
+    def setUp(self):
+        self.io = SimGPIO()
+        self.io.output(self.ssr_pin, 1)
+        self.pallet = sensor.PalletSensor(
+            self.io, self.ir_pin,
+            on_removed=lambda: self.io.output(self.ssr_pin, 0))
+        self.pallet.start()
+
+    def tearDown(self):
+        self.pallet.stop()
+
+    def test_removal_drops_relay_within_milliseconds(self):
+        removed_at = monotonic()
+        self.io.set_input(self.ir_pin, 1)
+        self.assertTrue(self.pallet.wait(timeout=1))
+        self.assertEqual(0, self.io.outputs[self.ssr_pin])
+        latency = self.io.output_times[self.ssr_pin] - removed_at
+        print("\nremoval-to-relay-off: %.2f ms" % (latency * 1000))
+        self.assertLess(latency, 0.050)
+
+    def test_glitch_is_debounced(self):
+        self.io.set_input(self.ir_pin, 1)
+        self.io.levels[self.ir_pin] = 0  # Back low before the samples finish.
+        self.assertFalse(self.pallet.wait(timeout=0.05))
+        self.assertEqual(1, self.io.outputs[self.ssr_pin])
+
+    def test_pallet_missing_when_armed(self):
+        self.pallet.stop()
+        self.io.levels[self.ir_pin] = 1
+        self.pallet.start()
+        self.assertTrue(self.pallet.wait(timeout=0))
+        self.assertEqual(0, self.io.outputs[self.ssr_pin])
+
+
+if __name__ == '__main__':
+    unittest.main()
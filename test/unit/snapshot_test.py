@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from loader_controller import iqapi
+from loader_controller import snapshot
+from bench.mockapi import MockIQAPI
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.snap = snapshot.Snapshot(':memory:', clock=self.clock)
+
+    def tearDown(self):
+        self.snap.close()
+
+    def test_saved_workorder_is_returned(self):
+        self.snap.save_wo('9934386', '136', 'RM-PP-2001')
+        self.assertEqual(('136', 'RM-PP-2001'),
+                         self.snap.wo('9934386', max_age=60))
+        self.assertIsNone(self.snap.wo('1', max_age=60))
+
+    def test_stale_rows_are_ignored(self):
+        self.snap.save_serial('1000001', 'RM-PP-2001')
+        self.clock.now += 61
+        self.assertIsNone(self.snap.serial('1000001', max_age=60))
+        self.assertEqual('RM-PP-2001',
+                         self.snap.serial('1000001', max_age=120))
+
+    def test_prune_removes_old_rows(self):
+        self.snap.save_serial('1000001', 'RM-PP-2001')
+        self.clock.now += 100
+        self.snap.prune(50)
+        self.assertIsNone(self.snap.serial('1000001', max_age=1000))
+
+
+class TestSnapshotFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'snapshot.db')
+
+    def test_saves_survive_reopen(self):
+        snap = snapshot.Snapshot(self.path)
+        self.assertEqual('wal', snap.db.execute(
+            "PRAGMA journal_mode").fetchone()[0])
+        snap.save_serial('1000001', 'RM-PP-2001')
+        snap.close()
+        snap = snapshot.Snapshot(self.path)
+        self.assertEqual('RM-PP-2001', snap.serial('1000001', max_age=60))
+        snap.close()
+
+
+class TestSnapshotRefresher(unittest.TestCase):
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.client = iqapi.IQClient(self.api.url)
+        self.snap = snapshot.Snapshot(':memory:')
+
+    def tearDown(self):
+        self.snap.close()
+        self.client.close()
+        self.api.stop()
+
+    def test_refresh_saves_running_and_upcoming_workorders(self):
+        snapshot.SnapshotRefresher(self.snap, self.client, '136').refresh()
+        self.assertEqual(('136', 'RM-PP-2001'),
+                         self.snap.wo('9934386', max_age=60))
+        self.assertEqual(('136', 'RM-PC-4100'),
+                         self.snap.wo('9934411', max_age=60))
+
+    def test_running_workorder_comes_from_press_watcher(self):
+        watcher = iqapi.PressWatcher(self.client, '136')
+        watcher.refresh()
+        paths = len(self.api.paths)
+        snapshot.SnapshotRefresher(self.snap, self.client, '136',
+                                   press_watcher=watcher).refresh()
+        self.assertEqual(['/press/136/schedule'], self.api.paths[paths:])
+        self.assertEqual(('136', 'RM-PP-2001'),
+                         self.snap.wo('9934386', max_age=60))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import display
+from loader_controller import hardware
+from loader_controller import iqapi
+from loader_controller import snapshot
+from loader_controller import watchdog
+from loader_controller.station import Station
+from bench.mockapi import MockIQAPI
+
+
+class TestStation(unittest.TestCase):
+    # The asyncio core on SimHardware at 100x, against the mock API.  API
+    # latency is in real seconds, so a stalled request stays stalled.
+
+    def setUp(self):
+        self.api = MockIQAPI().start()
+        self.client = iqapi.IQClient(self.api.url)
+
+    def tearDown(self):
+        self.station.stop()
+        self.thread.join(5)
+        self.renderer.stop()
+        self.client.close()
+        self.api.stop()
+
+    def start(self, scans, scan_timeout=5, watchdog_timeout=None, **kwargs):
+        # scans are made once the first workorder prompt is up.
+        self.hw = hardware.SimHardware(scans=[], speed=100,
+                                       scan_timeout=scan_timeout)
+        if watchdog_timeout:
+            kwargs['watchdog'] = watchdog.RelayWatchdog(
+                watchdog_timeout, clock=self.hw.clock,
+                wait=self.hw.wait).start()
+            self.addCleanup(kwargs['watchdog'].stop)
+        self.renderer = display.LCDRenderer(
+            display.FrameBufferLCD(self.hw.lcd))
+        kwargs.setdefault('offline', snapshot.Snapshot(':memory:'))
+        self.station = Station(self.hw, self.client, '136',
+                               self.renderer, **kwargs)
+        self.thread = threading.Thread(target=self.station.run)
+        self.thread.daemon = True
+        self.thread.start()
+        if scans:
+            self.scan(1, *scans)
+
+    def scan(self, cycle, *barcodes):
+        # Scan once the cycle has shown its workorder prompt.
+        self.wait_for(lambda: self.station.cycles >= cycle)
+        for barcode in barcodes:
+            self.hw.add_scan(barcode)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = monotonic() + timeout
+        while not condition():
+            if monotonic() > deadline:
+                self.fail("timed out")
+            sleep(0.001)
+
+    def screen(self):
+        self.renderer.flush(1)
+        return '\n'.join(self.hw.lcd.screen())
+
+    def relay_went_on(self):
+        return (hardware.ssr_pin, 1) in [(pin, value) for t, pin, value in
+                                         self.hw.io.history]
+
+    def test_good_scans_run_the_loader_until_pallet_removed(self):
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.wait_for(lambda: 'LOADER RUNNING' in self.screen())
+        self.hw.remove_pallet()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.wait_for(lambda: 'NO PALLET DETECTED' in self.screen())
+        self.hw.load_pallet()
+        self.wait_for(lambda: 'WORKORDER NUMBER' in self.screen())
+
+    def test_combined_validation(self):
+        self.start(['9934386', 'S1000001'], combined=True)
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.assertIn('/validate/136/9934386/1000001', self.api.paths)
+
+    def test_wrong_material_never_starts_the_loader(self):
+        self.start(['9934386', 'S1000002'])
+        self.wait_for(lambda: 'MATERIAL!' in self.screen())
+        self.wait_for(lambda: 'WORKORDER NUMBER' in self.screen())
+        self.assertFalse(self.relay_went_on())
+
+    def test_next_scan_accepted_while_error_is_shown(self):
+        # The error screen is held for a day; the operator rescans while it
+        # is still up.  The relay can only come on if the scans cut it short.
+        self.start(['9934386', 'S1000002'], error_hold=24 * 3600)
+        self.wait_for(lambda: 'MATERIAL!' in self.screen())
+        self.scan(2, '9934386', 'S1000001')
+        self.wait_for(lambda: self.relay_went_on())
+        self.wait_for(lambda: 'LOADER RUNNING' in self.screen())
+
+    def test_error_screen_held_until_time_is_up(self):
+        self.start(['9934386', 'S1000002'], error_hold=50)  # 0.5 s.
+        self.wait_for(lambda: 'MATERIAL!' in self.screen())
+        shown = monotonic()
+        self.wait_for(lambda: 'WORKORDER NUMBER' in self.screen())
+        self.assertGreater(monotonic() - shown, 0.3)
+
+    def test_relay_settle(self):
+        # 50 s settle, 0.5 s at 100x.  A pallet pulled meanwhile keeps the
+        # relay off.
+        self.start(['9934386', 'S1000001'], relay_settle=50)
+        self.wait_for(lambda: 'GETTING' in self.screen() and
+                      self.station.scans.empty() and
+                      '/serial/1000001' in self.api.paths)
+        sleep(0.1)
+        self.hw.remove_pallet()
+        self.wait_for(lambda: 'NO PALLET' in self.screen())
+        sleep(0.5)
+        self.assertFalse(self.relay_went_on())
+
+    def test_sensor_reacts_while_monitor_request_is_stalled(self):
+        # wo_monitor every 30 s, 0.3 s at 100x; the request then hangs.
+        self.start(['9934386', 'S1000001'], wo_monitor=(30, 30, 30))
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.api.latency = 3.0
+        self.wait_for(lambda: '/press/136' in self.api.paths)
+        start = monotonic()
+        self.hw.remove_pallet()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertLess(monotonic() - start, 0.05)
+        self.wait_for(lambda: 'NO PALLET DETECTED' in self.screen())
+        self.assertLess(monotonic() - start, 0.2)
+        # 2 s error screen at 100x, not held up by the stalled request.
+        self.hw.load_pallet()
+        self.wait_for(lambda: 'WORKORDER NUMBER' in self.screen())
+        self.assertLess(monotonic() - start, 1)
+
+    def test_reset_button_while_lookup_is_stalled(self):
+        self.api.latency = 3.0
+        self.start(['9934386'])
+        self.wait_for(lambda: 'GETTING' in self.screen())
+        start = monotonic()
+        self.hw.press_reset()
+        self.wait_for(lambda: 'RESETTING' in self.screen())
+        self.wait_for(lambda: 'WORKORDER NUMBER' in self.screen())
+        self.assertLess(monotonic() - start, 0.5)
+        self.assertFalse(self.relay_went_on())
+
+    def test_backup_poll_catches_missed_edge(self):
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        start = monotonic()
+        self.hw.io.levels[hardware.ir_pin] = 1  # No edge callback.
+        self.wait_for(lambda: self.hw.relay() == 0)
+        # sensor_poll is 10 s, 0.1 s at 100x.
+        self.assertLess(monotonic() - start, 0.3)
+
+    def test_pushed_workorder_change_drops_relay(self):
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.station.running is not None)
+        self.station.push({'wo_id': '9934390', 'itemno_mat': 'RM-PP-2001'})
+        self.assertEqual(0, self.hw.relay())
+        self.wait_for(lambda: 'WORKORDER CHANGED' in self.screen())
+
+    def test_press_watcher_is_the_only_press_poller(self):
+        # wo_monitor would poll every 30 s, 0.3 s at 100x.  The watcher's
+        # own fetch is what drops the relay.
+        watcher = iqapi.PressWatcher(self.client, '136')
+        self.start(['9934386', 'S1000001'], wo_monitor=(30, 30, 30),
+                   press_watcher=watcher)
+        watcher.on_update = self.station.push
+        self.wait_for(lambda: self.hw.relay() == 1)
+        sleep(0.5)
+        self.assertNotIn('/press/136', self.api.paths)
+        self.api.set_press('136', wo_id='9934390')
+        watcher.refresh()
+        self.assertEqual(0, self.hw.relay())
+        self.wait_for(lambda: 'WORKORDER CHANGED' in self.screen())
+
+    def test_watchdog_drops_relay_when_loop_stalls(self):
+        # 5 s watchdog at 100x; the loop then blocks for 50 s (0.5 s real).
+        self.start(['9934386', 'S1000001'], watchdog_timeout=5)
+        self.wait_for(lambda: self.station.running is not None)
+        sleep(0.05)  # Not tripped while the heartbeat runs.
+        self.assertEqual(1, self.hw.relay())
+        self.station.loop.call_soon_threadsafe(sleep, 0.5)
+        start = monotonic()
+        self.wait_for(lambda: self.hw.relay() == 0)
+        self.assertLess(monotonic() - start, 0.1)
+        self.wait_for(lambda: 'CONTROLLER STALLED' in self.screen())
+
+    def test_network_failure_without_snapshot(self):
+        self.api.stop()
+        self.start(['9934386'], offline=None)
+        self.wait_for(lambda: 'NETWORK FAILURE' in self.screen())
+
+    def test_incomplete_answer_is_a_network_failure(self):
+        # /wo without rmat restarts the cycle; the station keeps running.
+        self.api.workorders['9934390'] = {'press': '136'}
+        self.start(['9934390', 'S1000001'], offline=None,
+                   network_fail_hold=1)
+        self.wait_for(lambda: 'NETWORK FAILURE' in self.screen())
+        self.scan(2, '9934386', 'S1000001')
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.assertTrue(self.thread.is_alive())
+
+    def test_incomplete_verdict_is_a_network_failure(self):
+        self.api.verdict = lambda press_id, wo_id, serial: {'rmat': None}
+        self.start(['9934386', 'S1000001'], combined=True, offline=None)
+        self.wait_for(lambda: 'NETWORK FAILURE' in self.screen())
+        self.assertTrue(self.thread.is_alive())
+        self.assertFalse(self.relay_went_on())
+
+    def test_scans_are_queued_while_busy(self):
+        # The serial is scanned while /wo is still in flight.
+        self.api.latency = 0.2
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.hw.relay() == 1)
+        self.assertTrue(self.hw.scans.empty())
+
+    def test_stray_scan_is_not_taken_as_the_workorder(self):
+        self.start(['9934386', 'S1000001'])
+        self.wait_for(lambda: self.station.running is not None)
+        self.hw.add_scan('9934390')  # Mid-run, nothing asked for it.
+        self.wait_for(lambda: self.hw.scans.empty())
+        sleep(0.01)
+        self.hw.remove_pallet()
+        self.wait_for(lambda: 'NO PALLET DETECTED' in self.screen())
+        self.hw.load_pallet()
+        self.scan(2, '9934386', 'S1000001')
+        self.wait_for(lambda: self.station.running is not None)
+        self.assertEqual(1, self.station.stats.counters['scans_dropped'])
+        self.assertNotIn('/wo/9934390', self.api.paths)
+
+    def test_restart_storm_stops_the_station(self):
+        self.start(['1'], restart_limit=3)
+        self.scan(2, '2')
+        self.scan(3, '3')
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertTrue(self.station.stuck)
+        self.assertEqual(['/wo/1', '/wo/2', '/wo/3'], self.api.paths)
+
+    def test_runs_until_scanner_closes(self):
+        self.start([], scan_timeout=0.01)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
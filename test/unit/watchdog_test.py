@@ -0,0 +1,94 @@
+import threading
+import unittest
+from time import monotonic, sleep
+
+from loader_controller import hardware
+from loader_controller import watchdog
+
+
+class TestRelayWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.dropped = threading.Event()
+        self.dropped_at = None
+
+    def drop(self):
+        self.dropped_at = monotonic()
+        self.dropped.set()
+
+    def test_trips_within_timeout_of_last_kick(self):
+        wd = watchdog.RelayWatchdog(0.1).start()
+        self.addCleanup(wd.stop)
+        wd.arm(self.drop)
+        start = monotonic()
+        self.assertTrue(self.dropped.wait(1))
+        latency = self.dropped_at - start
+        self.assertGreaterEqual(latency, 0.1)
+        self.assertLess(latency, 0.1 + 0.01 + 0.05)
+        self.assertTrue(wd.tripped)
+        self.assertEqual(1, wd.trips)
+
+    def test_kicks_keep_it_quiet(self):
+        wd = watchdog.RelayWatchdog(0.1).start()
+        self.addCleanup(wd.stop)
+        wd.arm(self.drop)
+        for i in range(20):
+            wd.kick()
+            sleep(0.02)
+        self.assertFalse(self.dropped.is_set())
+        wd.disarm()
+        self.assertFalse(self.dropped.wait(0.2))
+        self.assertFalse(wd.tripped)
+
+    def test_disarm_forgets_trip(self):
+        wd = watchdog.RelayWatchdog(0.1).start()
+        self.addCleanup(wd.stop)
+        wd.arm(self.drop)
+        self.assertTrue(self.dropped.wait(1))
+        self.assertTrue(wd.tripped)
+        wd.disarm()
+        self.assertFalse(wd.tripped)
+        self.assertEqual(1, wd.trips)
+
+    def test_trips_once(self):
+        wd = watchdog.RelayWatchdog(0.05).start()
+        self.addCleanup(wd.stop)
+        calls = []
+        wd.arm(lambda: calls.append(1))
+        sleep(0.2)
+        self.assertEqual([1], calls)
+
+    def test_sim_clock(self):
+        # 5 s at 100x is 50 ms.
+        hw = hardware.SimHardware(speed=100)
+        wd = watchdog.RelayWatchdog(5, clock=hw.clock, wait=hw.wait).start()
+        self.addCleanup(wd.stop)
+        start = monotonic()
+        wd.arm(self.drop)
+        self.assertTrue(self.dropped.wait(1))
+        self.assertLess(self.dropped_at - start, 0.1)
+
+
+class TestWatchdogDevice(unittest.TestCase):
+    def test_petted_while_thread_runs(self):
+        device = watchdog.SimWatchdogDevice(timeout=0.1)
+        wd = watchdog.RelayWatchdog(0.1, device=device).start()
+        sleep(0.3)
+        self.assertFalse(device.expired())
+        self.assertGreater(device.pets, 10)
+        wd.stop()
+        self.assertTrue(device.closed)  # Clean exit: no board reset.
+
+    def test_expires_if_thread_hangs(self):
+        device = watchdog.SimWatchdogDevice(timeout=0.1)
+        wd = watchdog.RelayWatchdog(0.1, device=device)
+        hang = threading.Event()
+        wd.check = lambda: hang.wait()  # Stuck inside the watchdog thread.
+        wd.start()
+        sleep(0.2)
+        self.assertTrue(device.expired())
+        hang.set()
+        wd.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()